@@ -0,0 +1,29 @@
+"""
+The python toolbox. The submodules are only imported when they are first accessed,
+so ``import pytb`` is cheap and e.g. the Jupyter dependencies of :mod:`pytb.importlib`
+are only loaded when notebooks are imported.
+"""
+
+import importlib as _importlib
+from typing import Any, List
+
+_submodules = [
+    "config",
+    "core",
+    "importlib",
+    "io",
+    "itertools",
+    "notification",
+    "rdb",
+    "schedule",
+]
+
+
+def __getattr__(name: str) -> Any:
+    if name in _submodules:
+        return _importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__() -> List[str]:
+    return sorted(list(globals()) + _submodules)
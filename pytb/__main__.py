@@ -3,22 +3,18 @@ Entrypoint for the pytb CLI (the ```pytb``` command)
 """
 
 import argparse
+import os
+import re
 import sys
-import traceback
 import logging
-import runpy
-import subprocess
-from datetime import datetime
-from typing import IO, Any
-from types import FrameType
-from contextlib import ExitStack
+from typing import IO, Any, Dict, List
 from pathlib import Path
-from pdb import Restart as PdbRestart
 
-from pytb.config import current_config
-from pytb.rdb import RdbClient, Rdb
-from pytb.notification import NotifyViaStream, NotifyViaEmail, Notify
-from pytb.schedule import at
+from pytb.config import get_config
+
+# the subsystems are imported by the subcommands that use them,
+# so e.g. ``pytb rdb client`` does not pay for importing the notification module
+# pylint: disable=import-outside-toplevel
 
 
 def to_stream(stream_name: str) -> IO[Any]:
@@ -45,6 +41,22 @@ def to_stream(stream_name: str) -> IO[Any]:
         raise argparse.ArgumentTypeError(f"could not open {stream_name} for writing")
 
 
+def parse_headers(
+    parser: argparse.ArgumentParser, headers: List[str]
+) -> Dict[str, str]:
+    """
+    Turn a list of HTTP headers in the form ```Name: value``` into a dictionary.
+    Exits with a usage error of ``parser`` if a header is malformed
+    """
+    parsed_headers = {}
+    for header in headers:
+        name, separator, value = header.partition(":")
+        if not separator:
+            parser.error(f"invalid header '{header}'\n")
+        parsed_headers[name.strip()] = value.strip()
+    return parsed_headers
+
+
 def main() -> None:
     """
     Main entry point for the CLI. Handles all the argument parsing and
@@ -100,7 +112,16 @@ def main() -> None:
         help="Send a notification whenever the script finishes",
     )
     notify_subcommands = notify_parser.add_subparsers(help="notifier", dest="notifier")
-    notify_config = current_config["notify"]
+    notify_config = get_config()["notify"]
+    notify_parser.add_argument(
+        "--capture-mode",
+        # Notify.capture_modes, without importing the notification module
+        choices=("streams", "thread", "fds"),
+        default=notify_config["capture_mode"],
+        help="Capture sys.stdout and sys.stderr (streams), only their output of the "
+        "main thread (thread) or the file descriptors 1 and 2 to include the output "
+        "of C extensions and child processes (fds)",
+    )
 
     notify_via_email = notify_subcommands.add_parser("via-email")
     notify_via_email.add_argument(
@@ -131,6 +152,11 @@ def main() -> None:
         help="Use a SSL connection to communicate with the SMTP server",
         default=notify_config.getboolean("smtp_ssl"),
     )
+    notify_via_email.add_argument(
+        "--outbox",
+        help="Store messages in this database until they are sent and retry failed deliveries",
+        default=notify_config["email_outbox"],
+    )
     notify_via_email.add_argument(
         "-m",
         action="store_true",
@@ -169,9 +195,234 @@ def main() -> None:
         metavar="args",
     )
 
+    notify_via_webhook = notify_subcommands.add_parser("via-webhook")
+    notify_via_webhook.add_argument(
+        "--url",
+        help="The http(s) url notifications are posted to",
+        default=notify_config["webhook_url"],
+    )
+    notify_via_webhook.add_argument(
+        "--header",
+        action="append",
+        help="Additional HTTP header sent with each request in the form `Name: value`",
+        default=[],
+        dest="headers",
+        metavar="HEADER",
+    )
+    notify_via_webhook.add_argument(
+        "-m",
+        action="store_true",
+        help="Load an executable module or package instead of a file",
+        default=False,
+        dest="run_as_module",
+    )
+    notify_via_webhook.add_argument("script", help="script path or module name to run")
+    notify_via_webhook.add_argument(
+        "args",
+        help="additional parameter passed to the script",
+        nargs=argparse.REMAINDER,
+        metavar="args",
+    )
+
+    notify_via_daemon = notify_subcommands.add_parser("via-daemon")
+    notify_via_daemon.add_argument(
+        "--socket",
+        help="The UNIX socket of the notification daemon",
+        default=None,
+        dest="socket_path",
+    )
+    notify_via_daemon.add_argument(
+        "-m",
+        action="store_true",
+        help="Load an executable module or package instead of a file",
+        default=False,
+        dest="run_as_module",
+    )
+    notify_via_daemon.add_argument("script", help="script path or module name to run")
+    notify_via_daemon.add_argument(
+        "args",
+        help="additional parameter passed to the script",
+        nargs=argparse.REMAINDER,
+        metavar="args",
+    )
+
+    notify_via_multiple = notify_subcommands.add_parser("via-multiple")
+    notify_via_multiple.add_argument(
+        "--recipients",
+        nargs="+",
+        help="Send notifications via E-Mail to these recipient addresses",
+        default=[],
+    )
+    notify_via_multiple.add_argument(
+        "--smtp-host",
+        help="Address of the external SMTP Server used to send notifications via E-Mail",
+        default=notify_config["smtp_host"],
+    )
+    notify_via_multiple.add_argument(
+        "--smtp-port",
+        type=int,
+        help="Port the external SMTP Server listens for incoming connections",
+        default=notify_config["smtp_port"],
+    )
+    notify_via_multiple.add_argument(
+        "--sender",
+        help="Sender Address for notifications",
+        default=notify_config["sender"],
+    )
+    notify_via_multiple.add_argument(
+        "--use-ssl",
+        action="store_true",
+        help="Use a SSL connection to communicate with the SMTP server",
+        default=notify_config.getboolean("smtp_ssl"),
+    )
+    notify_via_multiple.add_argument(
+        "--stream",
+        action="append",
+        help="Write notifications to this stream. This can be a filepath or the special \
+            values `<stdout>` or `<stderr>`. Can be passed multiple times",
+        type=to_stream,
+        default=[],
+        dest="streams",
+    )
+    notify_via_multiple.add_argument(
+        "--url",
+        help="Post notifications to this http(s) url",
+        default=None,
+    )
+    notify_via_multiple.add_argument(
+        "--header",
+        action="append",
+        help="Additional HTTP header sent with each request in the form `Name: value`",
+        default=[],
+        dest="headers",
+        metavar="HEADER",
+    )
+    notify_via_multiple.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Send notifications to the notification daemon",
+        default=False,
+    )
+    notify_via_multiple.add_argument(
+        "--socket",
+        help="The UNIX socket of the notification daemon",
+        default=None,
+        dest="socket_path",
+    )
+    notify_via_multiple.add_argument(
+        "--timeout",
+        type=float,
+        help="Maximum number of seconds to wait for each notifier",
+        default=float(notify_config["multiple_timeout"]),
+    )
+    notify_via_multiple.add_argument(
+        "-m",
+        action="store_true",
+        help="Load an executable module or package instead of a file",
+        default=False,
+        dest="run_as_module",
+    )
+    notify_via_multiple.add_argument("script", help="script path or module name to run")
+    notify_via_multiple.add_argument(
+        "args",
+        help="additional parameter passed to the script",
+        nargs=argparse.REMAINDER,
+        metavar="args",
+    )
+
+    daemon_parser = subcommands.add_parser(
+        "notify-daemon",
+        help="Collect the notifications of all processes and deliver them via E-Mail.",
+    )
+    daemon_parser.add_argument(
+        "--socket",
+        help="The UNIX socket to listen on for notifications",
+        default=None,
+        dest="socket_path",
+    )
+    daemon_parser.add_argument(
+        "--digest-window",
+        help="Collect notifications for X seconds into a single E-Mail",
+        metavar="X",
+        type=float,
+        default=float(notify_config["daemon_digest_window"]),
+    )
+    daemon_parser.add_argument(
+        "--dedupe-window",
+        help="Drop notifications that were already received within X seconds",
+        metavar="X",
+        type=float,
+        default=float(notify_config["daemon_dedupe_window"]),
+    )
+    daemon_parser.add_argument(
+        "--recipients",
+        nargs="+",
+        help="Recipient addresses for the notifications",
+        default=notify_config.getlist("email_addresses"),
+    )
+    daemon_parser.add_argument(
+        "--smtp-host",
+        help="Address of the external SMTP Server used to send notifications via E-Mail",
+        default=notify_config["smtp_host"],
+    )
+    daemon_parser.add_argument(
+        "--smtp-port",
+        type=int,
+        help="Port the external SMTP Server listens for incoming connections",
+        default=notify_config["smtp_port"],
+    )
+    daemon_parser.add_argument(
+        "--sender",
+        help="Sender Address for notifications",
+        default=notify_config["sender"],
+    )
+    daemon_parser.add_argument(
+        "--use-ssl",
+        action="store_true",
+        help="Use a SSL connection to communicate with the SMTP server",
+        default=notify_config.getboolean("smtp_ssl"),
+    )
+
+    replay_parser = subcommands.add_parser(
+        "replay", help="Replay the output recorded in a capture log."
+    )
+    replay_parser.add_argument("log", help="path of the capture log")
+    replay_parser.add_argument(
+        "--start",
+        help="Skip the output written in the first X seconds of the log",
+        metavar="X",
+        type=float,
+    )
+    replay_parser.add_argument(
+        "--end",
+        help="Skip the output written after the first X seconds of the log",
+        metavar="X",
+        type=float,
+    )
+    replay_parser.add_argument(
+        "--stream",
+        action="append",
+        choices=["stdout", "stderr"],
+        help="Only replay the output of this stream. Can be passed multiple times",
+        dest="streams",
+    )
+    replay_format = replay_parser.add_mutually_exclusive_group()
+    replay_format.add_argument(
+        "--timestamps",
+        action="store_true",
+        default=False,
+        help="Prefix each line with the seconds since the start of the log and its stream",
+    )
+    replay_format.add_argument(
+        "--render",
+        action="store_true",
+        default=False,
+        help="Render carriage returns and escape sequences like a terminal would",
+    )
+
     rdb_parser = subcommands.add_parser("rdb", help="Remote debugging over TCP")
     rdb_subcommands = rdb_parser.add_subparsers(help="function", dest="function")
-    rdb_config = current_config["rdb"]
+    rdb_config = get_config()["rdb"]
 
     rdb_server = rdb_subcommands.add_parser("server")
     rdb_server.add_argument(
@@ -228,6 +479,10 @@ def main() -> None:
         parser.error("You need to specify a subcommand")
 
     elif args.command == "rdb":
+        import traceback
+        from pdb import Restart as PdbRestart
+        from pytb.rdb import RdbClient, Rdb
+
         if not args.function:
             rdb_parser.error("You need to specify the function")
 
@@ -297,6 +552,10 @@ def main() -> None:
             rdb.do_quit(None)
 
     elif args.command == "schedule":
+        import subprocess
+        from datetime import datetime
+        from pytb.schedule import at
+
         if args.at is None:
             schedule_parser.error("You need to specify the scheduler {--at}\n")
 
@@ -324,7 +583,86 @@ def main() -> None:
                     print(f"next run on {next_schedule} (-{wait_time})", end="\r")
             run_task.is_running.wait(1)
 
+    elif args.command == "replay":
+        from pytb.io import read_capture_log, render_text
+
+        stream_ids = {"stdout": 1, "stderr": 2}
+        streams = (
+            [stream_ids[stream] for stream in args.streams] if args.streams else None
+        )
+        try:
+            records = read_capture_log(args.log, args.start, args.end, streams)
+            if args.render:
+                sys.stdout.write(render_text("".join(record.text for record in records)))
+            elif args.timestamps:
+                stream_names = {1: "stdout", 2: "stderr"}
+                line_start = True
+                for record in records:
+                    prefix = (
+                        f"[{record.offset:10.3f} "
+                        f"{stream_names.get(record.stream, record.stream):>6}] "
+                    )
+                    for line in re.findall(r"[^\n]*\n|[^\n]+", record.text):
+                        sys.stdout.write(prefix + line if line_start else line)
+                        line_start = line.endswith("\n")
+            else:
+                for record in records:
+                    sys.stdout.write(record.text)
+            sys.stdout.flush()
+        except BrokenPipeError:
+            # the output is piped into a program that exited early, e.g. head.
+            # Point stdout to devnull so python does not fail to flush it on exit
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+            os.close(devnull)
+        except (OSError, ValueError) as err:
+            replay_parser.error(str(err))
+
+    elif args.command == "notify-daemon":
+        from pytb.notification import NotifyViaEmail, NotificationDaemon
+
+        if not args.recipients:
+            daemon_parser.error(
+                "Make sure to include at least one recipient via the .pytb.conf \
+                    or via the --recipients option\n"
+            )
+
+        daemon = NotificationDaemon(
+            NotifyViaEmail(
+                task="pytb notify-daemon",
+                email_addresses=args.recipients,
+                sender=args.sender,
+                smtp_host=args.smtp_host,
+                smtp_port=args.smtp_port,
+                smtp_ssl=args.use_ssl,
+                persistent_connection=True,
+                digest_window=args.digest_window or None,
+                # keep receiving notifications while an E-Mail is sent
+                asynchronous=True,
+            ),
+            socket_path=args.socket_path,
+            dedupe_window=args.dedupe_window,
+        )
+        try:
+            daemon.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            daemon.close()
+
     elif args.command == "notify":
+        import runpy
+        from types import FrameType
+        from contextlib import ExitStack
+        from pytb.notification import (
+            NotifyViaStream,
+            NotifyViaEmail,
+            NotifyViaWebhook,
+            NotifyViaDaemon,
+            NotifyViaMultiple,
+            Notify,
+        )
+
         if not args.when_done and args.every is None and args.when_stalled is None:
             notify_parser.error(
                 "You need to specify at least one of the notification options \
@@ -332,9 +670,8 @@ def main() -> None:
             )
 
         if not args.notifier:
-            notify_parser.error(
-                "You need to specify the notification system to use (EMail or Stream)"
-            )
+            notify_parser.error("You need to specify the notification system to use \
+                    (EMail, Stream, Webhook, Daemon or Multiple)")
 
         elif args.notifier == "via-stream":
             notifier: Notify = NotifyViaStream(task=args.script, stream=args.stream)
@@ -353,8 +690,66 @@ def main() -> None:
                 smtp_host=args.smtp_host,
                 smtp_port=args.smtp_port,
                 smtp_ssl=args.use_ssl,
+                outbox=args.outbox,
+            )
+
+        elif args.notifier == "via-webhook":
+            if not args.url:
+                notify_via_webhook.error(
+                    "Make sure to include the url via the .pytb.conf \
+                        or via the --url option\n"
+                )
+
+            notifier = NotifyViaWebhook(
+                task=args.script,
+                url=args.url,
+                headers=parse_headers(notify_via_webhook, args.headers),
             )
 
+        elif args.notifier == "via-daemon":
+            notifier = NotifyViaDaemon(task=args.script, socket_path=args.socket_path)
+
+        elif args.notifier == "via-multiple":
+            backends: List[Notify] = [
+                NotifyViaStream(task=args.script, stream=stream)
+                for stream in args.streams
+            ]
+            if args.recipients:
+                backends.append(
+                    NotifyViaEmail(
+                        task=args.script,
+                        email_addresses=args.recipients,
+                        sender=args.sender,
+                        smtp_host=args.smtp_host,
+                        smtp_port=args.smtp_port,
+                        smtp_ssl=args.use_ssl,
+                    )
+                )
+            if args.url:
+                backends.append(
+                    NotifyViaWebhook(
+                        task=args.script,
+                        url=args.url,
+                        headers=parse_headers(notify_via_multiple, args.headers),
+                    )
+                )
+            if args.daemon or args.socket_path:
+                backends.append(
+                    NotifyViaDaemon(task=args.script, socket_path=args.socket_path)
+                )
+
+            if not backends:
+                notify_via_multiple.error(
+                    "Specify at least one notifier via the --recipients, --stream, \
+                        --url or --daemon options\n"
+                )
+
+            notifier = NotifyViaMultiple(
+                task=args.script, notifiers=backends, timeout=args.timeout
+            )
+
+        notifier.capture_mode = args.capture_mode
+
         # assemble the execution environemnt for the script to run
         script_globals = {"__name__": "__main__"}
         if args.run_as_module:
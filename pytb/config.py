@@ -3,6 +3,7 @@ This module handles the .pytb.conf files
 """
 
 import sys
+import threading
 import configparser
 import logging
 from typing import Mapping, Any, Sequence, List, Optional
@@ -30,13 +31,57 @@ class Config(configparser.ConfigParser):
             "host": "127.0.0.1",
             "patch_stdio": True,
         },
-        "module_cache": {"non_reloadable_packages": []},
+        "module_cache": {
+            "non_reloadable_packages": [],
+            "notebook_bytecode_cache": True,
+        },
         "notify": {
             "email_addresses": [],
             "smtp_host": "127.0.0.1",
             "smtp_port": 25,
             "smtp_ssl": False,
+            "smtp_persistent": True,
+            "smtp_keepalive": 30,
+            "smtp_max_idle": 300,
+            "smtp_timeout": 60,
             "sender": "",
+            "email_bcc": False,
+            "email_attach_output": False,
+            "email_attachment_threshold": 65536,
+            "email_attachment_max_size": 10485760,
+            "email_inline_head_size": 2048,
+            "email_inline_tail_size": 8192,
+            "email_outbox": "",
+            "outbox_backoff": 30,
+            "outbox_max_backoff": 3600,
+            "outbox_max_attempts": 10,
+            "outbox_exit_timeout": 5,
+            "webhook_url": "",
+            "webhook_batch_size": 20,
+            "webhook_batch_interval": 1,
+            "webhook_max_retries": 5,
+            "webhook_backoff": 1,
+            "webhook_timeout": 10,
+            "webhook_queue_size": 1000,
+            "daemon_socket": "",
+            "daemon_dedupe_window": 300,
+            "daemon_digest_window": 60,
+            "daemon_max_output": 32768,
+            "daemon_send_timeout": 0.1,
+            "multiple_timeout": 30,
+            "telemetry": False,
+            "telemetry_interval": 10,
+            "telemetry_samples": 360,
+            "asynchronous": False,
+            "dispatch_queue_size": 100,
+            "dispatch_overflow": "block",
+            "dispatch_flush_timeout": 10,
+            "capture_head_size": 65536,
+            "capture_tail_size": 262144,
+            "capture_spill": True,
+            "capture_mode": "streams",
+            "mirror_buffer_size": 0,
+            "mirror_overflow": "block",
         },
     }
     """
@@ -135,7 +180,31 @@ class Config(configparser.ConfigParser):
         return [entry for entry in value.split("\n") if entry]
 
 
-current_config = Config()  # pylint: disable=invalid-name
+_config_lock = threading.Lock()
+# pylint: disable=invalid-name
+_current_config: Optional[Config] = None
+
+current_config: Config
 """
-An instance of config that is automatically initialized when importing the module
+The effective configuration, an alias of :func:`get_config`.
+It is loaded when it is first accessed
 """
+
+
+def get_config() -> Config:
+    """
+    Get the effective configuration, an instance of :class:`Config` that is
+    automatically initialized when it is first requested. Importing the module
+    does not look for config files
+    """
+    global _current_config  # pylint: disable=global-statement
+    with _config_lock:
+        if _current_config is None:
+            _current_config = Config()
+        return _current_config
+
+
+def __getattr__(name: str) -> Any:
+    if name == "current_config":
+        return get_config()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -7,9 +7,7 @@ import sys
 import inspect
 import logging
 from typing import Optional
-from pytb.config import current_config
-from pytb.importlib import NoModuleCacheContext, NotebookLoader
-from pytb.rdb import install_hook as install_rdb
+from pytb.config import get_config
 
 # pylint: disable=invalid-name
 _initializer_frame = None
@@ -47,25 +45,35 @@ def init(
         else:
             raise RuntimeError(reinitialization_message)
 
-    config = current_config["init"]
-
-    if config.getboolean("disable_module_cache"):
-        _logger.info("entering global pytb.NoModuleCacheContext")
-        NoModuleCacheContext().__enter__()
-    else:
-        _logger.info("'disable_module_cache' not set, skipping global context")
+    config = get_config()["init"]
 
+    # the subsystems are only imported if they are enabled to keep the startup fast
+    # pylint: disable=import-outside-toplevel
+    # enter the NoModuleCacheContext last, modules imported while
+    # setting up the other subsystems should not be reloaded
     if config.getboolean("install_notebook_loader"):
+        from pytb.importlib import NotebookLoader
+
         _logger.info("installing NotebookLoader into 'sys.meta_path'")
         NotebookLoader.install_hook()
     else:
         _logger.info("'install_notebook_loader' not set, skipping installation of hook")
 
     if config.getboolean("install_rdb_hook"):
+        from pytb.rdb import install_hook as install_rdb
+
         _logger.info("installing RDB as default debugger in 'sys.breakpointhook'")
         install_rdb()
     else:
         _logger.info("'install_rdb_hook' not set, skipping installation of hook")
 
+    if config.getboolean("disable_module_cache"):
+        from pytb.importlib import NoModuleCacheContext
+
+        _logger.info("entering global pytb.NoModuleCacheContext")
+        NoModuleCacheContext().__enter__()
+    else:
+        _logger.info("'disable_module_cache' not set, skipping global context")
+
     # store the calling frame to output a useful message when attempting to reinitialize the toolkit
     _initializer_frame = getattr(inspect.currentframe(), "f_back")
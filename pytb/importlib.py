@@ -6,8 +6,13 @@ This module contains useful helper scripts regarding the loading of modules
 # instead of the builtin package, thus we need to disable some checks
 import sys
 import os
+import ast
+import struct
+import marshal
+import hashlib
 import builtins
 import logging
+import sysconfig
 from typing import (
     Optional,
     Any,
@@ -18,26 +23,35 @@ from typing import (
     Mapping,
     Callable,
     List,
+    Tuple,
+    Dict,
+    Set,
+    cast,
 )
-from types import ModuleType, TracebackType
+from types import CodeType, ModuleType, TracebackType
 from importlib import reload as reload_module
 from importlib.machinery import ModuleSpec
+from importlib.util import MAGIC_NUMBER, resolve_name
 from importlib._bootstrap import _calc___package__, _resolve_name
 from importlib.abc import MetaPathFinder, Loader
 from contextlib import suppress
 
-from nbformat import read as read_notebook
-
-with suppress(Exception):
-    from IPython import get_ipython
-    from IPython.core.interactiveshell import InteractiveShell
-
-from pytb.config import current_config as pytb_config
+from pytb.config import get_config
 
 # Type of the Path argument in importlib.Loaders
 _PathType = Sequence[Union[bytes, str]]
 
 
+def read_notebook(source: str, as_version: int) -> Any:
+    """
+    Parse the notebook ``source`` using ``nbformat``.
+    ``nbformat`` is only imported when the first notebook is read
+    """
+    from nbformat import reads  # pylint: disable=import-outside-toplevel
+
+    return reads(source, as_version)
+
+
 class ModuleLoader(MetaPathFinder, ContextManager["ModuleLoader"], Loader):
     """
     A abstract base class for a general module loader interface
@@ -185,45 +199,62 @@ _ImportFunType = Callable[
 ]
 
 
+# modules of the stdlib and of installed packages are never reloaded
+_INSTALLED_PATHS = tuple(
+    os.path.join(path, "")
+    for path in {
+        sysconfig.get_path(name)
+        for name in ("stdlib", "platstdlib", "purelib", "platlib")
+    }
+    if path
+)
+
+
 class NoModuleCacheContext(ContextManager["NoModuleCacheContext"]):
     """
     Contextmanager to temporarly disable module chaching
 
-    While this context is active, every import statement will reevaluate the entire
-    module and all modules imported by it.
+    While this context is active, every import statement checks whether the source
+    of the imported module or of any module it (transitively) imports changed.
+    Changed modules are reloaded together with all modules that import them,
+    dependencies before the modules that depend on them. Unchanged modules are
+    not reloaded.
 
-    Excluded from the reloading are all modules in :attr:`sys.builtin_module_names`
-    and some modules in the stdlib that do not like to be reloaded. The list of unreloadable
-    modules is defined in :attr:`NoModuleCacheContext._no_reloadable_packages`
+    The dependencies between modules are recorded from the import statements
+    executed while the context is active. For modules that were loaded before the
+    context first sees them, the state of the source is recorded and the imports are
+    read from the source instead of reloading them. The modification time, size and
+    hash of the source of each module are stored in the context instance, so use the
+    same instance (e.g. :attr:`no_module_cache`) to only reload changed modules.
+
+    Excluded from the reloading are all modules in :attr:`sys.builtin_module_names`,
+    the stdlib and installed packages. Additional packages that should not be reloaded
+    are defined in the ``non_reloadable_packages`` option of the ``module_cache`` section
+    of the effective ``.pytb.conf``, it is read each time the context is entered
 
     An instance of this class is available as :attr:`no_module_cache`
 
     :param verbose: Print a list of modules that were reloaded for each import call
+    :param max_depth: only reload modules imported by at most ``max_depth`` nested imports
 
     .. doctest::
 
-        >>> from pytb.importlib import NoModuleCacheContext, NotebookLoader
-        >>> NotebookLoader().install()
+        >>> from pytb.importlib import NoModuleCacheContext
+        >>> from pytb.test.fixtures import random_module
+        >>> random_number = random_module.random_number
         >>> with NoModuleCacheContext():
-        ...     import pytb.test.fixtures.TestNB
-        ...     import pytb.test.fixtures.TestNB
-        Hello from Notebook
-        Hello from Notebook
+        ...     # the source did not change, the module is not reloaded
+        ...     from pytb.test.fixtures import random_module
+        >>> random_module.random_number == random_number
+        True
     """
 
-    # it does not make much sense to reload built-ins. Additionally there
-    # are some modules in the stdlib that do not like to be reloaded and
-    # throw an error, so we exclude them here as they do not make sense
-    # to live-reload them anyway
-    _no_reloadable_packages = pytb_config.getlist(
-        "module_cache", "non_reloadable_packages"
-    )
-
     class CachlessImporter:
         """
         Callable wrapper class that handles the calls to ``__import__``
         in a way that effectively disables the module cache by reloading
-        modules that are already loaded into ```sys.modules```
+        modules in ```sys.modules``` whose source changed and all modules
+        depending on them
         """
 
         def __init__(
@@ -233,6 +264,14 @@ class NoModuleCacheContext(ContextManager["NoModuleCacheContext"]):
             self.module_stack: List[str] = []
             self.reloaded_modules_in_last_call: List[str] = []
             self.max_depth = max_depth
+            self.no_reloadable_packages: Sequence[str] = []
+
+            # modification time, size and hash of the source of all known modules
+            self.source_states: Dict[str, Tuple[int, int, bytes]] = {}
+            # the modules each module imports and the modules importing each module
+            self.dependencies: Dict[str, Set[str]] = {}
+            self.dependents: Dict[str, Set[str]] = {}
+            self._checked_modules_in_last_call: Set[str] = set()
 
             self._logger = logging.getLogger(
                 f"{self.__class__.__module__}.{self.__class__.__name__}"
@@ -278,20 +317,12 @@ class NoModuleCacheContext(ContextManager["NoModuleCacheContext"]):
                 # reloaded in this import call to avoid recursive loops
                 return self.import_fun(name, globals, locals, fromlist, level)
 
-            module_name = fullname.partition(".")[0]
-
-            if (
-                fullname not in self.reloaded_modules_in_last_call
-                and module_name not in NoModuleCacheContext._no_reloadable_packages
-            ):
-                # reload the module itself first, as the children
-                # in fromlist may need it already in sys.modules
-                self.maybe_reload_module(fullname)
-                if fromlist:
-                    # reload all children from the partslist
-                    for part in fromlist:
-                        el_name = ".".join((fullname, part))
-                        self.maybe_reload_module(el_name)
+            # the module itself and all children from the fromlist that are modules
+            imported_names = [fullname] + [
+                ".".join((fullname, part)) for part in fromlist if part != "*"
+            ]
+            if self.is_reloadable(fullname):
+                self.reload_changed(imported_names)
 
             # add the module name to the current call stack before calling the
             # original builtin as importing a module may itself import modules and
@@ -300,32 +331,264 @@ class NoModuleCacheContext(ContextManager["NoModuleCacheContext"]):
 
             # resolve the module. use the the original builtin to handle all
             # the special cases easily
-            module = self.import_fun(name, globals, locals, fromlist, level)
-
-            # importing of the module done, pop it from the stack
-            self.module_stack.remove(fullname)
+            try:
+                module = self.import_fun(name, globals, locals, fromlist, level)
+            finally:
+                # importing of the module done, pop it from the stack
+                self.module_stack.remove(fullname)
+
+            # only record imports of modules that are (re)loaded in this context,
+            # the code using the context itself should never be reloaded
+            importer = globals.get("__name__")
+            for imported_name in imported_names:
+                if not self.is_reloadable(imported_name) or not self.source_path(
+                    imported_name
+                ):
+                    continue
+                if (
+                    isinstance(importer, str)
+                    and importer != imported_name
+                    and self.is_loading(importer)
+                ):
+                    self.add_dependency(importer, imported_name)
+                if imported_name not in self.source_states:
+                    # loaded for the first time, remember the state of the source
+                    self.record_source_state(imported_name)
             return module
 
+        def is_reloadable(self, fullname: str) -> bool:
+            """
+            Whether modules of the package of ``fullname`` may be reloaded
+            """
+            return fullname.partition(".")[0] not in self.no_reloadable_packages
+
+        def is_loading(self, fullname: str) -> bool:
+            """
+            Whether the module ``fullname`` (or a package while loading one of its
+            submodules) is executed by an import call in this context
+            """
+            return any(
+                loading == fullname or loading.startswith(fullname + ".")
+                for loading in self.module_stack
+            )
+
+        def add_dependency(self, importer: str, imported: str) -> None:
+            """
+            Record that the module ``importer`` imports the module ``imported``
+            """
+            self.dependencies.setdefault(importer, set()).add(imported)
+            self.dependents.setdefault(imported, set()).add(importer)
+
+        def forget_dependencies(self, fullname: str) -> None:
+            """
+            Forget all modules imported by ``fullname``, e.g. before it is reloaded
+            and records its dependencies again
+            """
+            for imported in self.dependencies.pop(fullname, set()):
+                self.dependents.get(imported, set()).discard(fullname)
+
+        @staticmethod
+        def source_path(fullname: str) -> Optional[str]:
+            """
+            Get the path of the source file of a loaded module or ``None`` if
+            the module has no source file (e.g. built-in or namespace packages)
+            or is part of the stdlib or an installed package
+            """
+            module = sys.modules.get(fullname)
+            path = getattr(module, "__file__", None)
+            if path is None:
+                # modules loaded by custom loaders like the NotebookLoader
+                spec = getattr(module, "__spec__", None)
+                path = getattr(spec, "origin", None)
+            if (
+                not isinstance(path, str)
+                or path.startswith(_INSTALLED_PATHS)
+                or not os.path.isfile(path)
+            ):
+                return None
+            return path
+
+        def record_source_state(self, fullname: str) -> Optional[bytes]:
+            """
+            Remember the modification time, size and hash of the source of ``fullname``
+
+            :return: the source of the module or ``None`` if it can not be read
+            """
+            path = self.source_path(fullname)
+            if path is None:
+                return None
+            try:
+                with open(path, "rb") as source_file:
+                    stat = os.fstat(source_file.fileno())
+                    source = source_file.read()
+            except OSError:
+                return None
+            digest = hashlib.sha256(source).digest()
+            self.source_states[fullname] = (stat.st_mtime_ns, stat.st_size, digest)
+            return source
+
+        def scan_dependencies(self, fullname: str, source: bytes) -> None:
+            """
+            Record the already loaded modules imported by the source of ``fullname``.
+            Used for modules that were loaded before the context observed their imports
+
+            :param fullname: FQN of the module
+            :param source: python source of the module. Other sources (e.g. notebooks)
+                are ignored
+            """
+            try:
+                tree = ast.parse(source)
+            except (SyntaxError, ValueError):
+                return
+
+            module = sys.modules[fullname]
+            package = getattr(module, "__package__", None) or ""
+            imported: Set[str] = set()
+            for node in ast.walk(tree):
+                if isinstance(node, ast.Import):
+                    imported.update(alias.name for alias in node.names)
+                elif isinstance(node, ast.ImportFrom):
+                    try:
+                        base = resolve_name(
+                            "." * node.level + (node.module or ""), package
+                        )
+                    except (ImportError, ValueError):
+                        continue
+                    imported.add(base)
+                    imported.update(f"{base}.{alias.name}" for alias in node.names)
+
+            for name in imported:
+                if (
+                    name != fullname
+                    and name in sys.modules
+                    and self.is_reloadable(name)
+                    and self.source_path(name)
+                ):
+                    self.add_dependency(fullname, name)
+
+        def has_changed(self, fullname: str) -> bool:
+            """
+            Whether the source of the loaded module ``fullname`` changed since its state
+            was recorded. For modules without a recorded state, e.g. modules loaded
+            before the context was used, the state and the imported modules are
+            recorded instead of reloading them.
+            The source is only hashed if its modification time changed
+            """
+            path = self.source_path(fullname)
+            if path is None:
+                # nothing to reload from, e.g. namespace packages or the stdlib
+                return False
+            state = self.source_states.get(fullname)
+            if state is None:
+                source = self.record_source_state(fullname)
+                if source is not None:
+                    self.scan_dependencies(fullname, source)
+                return False
+
+            mtime, size, digest = state
+            try:
+                stat = os.stat(path)
+                if (stat.st_mtime_ns, stat.st_size) == (mtime, size):
+                    return False
+                if stat.st_size == size:
+                    # the file was touched, check if the content changed
+                    with open(path, "rb") as source_file:
+                        changed = hashlib.sha256(source_file.read()).digest() != digest
+                    if not changed:
+                        self.source_states[fullname] = (stat.st_mtime_ns, size, digest)
+                    return changed
+            except OSError:
+                return False
+            return True
+
+        def reload_changed(self, fullnames: Sequence[str]) -> None:
+            """
+            Reload all modules among ``fullnames`` and their (transitive) dependencies
+            whose source changed, together with all modules depending on them.
+            Each module is only checked once while the context is active
+
+            :param fullnames: FQNs of the imported modules
+            """
+            if self.max_depth is not None and len(self.module_stack) >= self.max_depth:
+                return
+
+            changed: Set[str] = set()
+            pending = [fullname for fullname in fullnames if fullname in sys.modules]
+            while pending:
+                fullname = pending.pop()
+                if (
+                    fullname in self._checked_modules_in_last_call
+                    or not self.is_reloadable(fullname)
+                ):
+                    continue
+                self._checked_modules_in_last_call.add(fullname)
+                if self.has_changed(fullname):
+                    changed.add(fullname)
+                pending.extend(self.dependencies.get(fullname, ()))
+
+            if not changed:
+                return
+
+            # all modules depending on a changed module hold references to it
+            stale = set(changed)
+            pending = list(changed)
+            while pending:
+                for dependent in self.dependents.get(pending.pop(), ()):
+                    if dependent not in stale and self.is_reloadable(dependent):
+                        stale.add(dependent)
+                        pending.append(dependent)
+            self._checked_modules_in_last_call.update(stale)
+
+            for fullname in self.reload_order(stale):
+                self.maybe_reload_module(fullname)
+
+        def reload_order(self, fullnames: Set[str]) -> List[str]:
+            """
+            Sort ``fullnames`` topologically, so every module comes after
+            the modules it imports. Cyclic imports are broken up arbitrarily
+            """
+            order: List[str] = []
+            visited: Set[str] = set()
+
+            def visit(fullname: str) -> None:
+                if fullname in visited:
+                    return
+                visited.add(fullname)
+                for dependency in sorted(self.dependencies.get(fullname, ())):
+                    if dependency in fullnames:
+                        visit(dependency)
+                order.append(fullname)
+
+            for fullname in sorted(fullnames):
+                visit(fullname)
+            return order
+
         def maybe_reload_module(self, fullname: str) -> None:
             """
             Reload the module if it already is loaded into :attr:`sys.modules`
-            and add the module to the list of reloaded modules in this call
+            and add the module to the list of reloaded modules in this call.
+            The dependencies of the module are recorded again while it is reloaded
 
             :param fullname: FQN of the module to reload
             """
-            if fullname in sys.modules and (
-                self.max_depth is None or len(self.module_stack) < self.max_depth
-            ):
+            if fullname in sys.modules and fullname not in self.module_stack:
                 self.reloaded_modules_in_last_call.append(fullname)
-                reload_module(sys.modules[fullname])  # pylint: disable=no-member
+                self.forget_dependencies(fullname)
+                self.module_stack.append(fullname)
+                try:
+                    reload_module(sys.modules[fullname])  # pylint: disable=no-member
+                finally:
+                    self.module_stack.remove(fullname)
+                self.record_source_state(fullname)
 
         def flush_reload_stack(self) -> None:
             """
-            Clear the list of reloaded modules in this call. If this instance is verbose,
-            print the list of reloaded modules
+            Clear the list of reloaded and checked modules in this call.
+            If this instance is verbose, print the list of reloaded modules
             """
             self._logger.info(f"reloaded modules {self.reloaded_modules_in_last_call}")
             self.reloaded_modules_in_last_call.clear()
+            self._checked_modules_in_last_call.clear()
 
     def __init__(self, verbose: bool = False, max_depth: Optional[int] = None):
         self.is_verbose = verbose
@@ -344,6 +607,10 @@ class NoModuleCacheContext(ContextManager["NoModuleCacheContext"]):
         builtins.__import__ = self.custom_import_fun
 
         self.custom_import_fun.is_verbose = verbosity
+        # some packages define a global state that does not like to be created again
+        self.custom_import_fun.no_reloadable_packages = get_config().getlist(
+            "module_cache", "non_reloadable_packages"
+        )
 
         return self
 
@@ -373,6 +640,16 @@ class NotebookLoader(ModuleLoader):
     """
     A :class:`ModuleLoader` that allows importing of jupyter Notebooks as python modules.
 
+    The code cells of a notebook are compiled once and cached as a single marshalled
+    tuple of code objects in the ``__pycache__`` directory next to the notebook,
+    just like python caches the bytecode of modules. The cache is keyed by the
+    modification time, size and hash of the notebook and the python version, so
+    importing an unchanged notebook again skips parsing and compiling it.
+
+    :param verbose: if True, prints attempts to find and load a module
+    :param bytecode_cache: if True, cache the compiled notebooks. If ``None``,
+        the value is read from the effective ``.pytb.config`` s ``module_cache`` section
+
     .. doctest::
 
         >>> from pytb.importlib import NotebookLoader, no_module_cache
@@ -384,11 +661,56 @@ class NotebookLoader(ModuleLoader):
 
     # pylint: disable=abstract-method
 
-    def __init__(self, verbose: bool = False):
+    _cache_header = struct.Struct("<4sBQQ32s")
+    """
+    Header of the cache files: python magic number, flags, modification time
+    in nanoseconds and size of the notebook and the sha256 hash of the notebook
+    """
+
+    _FLAG_IPYTHON = 0x1
+    """
+    The cells were transformed by IPython
+    """
+
+    _unresolved = object()
+
+    def __init__(self, verbose: bool = False, bytecode_cache: Optional[bool] = None):
         super().__init__(verbose)
-        self.shell = (
-            InteractiveShell.instance() if "InteractiveShell" in globals() else None
-        )
+        self._shell: Any = NotebookLoader._unresolved
+        if bytecode_cache is None:
+            bytecode_cache = get_config().getboolean(
+                "module_cache", "notebook_bytecode_cache"
+            )
+        self.bytecode_cache = bytecode_cache
+
+    @property
+    def shell(self) -> Any:
+        """
+        The ``InteractiveShell`` used to transform IPython syntax or ``None``
+        if IPython is not available. IPython is only imported when the shell is first used
+        """
+        if self._shell is NotebookLoader._unresolved:
+            self._shell = None
+            # pylint: disable=import-outside-toplevel
+            with suppress(Exception):
+                from IPython.core.interactiveshell import InteractiveShell
+
+                self._shell = InteractiveShell.instance()
+        return self._shell
+
+    def install(self) -> None:
+        """
+        Install this loader into the metapath. ``nbformat`` and IPython are imported
+        now, importing them while a notebook is imported in a :class:`NoModuleCacheContext`
+        would reload all modules they depend on
+
+        :raises RuntimeError: If this loader is already installed
+        """
+        # pylint: disable=import-outside-toplevel,unused-import
+        import nbformat
+
+        _ = self.shell
+        super().install()
 
     @staticmethod
     def _find_notebook(fullname: str, path: Optional[_PathType]) -> Optional[str]:
@@ -406,6 +728,23 @@ class NotebookLoader(ModuleLoader):
                 return nb_path
         return None
 
+    @staticmethod
+    def cache_path(nb_path: str) -> str:
+        """
+        Get the path of the bytecode cache of the notebook at ``nb_path``
+
+        .. doctest::
+
+            >>> NotebookLoader.cache_path('my/Notebook.ipynb') == (
+            ...     f'my/__pycache__/Notebook.ipynb.{sys.implementation.cache_tag}.pyc'
+            ... )
+            True
+        """
+        directory, filename = os.path.split(nb_path)
+        return os.path.join(
+            directory, "__pycache__", f"{filename}.{sys.implementation.cache_tag}.pyc"
+        )
+
     def find_spec(
         self,
         fullname: str,
@@ -422,15 +761,140 @@ class NotebookLoader(ModuleLoader):
 
         return ModuleSpec(fullname, self, origin=nb_path)
 
+    def get_code(self, nb_path: str) -> Tuple[CodeType, ...]:
+        """
+        Get the compiled code cells of the notebook at ``nb_path``.
+        The code is read from the bytecode cache if it is still valid and
+        the cache is updated otherwise.
+
+        If only the modification time of the notebook changed, the cache is
+        validated using the hash of the notebook instead of compiling it again.
+
+        :param nb_path: path of the notebook
+        :return: a code object for each code cell of the notebook
+        """
+        flags = self._FLAG_IPYTHON if self.shell is not None else 0
+        cache_path = self.cache_path(nb_path)
+
+        source = None
+        if self.bytecode_cache:
+            cached = self._read_cache(cache_path, flags)
+            if cached is not None:
+                (mtime, size, digest), code_data = cached
+                stat = os.stat(nb_path)
+                if (mtime, size) == (stat.st_mtime_ns, stat.st_size):
+                    self._logger.info(f"Using cached code of {nb_path}")
+                    return cast(Tuple[CodeType, ...], marshal.loads(code_data))
+
+                if size == stat.st_size:
+                    # the notebook may only have been touched or saved without changes
+                    source, stat = self._read_source(nb_path)
+                    if hashlib.sha256(source).digest() == digest:
+                        self._logger.info(f"Using cached code of unchanged {nb_path}")
+                        self._write_cache(
+                            cache_path, flags, stat, digest, code_data
+                        )
+                        return cast(Tuple[CodeType, ...], marshal.loads(code_data))
+
+        if source is None:
+            source, stat = self._read_source(nb_path)
+        code = self._compile_notebook(nb_path, source)
+        if self.bytecode_cache and not sys.dont_write_bytecode:
+            self._write_cache(
+                cache_path,
+                flags,
+                stat,
+                hashlib.sha256(source).digest(),
+                marshal.dumps(code),
+            )
+        return code
+
+    @staticmethod
+    def _read_source(nb_path: str) -> Tuple[bytes, os.stat_result]:
+        """
+        Read the raw notebook and stat it while it is open
+        """
+        with open(nb_path, "rb") as nb_file:
+            return nb_file.read(), os.fstat(nb_file.fileno())
+
+    def _compile_notebook(self, nb_path: str, source: bytes) -> Tuple[CodeType, ...]:
+        """
+        Parse the notebook, transform IPython syntax in the code cells
+        and compile each code cell
+        """
+        self._logger.info(f"Compiling notebook {nb_path}")
+        notebook = read_notebook(source.decode("utf-8"), 4)
+
+        code_cells = []
+        for index, cell in enumerate(notebook.cells):
+            if cell.cell_type == "code":
+                if self.shell is not None:
+                    code = self.shell.input_transformer_manager.transform_cell(
+                        cell.source
+                    )
+                else:
+                    code = cell.source
+                code_cells.append(
+                    compile(code, f"<{nb_path} cell {index}>", "exec", dont_inherit=True)
+                )
+        return tuple(code_cells)
+
+    def _read_cache(
+        self, cache_path: str, flags: int
+    ) -> Optional[Tuple[Tuple[int, int, bytes], bytes]]:
+        """
+        Read a cache file if it was written by this python version with the same ``flags``
+
+        :return: the modification time, size and hash of the cached notebook
+            and the marshalled code or ``None``
+        """
+        try:
+            with open(cache_path, "rb") as cache_file:
+                data = cache_file.read()
+            magic, cached_flags, mtime, size, digest = self._cache_header.unpack_from(
+                data
+            )
+        except (OSError, struct.error):
+            return None
+
+        if magic != MAGIC_NUMBER or cached_flags != flags:
+            return None
+        return (mtime, size, digest), data[self._cache_header.size :]
+
+    def _write_cache(
+        self,
+        cache_path: str,
+        flags: int,
+        stat: os.stat_result,
+        digest: bytes,
+        code_data: bytes,
+    ) -> None:
+        """
+        Atomically replace the cache file. Failing to write the cache
+        (e.g. in a read-only directory) is not an error
+        """
+        header = self._cache_header.pack(
+            MAGIC_NUMBER, flags, stat.st_mtime_ns, stat.st_size, digest
+        )
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as cache_file:
+                cache_file.write(header + code_data)
+            os.replace(temp_path, cache_path)
+        except OSError as err:
+            self._logger.info(f"Could not write the cache {cache_path}: {err}")
+
     def exec_module(self, module: ModuleType) -> None:
         module_file = getattr(getattr(module, "__spec__", None), "origin", None)
         if module_file is None:
             raise ImportError("Module Spec has no origin")
 
-        with open(module_file, "r", encoding="utf-8") as f:
-            notebook = read_notebook(f, 4)
+        code_cells = self.get_code(module_file)
 
         if self.shell is not None:
+            from IPython import get_ipython  # pylint: disable=import-outside-toplevel
+
             module.__dict__["get_ipython"] = get_ipython
             # extra work to ensure that magics that would affect the user_ns
             # actually affect the notebook module's namespace
@@ -438,18 +902,10 @@ class NotebookLoader(ModuleLoader):
             self.shell.user_ns = module.__dict__
 
         try:
-            for cell in notebook.cells:
-                if cell.cell_type == "code":
-                    if self.shell is not None:
-                        code = self.shell.input_transformer_manager.transform_cell(
-                            cell.source
-                        )
-                    else:
-                        code = cell.source
-
-                    # run the code in them odule
-                    # pylint: disable=exec-used
-                    exec(code, module.__dict__)
+            for code in code_cells:
+                # run the code in the module
+                # pylint: disable=exec-used
+                exec(code, module.__dict__)
         finally:
             if self.shell is not None:
                 self.shell.user_ns = save_user_ns
@@ -1,11 +1,160 @@
 """
     This module contains a set of helpers for common Input/Output related tasks
 """
+import os
+import errno
+import re
 import sys
-import textwrap
-from io import StringIO
-from typing import Any, TextIO, Union, Generator, cast
-from contextlib import contextmanager
+import gzip
+import json
+import lzma
+import shutil
+import struct
+import time
+import mmap
+import codecs
+import tempfile
+import selectors
+import threading
+from collections import deque
+from itertools import islice
+from contextvars import ContextVar
+from queue import Queue
+from typing import (
+    Any,
+    TextIO,
+    Union,
+    Generator,
+    Optional,
+    List,
+    Deque,
+    Dict,
+    IO,
+    Sequence,
+    Tuple,
+    NamedTuple,
+    BinaryIO,
+    Iterable,
+    cast,
+)
+from contextlib import contextmanager, ExitStack
+from functools import partial
+
+
+class _WriteBehindSink:
+    """
+    A bounded buffer in front of a stream that is written to the stream
+    by a background thread. Used by :class:`Tee`
+    """
+
+    def __init__(self, stream: TextIO, max_size: int, overflow: str, batch_size: int):
+        self.stream = stream
+        self.max_size = max_size
+        self.overflow = overflow
+        self.batch_size = batch_size
+
+        self.dropped = 0
+        """
+        Number of characters dropped because the buffer was full
+        """
+
+        self._chunks: Deque[str] = deque()
+        self._size = 0
+        self._writing = False
+        self._error: Optional[Exception] = None
+        self._stopped = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="pytb-tee-writer", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, text: str) -> None:
+        """
+        Add ``text`` to the buffer, applying the overflow policy if it is full
+
+        :raises Exception: the error of a previous write to the stream
+        """
+        with self._condition:
+            self._raise_error()
+            if self._size + len(text) > self.max_size:
+                if self.overflow == "block":
+                    # text larger than the whole buffer is accepted once it is empty
+                    self._condition.wait_for(
+                        lambda: self._size + len(text) <= self.max_size
+                        or not self._chunks
+                    )
+                elif self.overflow == "drop_newest":
+                    self.dropped += len(text)
+                    return
+                else:
+                    while self._chunks and self._size + len(text) > self.max_size:
+                        oldest = self._chunks.popleft()
+                        self._size -= len(oldest)
+                        self.dropped += len(oldest)
+
+            self._chunks.append(text)
+            self._size += len(text)
+            self._condition.notify_all()
+
+    def flush(self) -> None:
+        """
+        Wait until the buffer is written to the stream and flush the stream
+
+        :raises Exception: the error of a previous write to the stream
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: not self._chunks and not self._writing)
+            self._raise_error()
+        self.stream.flush()
+
+    def stop(self) -> None:
+        """
+        Write the remaining buffer and stop the background thread
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join()
+        self.stream.flush()
+
+    def _raise_error(self) -> None:
+        # errors of the background thread are raised on the writing thread
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _next_batch(self) -> str:
+        # batch small writes into a single call to the streams ``write``
+        batch = [self._chunks.popleft()]
+        batch_length = len(batch[0])
+        while self._chunks and batch_length + len(self._chunks[0]) <= self.batch_size:
+            chunk = self._chunks.popleft()
+            batch.append(chunk)
+            batch_length += len(chunk)
+        self._size -= batch_length
+        return "".join(batch)
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._chunks or self._stopped)
+                if not self._chunks:
+                    return
+                batch = self._next_batch()
+                self._writing = True
+                # there is space in the buffer again
+                self._condition.notify_all()
+
+            # pylint: disable=broad-except
+            try:
+                self.stream.write(batch)
+            except Exception as error:
+                self._error = error
+            finally:
+                with self._condition:
+                    self._writing = False
+                    self._condition.notify_all()
 
 
 class Tee:
@@ -14,6 +163,20 @@ class Tee:
     This is useful if you want to write to multiple files or file-like objects
     (e.g. ``sys.stdout``, ``sys.stderr``) simultaneously.
 
+    By default, each write is passed to all connected streams in turn. If a
+    ``buffer_size`` is set, each stream gets a write-behind buffer of up to
+    ``buffer_size`` characters instead, which is written to the stream by a
+    background thread. Small writes are batched into writes of up to ``batch_size``
+    characters. A slow stream (e.g. a file on a network share or a pipe)
+    then no longer slows down the writing code. The ``overflow`` policy decides
+    what happens if a buffer is full:
+
+    - ``block``: wait until the background thread made room in the buffer
+    - ``drop_oldest``: drop the oldest buffered output to make room
+    - ``drop_newest``: drop the written text
+
+    :meth:`flush` waits until all buffers are written to their streams.
+
     .. testsetup:: *
 
         from pytb.io import *
@@ -26,15 +189,56 @@ class Tee:
         >>> _ = combined.write('This is printed into a file and on stdout\\n')
         This is printed into a file and on stdout
         >>> assert file_like.getvalue() == 'This is printed into a file and on stdout\\n'
+
+    .. doctest::
+
+        >>> file_like = io.StringIO()
+        >>> buffered = Tee(file_like, buffer_size=1024)
+        >>> for i in range(3):
+        ...     _ = buffered.write(f'{i} ')
+        >>> buffered.flush()
+        >>> file_like.getvalue()
+        '0 1 2 '
+    """
+
+    overflow_policies = ("block", "drop_oldest", "drop_newest")
+    """
+    The supported values for the ``overflow`` parameter
     """
 
-    def __init__(self, *args: TextIO):
+    def __init__(
+        self,
+        *args: TextIO,
+        buffer_size: int = 0,
+        overflow: str = "block",
+        batch_size: int = 65536,
+    ):
         """
         Instantiate a new manifold that connects all passed file-like objects' output streams
 
         :param *args: file-like objects to connect to the manifold
+        :param buffer_size: maximum number of characters buffered per stream.
+            If 0, write to the streams directly
+        :param overflow: what to do if a buffer is full, one of :attr:`overflow_policies`
+        :param batch_size: maximum number of characters written to a stream at once
         """
+        if overflow not in self.overflow_policies:
+            raise ValueError(
+                f"overflow needs to be one of {self.overflow_policies}, got '{overflow}'"
+            )
+
         self._fds = args
+        self._sinks = [
+            _WriteBehindSink(stream, buffer_size, overflow, batch_size)
+            for stream in (args if buffer_size > 0 else ())
+        ]
+
+    @property
+    def dropped(self) -> int:
+        """
+        Number of characters dropped by the overflow policy summed over all streams
+        """
+        return sum(sink.dropped for sink in self._sinks)
 
     def write(self, text: str) -> int:
         """
@@ -42,7 +246,13 @@ class Tee:
 
         :param text: text to write to the manifold
         :return: the number of bytes written to the last stream in the Manifold
+            or the length of ``text`` if the streams are buffered
         """
+        if self._sinks:
+            for sink in self._sinks:
+                sink.put(text)
+            return len(text)
+
         for stream in self._fds:
             written = stream.write(text)
 
@@ -50,11 +260,26 @@ class Tee:
 
     def flush(self) -> None:
         """
-        Flush any buffers of all connected file output-streams
+        Flush any buffers of all connected file output-streams.
+        Waits until all write-behind buffers are written
         """
+        if self._sinks:
+            for sink in self._sinks:
+                sink.flush()
+            return
+
         for stream in self._fds:
             stream.flush()
 
+    def _stop_writers(self) -> None:
+        """
+        Write the remaining buffers and stop the background threads
+        without closing the streams
+        """
+        for sink in self._sinks:
+            sink.stop()
+        self._sinks = []
+
     def close(self) -> None:
         """
         Close all connected files
@@ -74,12 +299,917 @@ class Tee:
             >>> sys.stdout.closed
             False
         """
+        self._stop_writers()
         for stream in self._fds:
             if stream not in [sys.__stderr__, sys.__stdout__]:
                 stream.close()
 
 
-AnyTextIOType = Union[str, TextIO, Tee]
+_BinarySink = Union[int, BinaryIO]
+
+_IOV_MAX = os.sysconf("SC_IOV_MAX") if hasattr(os, "sysconf") else 1024
+
+
+def _writev_all(fd: int, buffers: Iterable[Any]) -> int:
+    """
+    Write all ``buffers`` to the file descriptor ``fd`` using as few ``writev``
+    calls as possible, without copying the buffers
+
+    :return: the number of bytes written
+    """
+    views = deque(view for view in map(_byte_view, buffers) if view)
+    total = 0
+    while views:
+        written = os.writev(fd, list(islice(views, _IOV_MAX)))
+        total += written
+        # drop the completely written buffers and slice the partially written one
+        while views and written >= len(views[0]):
+            written -= len(views.popleft())
+        if written:
+            views[0] = views[0][written:]
+    return total
+
+
+def _byte_view(data: Any) -> memoryview:
+    """
+    Get a flat view of the bytes of any bytes-like object
+    """
+    view = memoryview(data)
+    return view if view.format == "B" and view.ndim == 1 else view.cast("B")
+
+
+class BinaryTee:
+    """
+    The binary counterpart of :class:`Tee`. Writes bytes-like objects
+    (``bytes``, ``bytearray``, ``memoryview``, ...) to several binary files or
+    file descriptors without decoding or copying them.
+
+    Sinks can be binary file objects or integer file descriptors (e.g. of pipes or
+    sockets). File descriptors are written with ``os.write`` and :meth:`writelines`
+    writes all chunks with a single ``os.writev`` call per descriptor.
+
+    :meth:`copy_from` mirrors everything read from a file descriptor to all sinks.
+    Between two file descriptors of which one is a pipe, the data is moved by the kernel
+    using ``os.splice`` without ever being copied to user space.
+
+    :param *args: binary file objects or file descriptors to connect to the manifold
+
+    .. doctest::
+
+        >>> import io, os
+        >>> read_end, write_end = os.pipe()
+        >>> log = io.BytesIO()
+        >>> combined = BinaryTee(log, write_end)
+        >>> combined.writelines([b'header ', memoryview(b'payload\\n')])
+        15
+        >>> os.close(write_end)
+        >>> log.getvalue(), os.read(read_end, 100)
+        (b'header payload\\n', b'header payload\\n')
+        >>> os.close(read_end)
+    """
+
+    def __init__(self, *args: _BinarySink):
+        self._sinks = args
+
+    def write(self, data: Any) -> int:
+        """
+        Write ``data`` to all connected sinks
+
+        :param data: a bytes-like object
+        :return: the number of bytes written
+        """
+        view = _byte_view(data)
+        for sink in self._sinks:
+            if isinstance(sink, int):
+                _write_all(sink, view)
+            else:
+                sink.write(view)
+        return len(view)
+
+    def writelines(self, buffers: Iterable[Any]) -> int:
+        """
+        Write all bytes-like objects in ``buffers`` to all connected sinks.
+        File descriptors are written with ``os.writev``
+
+        :return: the number of bytes written to each sink
+        """
+        buffers = list(buffers)
+        total = sum(len(_byte_view(buffer)) for buffer in buffers)
+        for sink in self._sinks:
+            if isinstance(sink, int):
+                _writev_all(sink, buffers)
+            else:
+                sink.writelines(buffers)
+        return total
+
+    def copy_from(self, source: int, chunk_size: int = 65536) -> int:
+        """
+        Mirror everything read from the file descriptor ``source`` to all sinks
+        until the end of the file is reached.
+
+        If the only sink is a file descriptor and ``os.splice`` is available (Linux),
+        the data is moved inside the kernel. Otherwise, it is read in chunks of up to
+        ``chunk_size`` bytes into a single buffer that is written to all sinks.
+
+        :return: the number of bytes copied
+        """
+        if len(self._sinks) == 1 and isinstance(self._sinks[0], int):
+            spliced = _splice_all(source, self._sinks[0], chunk_size)
+            if spliced >= 0:
+                return spliced
+
+        copied = 0
+        buffer = bytearray(chunk_size)
+        view = memoryview(buffer)
+        while True:
+            read = os.readv(source, [buffer])
+            if not read:
+                return copied
+            self.write(view[:read])
+            copied += read
+
+    def flush(self) -> None:
+        """
+        Flush all connected file objects
+        """
+        for sink in self._sinks:
+            if not isinstance(sink, int):
+                sink.flush()
+
+    def close(self) -> None:
+        """
+        Close all connected file objects. File descriptors are left open
+        as are the buffers of ``sys.__stdout__`` and ``sys.__stderr__``
+        """
+        std_buffers = [
+            getattr(stream, "buffer", None) for stream in (sys.__stdout__, sys.__stderr__)
+        ]
+        for sink in self._sinks:
+            if not isinstance(sink, int) and sink not in std_buffers:
+                sink.close()
+
+
+def _splice_all(source: int, target: int, chunk_size: int) -> int:
+    """
+    Move everything from ``source`` to ``target`` using ``os.splice``.
+    One of the file descriptors needs to be a pipe.
+
+    :return: the number of bytes moved or -1 if the file descriptors
+        can't be spliced, before anything was moved
+    """
+    splice = getattr(os, "splice", None)
+    if splice is None:
+        return -1
+
+    moved = 0
+    while True:
+        try:
+            spliced = splice(source, target, chunk_size)
+        except OSError as err:
+            # EINVAL: no pipe or a file system without splice support
+            if moved == 0 and err.errno in (errno.EINVAL, errno.ENOSYS):
+                return -1
+            raise
+        if not spliced:
+            return moved
+        moved += spliced
+
+
+class CaptureSnapshot(str):
+    """
+    A bounded view of the output captured by a :class:`CaptureBuffer`
+    at a single point in time.
+
+    The snapshot is a string containing the captured head and tail.
+    If output was omitted in between, a marker with the number of omitted
+    characters is placed between both parts. Use :meth:`chunks` to iterate over the
+    complete captured output including the omitted part (if it was spilled to disk).
+
+    Creating a snapshot does not copy the spilled output, it is memory-mapped
+    and only read when iterating over the :meth:`chunks`.
+    """
+
+    head: str
+    tail: str
+    omitted: int
+    _spill: Optional[mmap.mmap]
+
+    def __new__(
+        cls, head: str, tail: str, omitted: int, spill: Optional[mmap.mmap] = None
+    ) -> "CaptureSnapshot":
+        marker = f"\n<{omitted} characters omitted>\n" if omitted else ""
+        snapshot = super().__new__(cls, head + marker + tail)
+        snapshot.head = head
+        snapshot.tail = tail
+        snapshot.omitted = omitted
+        snapshot._spill = spill
+        return snapshot
+
+    @property
+    def total_length(self) -> int:
+        """
+        The number of characters captured in total (including the omitted ones)
+        """
+        return len(self.head) + self.omitted + len(self.tail)
+
+    @property
+    def is_complete(self) -> bool:
+        """
+        ``True`` if :meth:`chunks` yields the complete captured output
+        """
+        return self.omitted == 0 or self._spill is not None
+
+    def prepend(self, text: str) -> "CaptureSnapshot":
+        """
+        Create a new snapshot with ``text`` inserted before the captured output.
+        The spilled output is shared with this snapshot
+
+        >>> snapshot = CaptureSnapshot("head", "tail", 10)
+        >>> snapshot.prepend("> ")
+        '> head\\n<10 characters omitted>\\ntail'
+        """
+        return CaptureSnapshot(text + self.head, self.tail, self.omitted, self._spill)
+
+    def chunks(self, chunk_size: int = 65536) -> Generator[str, None, None]:
+        """
+        Iterate over the complete captured output in chunks of about ``chunk_size``
+        characters. If the omitted part was dropped instead of spilled to disk,
+        the omission marker is yielded in its place
+        """
+        yield self.head
+        if self._spill is not None:
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            for offset in range(0, len(self._spill), chunk_size):
+                yield decoder.decode(self._spill[offset : offset + chunk_size])
+            yield decoder.decode(b"", final=True)
+        elif self.omitted:
+            yield f"\n<{self.omitted} characters omitted>\n"
+        yield self.tail
+
+
+class CaptureBuffer:
+    """
+    A writable text buffer with bounded memory usage to capture
+    the output of long running code.
+
+    The first ``head_size`` characters and the last ``tail_size`` characters written
+    to the buffer are kept in memory. Everything in between is either spilled to a
+    temporary file or dropped, depending on ``spill``.
+
+    :meth:`snapshot` and :meth:`getvalue` return the head and tail only, so
+    their cost does not depend on the total amount of captured output.
+
+    The buffer also keeps track of the write activity in :attr:`write_count` and
+    :attr:`last_write`. Use a buffer with ``head_size`` and ``tail_size`` set to 0
+    and ``spill`` disabled to monitor writes without keeping any output.
+
+    :param head_size: number of characters kept from the start of the output
+    :param tail_size: number of characters kept from the end of the output
+    :param spill: if ``True``, write the middle part to an anonymous temporary
+        file, otherwise only count the omitted characters
+
+    .. doctest::
+
+        >>> buffer = CaptureBuffer(head_size=4, tail_size=4, spill=True)
+        >>> _ = buffer.write('0123456789')
+        >>> buffer.getvalue()
+        '0123\\n<2 characters omitted>\\n6789'
+        >>> ''.join(buffer.snapshot().chunks())
+        '0123456789'
+    """
+
+    def __init__(
+        self, head_size: int = 65536, tail_size: int = 262144, spill: bool = True
+    ):
+        self.head_size = head_size
+        self.tail_size = tail_size
+        self.spill = spill
+
+        self._head: List[str] = []
+        self._head_length = 0
+        self._tail: Deque[str] = deque()
+        self._tail_length = 0
+        self._omitted = 0
+        self._spill_file: Optional[IO[bytes]] = None
+        self._lock = threading.Lock()
+        self.closed = False
+
+        self.write_count = 0
+        """
+        Number of calls to :meth:`write` since the buffer was created
+        """
+
+        self.last_write = time.monotonic()
+        """
+        Value of ``time.monotonic()`` at the last call to :meth:`write`
+        (or the creation of the buffer if nothing was written yet)
+        """
+
+    def write(self, text: str) -> int:
+        """
+        Append ``text`` to the buffer
+
+        :return: the number of characters written
+        """
+        written = len(text)
+        with self._lock:
+            self.write_count += 1
+            self.last_write = time.monotonic()
+
+            if self._head_length < self.head_size:
+                head_part = text[: self.head_size - self._head_length]
+                self._head.append(head_part)
+                self._head_length += len(head_part)
+                text = text[len(head_part) :]
+
+            if text:
+                self._tail.append(text)
+                self._tail_length += len(text)
+                self._trim_tail()
+
+        return written
+
+    def _trim_tail(self) -> None:
+        excess = self._tail_length - self.tail_size
+        while excess > 0:
+            chunk = self._tail[0]
+            if len(chunk) <= excess:
+                self._tail.popleft()
+            else:
+                self._tail[0] = chunk[excess:]
+                chunk = chunk[:excess]
+
+            self._tail_length -= len(chunk)
+            self._omitted += len(chunk)
+            excess -= len(chunk)
+
+            if self.spill:
+                if self._spill_file is None:
+                    self._spill_file = tempfile.TemporaryFile()
+                self._spill_file.write(chunk.encode("utf-8"))
+
+    def snapshot(self) -> CaptureSnapshot:
+        """
+        Create a :class:`CaptureSnapshot` of the current state of the buffer
+        """
+        with self._lock:
+            head = "".join(self._head)
+            tail = "".join(self._tail)
+
+            spill = None
+            if self._spill_file is not None:
+                self._spill_file.flush()
+                spill = mmap.mmap(
+                    self._spill_file.fileno(),
+                    self._spill_file.tell(),
+                    access=mmap.ACCESS_READ,
+                )
+
+            return CaptureSnapshot(head, tail, self._omitted, spill)
+
+    def getvalue(self) -> str:
+        """
+        Get the captured head and tail as a single string (see :class:`CaptureSnapshot`)
+        """
+        return str(self.snapshot())
+
+    def truncate(self, size: int = 0) -> int:
+        """
+        Discard all captured output. Only supports truncating to a ``size`` of 0
+        to stay compatible with code that clears a ``io.StringIO``
+
+        :raises ValueError: if ``size`` is not 0
+        """
+        if size != 0:
+            raise ValueError("CaptureBuffer can only be truncated to size 0")
+        self.clear()
+        return 0
+
+    def clear(self) -> None:
+        """
+        Discard all captured output
+        """
+        with self._lock:
+            self._head.clear()
+            self._head_length = 0
+            self._tail.clear()
+            self._tail_length = 0
+            self._omitted = 0
+            # existing snapshots keep their mapping of the spilled data alive,
+            # so the file is replaced instead of truncated
+            if self._spill_file is not None:
+                self._spill_file.close()
+                self._spill_file = None
+
+    def flush(self) -> None:
+        """
+        Does nothing, the buffer is always up to date
+        """
+
+    def writable(self) -> bool:  # pylint: disable=no-self-use
+        """
+        The buffer is always writable
+        """
+        return True
+
+    def close(self) -> None:
+        """
+        Discard all captured output and close the buffer
+        """
+        self.clear()
+        self.closed = True
+
+
+class RotatingFile:
+    """
+    A writable text file that is split into segments to keep week-long logs manageable.
+    It can be used everywhere a file is accepted, e.g. as target of :meth:`mirrored_stdout`.
+
+    The output is written to ``path``. When the file exceeds ``max_size`` bytes or
+    is older than ``max_age`` seconds, it is closed and renamed to ``{path}.{number}``
+    with a six digit segment number. A background thread compresses closed segments
+    using ``gzip`` or ``xz``. Only the last ``max_segments`` closed segments are kept.
+
+    The time range and the position in the complete log of all closed segments are
+    recorded in the index file ``{path}.index``, so :func:`read_rotated` can
+    read the stitched log from a point in time without decompressing older segments.
+    A :class:`RotatingFile` opened on an existing ``path`` continues the log.
+
+    :param path: path of the active segment
+    :param max_size: rotate the file before it exceeds this number of bytes.
+        0 disables size based rotation
+    :param max_age: rotate the file after this number of seconds. ``None`` disables
+        time based rotation
+    :param compression: ``"gzip"``, ``"xz"`` or ``None`` to keep closed segments uncompressed
+    :param max_segments: number of closed segments to keep. 0 keeps all segments
+    :param encoding: encoding of the written text
+
+    .. doctest::
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'output.log')
+        >>> log = RotatingFile(path, max_size=8)
+        >>> for i in range(3):
+        ...     _ = log.write(f'line {i}\\n')
+        >>> log.close()
+        >>> sorted(os.listdir(os.path.dirname(path)))
+        ['output.log', 'output.log.000001.gz', 'output.log.000002.gz', 'output.log.index']
+        >>> ''.join(read_rotated(path))
+        'line 0\\nline 1\\nline 2\\n'
+    """
+
+    compressions = {"gzip": ".gz", "xz": ".xz"}
+    """
+    The supported values for the ``compression`` parameter and their file extensions
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_size: int = 100 * 1024 * 1024,
+        max_age: Optional[float] = None,
+        compression: Optional[str] = "gzip",
+        max_segments: int = 0,
+        encoding: str = "utf-8",
+    ):
+        if compression is not None and compression not in self.compressions:
+            raise ValueError(
+                f"compression needs to be one of {tuple(self.compressions)} or None, "
+                f"got '{compression}'"
+            )
+
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compression = compression
+        self.max_segments = max_segments
+        self.encoding = encoding
+        self.closed = False
+
+        self._index = _read_rotation_index(path)
+        self._lock = threading.Lock()
+        self._compress_queue: "Queue[Optional[Tuple[str, str]]]" = Queue()
+        self._compressor: Optional[threading.Thread] = None
+
+        self._file = open(path, "ab")
+        self._size = self._file.tell()
+        self._segment_start = time.time()
+        self._last_write = self._segment_start
+
+    def write(self, text: str) -> int:
+        """
+        Append ``text`` to the active segment, rotating it first if needed
+
+        :return: the number of characters written
+        """
+        data = text.encode(self.encoding)
+        with self._lock:
+            now = time.time()
+            if self._size and (
+                (self.max_size and self._size + len(data) > self.max_size)
+                or (
+                    self.max_age is not None
+                    and now - self._segment_start >= self.max_age
+                )
+            ):
+                self._rotate(now)
+            self._file.write(data)
+            self._size += len(data)
+            self._last_write = now
+        return len(text)
+
+    def flush(self) -> None:
+        """
+        Flush the active segment
+        """
+        with self._lock:
+            self._file.flush()
+
+    def writable(self) -> bool:  # pylint: disable=no-self-use
+        """
+        Files are always writable
+        """
+        return True
+
+    def close(self) -> None:
+        """
+        Close the active segment and wait until all closed segments are compressed
+        """
+        with self._lock:
+            if self.closed:
+                return
+            self._file.close()
+            self.closed = True
+        if self._compressor is not None:
+            self._compress_queue.put(None)
+            self._compressor.join()
+
+    def _rotate(self, now: float) -> None:
+        self._file.close()
+
+        previous = self._index[-1] if self._index else None
+        number = previous["number"] + 1 if previous else 1
+        segment = f"{self.path}.{number:06d}"
+        os.replace(self.path, segment)
+
+        self._index.append(
+            {
+                "number": number,
+                "segment": os.path.basename(segment),
+                "compression": self.compression,
+                "start": self._segment_start,
+                "end": self._last_write,
+                "offset": previous["offset"] + previous["size"] if previous else 0,
+                "size": self._size,
+            }
+        )
+
+        # forget the oldest segments
+        expired: List[Dict[str, Any]] = []
+        if self.max_segments and len(self._index) > self.max_segments:
+            expired = self._index[: -self.max_segments]
+            self._index = self._index[-self.max_segments :]
+        _write_rotation_index(self.path, self._index)
+
+        self._file = open(self.path, "ab")
+        self._size = 0
+        self._segment_start = now
+
+        if self.compression is not None:
+            self._in_background("compress", segment)
+        for entry in expired:
+            self._in_background(
+                "delete", os.path.join(os.path.dirname(self.path), entry["segment"])
+            )
+
+    def _in_background(self, action: str, segment: str) -> None:
+        # deleting is queued as well, so it never races the compression of the segment
+        if self._compressor is None:
+            self._compressor = threading.Thread(
+                target=self._compress_segments, name="pytb-log-compressor", daemon=True
+            )
+            self._compressor.start()
+        self._compress_queue.put((action, segment))
+
+    def _compress_segments(self) -> None:
+        while True:
+            task = self._compress_queue.get()
+            if task is None:
+                return
+            action, segment = task
+
+            if action == "delete":
+                for suffix in ("", *self.compressions.values()):
+                    if os.path.exists(segment + suffix):
+                        os.remove(segment + suffix)
+                continue
+
+            compressed = segment + self.compressions[cast(str, self.compression)]
+            opener = gzip.open if self.compression == "gzip" else lzma.open
+            with open(segment, "rb") as source, opener(
+                f"{compressed}.tmp", "wb"
+            ) as target:
+                shutil.copyfileobj(source, target, 1024 * 1024)
+            # readers either see the complete compressed segment or the uncompressed one
+            os.replace(f"{compressed}.tmp", compressed)
+            os.remove(segment)
+
+
+def _read_rotation_index(path: str) -> List[Dict[str, Any]]:
+    """
+    Read the index of the segments of the :class:`RotatingFile` at ``path``
+    """
+    try:
+        with open(f"{path}.index", encoding="utf-8") as index_file:
+            return cast(List[Dict[str, Any]], json.load(index_file))
+    except FileNotFoundError:
+        return []
+
+
+def _write_rotation_index(path: str, index: List[Dict[str, Any]]) -> None:
+    """
+    Atomically replace the index of the :class:`RotatingFile` at ``path``
+    """
+    with open(f"{path}.index.tmp", "w", encoding="utf-8") as index_file:
+        json.dump(index, index_file, indent=1)
+    os.replace(f"{path}.index.tmp", f"{path}.index")
+
+
+def _open_segment(segment: str, compression: Optional[str]) -> IO[bytes]:
+    """
+    Open a closed segment, compressed or not. The segment may be compressed
+    by a writer in the meantime, so both variants are tried
+    """
+    suffix = RotatingFile.compressions.get(cast(str, compression))
+    candidates = [segment + suffix, segment, segment + suffix] if suffix else [segment]
+    for candidate in candidates:
+        try:
+            if candidate.endswith(".gz"):
+                return cast(IO[bytes], gzip.open(candidate, "rb"))
+            if candidate.endswith(".xz"):
+                return cast(IO[bytes], lzma.open(candidate, "rb"))
+            return open(candidate, "rb")
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(segment)
+
+
+def read_rotated(
+    path: str,
+    since: Optional[float] = None,
+    encoding: str = "utf-8",
+    chunk_size: int = 65536,
+) -> Generator[str, None, None]:
+    """
+    Read the log written by a :class:`RotatingFile` at ``path`` as a single stitched text.
+    Segments that were deleted due to the retention limit are skipped.
+
+    :param since: a timestamp as returned by ``time.time()``. Only read the segments
+        containing output written after this time. The segments before are found
+        in the index and are never opened
+    :param encoding: encoding of the log
+    :param chunk_size: number of bytes read at once
+    :return: a generator of chunks of the stitched log
+    """
+    directory = os.path.dirname(path)
+    segments = [
+        (os.path.join(directory, entry["segment"]), entry["compression"])
+        for entry in _read_rotation_index(path)
+        if since is None or entry["end"] >= since
+    ]
+    segments.append((path, None))
+
+    decoder = codecs.getincrementaldecoder(encoding)("replace")
+    for segment, compression in segments:
+        try:
+            segment_file = _open_segment(segment, compression)
+        except FileNotFoundError:
+            continue
+        with segment_file:
+            for data in iter(partial(segment_file.read, chunk_size), b""):
+                yield decoder.decode(data)
+    yield decoder.decode(b"", True)
+
+
+class CaptureRecord(NamedTuple):
+    """
+    A single write read from a :class:`CaptureLog` by :func:`read_capture_log`
+    """
+
+    time: float
+    """wall clock time of the write as returned by ``time.time()``"""
+    offset: float
+    """seconds since the first record of the log"""
+    stream: int
+    """id of the stream the text was written to, ``1`` for stdout and ``2`` for stderr"""
+    text: str
+    """the written text"""
+
+
+class _CaptureLogStream:
+    """
+    Writes to a :class:`CaptureLog` using a fixed stream id.
+    Returned by :meth:`CaptureLog.stream`
+    """
+
+    def __init__(self, log: "CaptureLog", stream_id: int):
+        self.log = log
+        self.stream_id = stream_id
+
+    @property
+    def closed(self) -> bool:
+        """
+        Whether the underlying log is closed
+        """
+        return self.log.closed
+
+    def write(self, text: str) -> int:
+        """
+        Append ``text`` as a record of this stream
+        """
+        return self.log.write(text, self.stream_id)
+
+    def flush(self) -> None:
+        """
+        Flush the underlying log
+        """
+        self.log.flush()
+
+    def writable(self) -> bool:  # pylint: disable=no-self-use
+        """
+        Streams are always writable
+        """
+        return True
+
+
+class CaptureLog:
+    """
+    A compact binary log that records when and to which stream output was written.
+    It can be used everywhere a file is accepted, e.g. as target of
+    :meth:`redirected_stdstreams`, :meth:`mirrored_stdstreams` or :meth:`captured_fds`.
+    Output of ``stdout`` and ``stderr`` is recorded as stream ``1`` and ``2``.
+
+    Each write is appended as a record of a ``time.monotonic()`` timestamp, the stream
+    id, the length of the payload and the UTF-8 encoded payload itself through a buffered
+    binary file. Every time a log is opened, a clock record relates the monotonic clock
+    to the wall clock, so a log can be appended to by several processes in turn.
+    Use :func:`read_capture_log` or the ``pytb replay`` command to read the log.
+
+    :param path: path of the log. An existing log is appended to
+    :param buffer_size: size of the write buffer in bytes
+
+    .. doctest::
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'output.cap')
+        >>> log = CaptureLog(path)
+        >>> with redirected_stdstreams(log):
+        ...     print('to stdout')
+        ...     print('to stderr', file=sys.stderr)
+        >>> log.close()
+        >>> [(record.stream, record.text) for record in read_capture_log(path)]
+        [(1, 'to stdout'), (1, '\\n'), (2, 'to stderr'), (2, '\\n')]
+    """
+
+    magic = b"PYTBCAP1"
+    """
+    The first bytes of every capture log
+    """
+
+    _header = struct.Struct("<IdB")
+    _clock = struct.Struct("<d")
+    _clock_stream = 255
+
+    def __init__(self, path: str, buffer_size: int = 65536):
+        self.path = path
+        self.closed = False
+
+        self._lock = threading.Lock()
+        self._file = open(path, "ab", buffering=buffer_size)
+        if self._file.tell() == 0:
+            self._file.write(self.magic)
+        self._append(self._clock_stream, self._clock.pack(time.time()))
+
+    def stream(self, stream_id: int) -> TextIO:
+        """
+        Get a writable text stream that records all writes as stream ``stream_id``.
+        ``255`` is reserved for the clock records of the log
+
+        :param stream_id: an id between 0 and 254
+        """
+        if not 0 <= stream_id < self._clock_stream:
+            raise ValueError(
+                f"stream_id needs to be between 0 and {self._clock_stream - 1}, "
+                f"got {stream_id}"
+            )
+        return cast(TextIO, _CaptureLogStream(self, stream_id))
+
+    def write(self, text: str, stream_id: int = 1) -> int:
+        """
+        Append ``text`` as a record of the stream ``stream_id``
+
+        :return: the number of characters written
+        """
+        if text:
+            self._append(stream_id, text.encode("utf-8"))
+        return len(text)
+
+    def _append(self, stream_id: int, payload: bytes) -> None:
+        with self._lock:
+            if self.closed:
+                raise ValueError("I/O operation on closed capture log")
+            self._file.write(
+                self._header.pack(len(payload), time.monotonic(), stream_id)
+            )
+            self._file.write(payload)
+
+    def flush(self) -> None:
+        """
+        Write all buffered records to the file
+        """
+        with self._lock:
+            if not self.closed:
+                self._file.flush()
+
+    def writable(self) -> bool:  # pylint: disable=no-self-use
+        """
+        Logs are always writable
+        """
+        return True
+
+    def close(self) -> None:
+        """
+        Write all buffered records and close the file
+        """
+        with self._lock:
+            if not self.closed:
+                self._file.close()
+                self.closed = True
+
+
+def read_capture_log(
+    path: str,
+    start: Optional[float] = None,
+    end: Optional[float] = None,
+    streams: Optional[Sequence[int]] = None,
+) -> Generator[CaptureRecord, None, None]:
+    """
+    Read the records of a :class:`CaptureLog`. The file is memory-mapped, so large logs
+    are read without copying them into memory. A record that was only partially
+    written, e.g. because the writing process was killed, ends the log.
+
+    :param start: only read records written at least this number of seconds
+        after the first record of the log
+    :param end: only read records written at most this number of seconds
+        after the first record of the log
+    :param streams: only read records of these stream ids
+    :return: a generator of :class:`CaptureRecord`
+    """
+    # pylint: disable=protected-access
+    header = CaptureLog._header
+    clock = CaptureLog._clock
+    with open(path, "rb") as log_file:
+        if os.fstat(log_file.fileno()).st_size < len(CaptureLog.magic):
+            raise ValueError(f"{path} is not a capture log")
+
+        with mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[: len(CaptureLog.magic)] != CaptureLog.magic:
+                raise ValueError(f"{path} is not a capture log")
+
+            position = len(CaptureLog.magic)
+            first: Optional[float] = None
+            clock_offset = 0.0
+            while position + header.size <= len(data):
+                length, monotonic, stream_id = header.unpack_from(data, position)
+                position += header.size
+                if position + length > len(data):
+                    break
+                payload_start, position = position, position + length
+
+                if stream_id == CaptureLog._clock_stream:
+                    (wall,) = clock.unpack_from(data, payload_start)
+                    clock_offset = wall - monotonic
+                    continue
+
+                timestamp = monotonic + clock_offset
+                if first is None:
+                    first = timestamp
+                offset = timestamp - first
+                if start is not None and offset < start:
+                    continue
+                if end is not None and offset > end:
+                    continue
+                if streams is not None and stream_id not in streams:
+                    continue
+                yield CaptureRecord(
+                    timestamp,
+                    offset,
+                    stream_id,
+                    data[payload_start:position].decode("utf-8", "replace"),
+                )
+
+
+AnyTextIOType = Union[str, TextIO, Tee, CaptureBuffer, RotatingFile, CaptureLog]
 
 
 @contextmanager
@@ -126,14 +1256,27 @@ def _permissive_open(
             file_obj.close()
 
 
+_STREAM_IDS = {"stdout": 1, "stderr": 2}
+
+
+def _stream_sink(out: TextIO, stream_id: int) -> TextIO:
+    """
+    Get the stream of a :class:`CaptureLog` that records output as ``stream_id``.
+    All other files are returned as they are
+    """
+    if isinstance(out, CaptureLog):
+        return out.stream(stream_id)
+    return out
+
+
 @contextmanager
 def _redirect_stream(
     file: AnyTextIOType, module: Any, attr: str
 ) -> Generator[TextIO, None, None]:
     with _permissive_open(file, "w") as out:
+        out = _stream_sink(out, _STREAM_IDS.get(attr, 1))
         old = getattr(module, attr)
         setattr(module, attr, out)
-        sys.stdout = out
         try:
             yield out
         finally:
@@ -180,13 +1323,55 @@ def redirected_stdstreams(file: AnyTextIOType) -> Generator[TextIO, None, None]:
 
     see :meth:`redirected_stdout`
     """
-    with _redirect_stream(file, sys, "stdout") as _redirected_stdout:
-        with _redirect_stream(_redirected_stdout, sys, "stderr") as _redirected_stderr:
-            yield _redirected_stderr
+    with _permissive_open(file, "w") as out:
+        with _redirect_stream(out, sys, "stdout"):
+            with _redirect_stream(out, sys, "stderr") as _redirected_stderr:
+                yield _redirected_stderr
+
+
+@contextmanager
+def _write_behind(
+    stream: TextIO, buffer_size: int, overflow: str
+) -> Generator[TextIO, None, None]:
+    """
+    Put a write-behind buffer of ``buffer_size`` characters in front of ``stream``
+    that is written when the contextmanager exits.
+    Yields ``stream`` itself if ``buffer_size`` is 0
+    """
+    if buffer_size <= 0:
+        yield stream
+        return
+
+    buffered = Tee(stream, buffer_size=buffer_size, overflow=overflow)
+    try:
+        yield cast(TextIO, buffered)
+    finally:
+        buffered._stop_writers()  # pylint: disable=protected-access
+
+
+def _std_sinks(
+    sinks: ExitStack, out: TextIO, buffer_size: int, overflow: str
+) -> Tuple[TextIO, TextIO]:
+    """
+    Create the sinks ``stdout`` and ``stderr`` are mirrored to in ``out``.
+    The sinks are closed when ``sinks`` is closed
+    """
+    out_sink = sinks.enter_context(
+        _write_behind(_stream_sink(out, 1), buffer_size, overflow)
+    )
+    # a capture log records stderr as its own stream, all other files share the sink
+    err_sink = out_sink
+    if isinstance(out, CaptureLog):
+        err_sink = sinks.enter_context(
+            _write_behind(_stream_sink(out, 2), buffer_size, overflow)
+        )
+    return out_sink, err_sink
 
 
 @contextmanager
-def mirrored_stdout(file: AnyTextIOType) -> Generator[TextIO, None, None]:
+def mirrored_stdout(
+    file: AnyTextIOType, buffer_size: int = 0, overflow: str = "block"
+) -> Generator[TextIO, None, None]:
     """
     ContextManager that mirrors stdout to a given file-like object
     and restores the original state when leaving the context
@@ -197,6 +1382,10 @@ def mirrored_stdout(file: AnyTextIOType) -> Generator[TextIO, None, None]:
     :param file: string or file-like object to mirror stdout to.
                  If passed a string, the file is opened for writing and closed
                  after the contextmanager exits
+    :param buffer_size: if set, ``file`` and ``sys.stdout`` are written by background
+        threads through write-behind buffers of this number of characters,
+        see :class:`Tee`. The buffers are written when the contextmanager exits
+    :param overflow: what to do if a write-behind buffer is full, see :class:`Tee`
 
     .. doctest::
 
@@ -207,31 +1396,478 @@ def mirrored_stdout(file: AnyTextIOType) -> Generator[TextIO, None, None]:
         this is written to outfile and stdout
         >>> assert outfile.getvalue() == 'this is written to outfile and stdout\\n'
     """
-    with _permissive_open(file, "w") as out:
-        tee_piece = Tee(sys.stdout, out)
+    with _permissive_open(file, "w") as out, _write_behind(
+        _stream_sink(out, 1), buffer_size, overflow
+    ) as out_sink, _write_behind(sys.stdout, buffer_size, overflow) as stdout_sink:
+        tee_piece = Tee(stdout_sink, out_sink)
         with redirected_stdout(tee_piece) as out:
             yield out
 
 
 @contextmanager
-def mirrored_stdstreams(file: AnyTextIOType) -> Generator[TextIO, None, None]:
+def mirrored_stdstreams(
+    file: AnyTextIOType, buffer_size: int = 0, overflow: str = "block"
+) -> Generator[TextIO, None, None]:
     """
     Version of :meth:`mirrored_stdout` but mirrors ``stderr`` and ``stdout`` to file
 
     see :meth:`mirrored_stdout`
     """
-    with _permissive_open(file, "w") as out:
-        tee_piece_out = Tee(sys.stdout, out)
+    with ExitStack() as sinks:
+        out = sinks.enter_context(_permissive_open(file, "w"))
+        out_sink, err_sink = _std_sinks(sinks, out, buffer_size, overflow)
+        stdout_sink = sinks.enter_context(
+            _write_behind(sys.stdout, buffer_size, overflow)
+        )
+        # a single buffer keeps the order of the output if both streams are the same
+        stderr_sink = stdout_sink
+        if sys.stderr is not sys.stdout:
+            stderr_sink = sinks.enter_context(
+                _write_behind(sys.stderr, buffer_size, overflow)
+            )
+        tee_piece_out = Tee(stdout_sink, out_sink)
         with redirected_stdout(tee_piece_out):
-            tee_piece_err = Tee(sys.stderr, out)
+            tee_piece_err = Tee(stderr_sink, err_sink)
             with redirected_stderr(tee_piece_err):
                 yield out
 
 
+class StreamDispatcher:
+    """
+    A proxy for a text stream that writes everything to the proxied stream and
+    additionally to the capture sinks registered for the current context.
+
+    The sinks are stored in a ``contextvars.ContextVar``. Each thread runs in its own
+    context and ``asyncio`` tasks run in a copy of the context they were created in.
+    Hence, code running in parallel only writes to its own sinks and nested captures
+    add a sink instead of stacking proxies. A write costs a single context lookup
+    plus one write per sink, independent of the number of threads.
+    All other attributes are looked up on the proxied stream.
+
+    :meth:`captured_stdstreams` installs dispatchers as ``sys.stdout`` and ``sys.stderr``
+    on first use and keeps them installed.
+
+    :param target: the proxied stream
+
+    .. doctest::
+
+        >>> import io, threading
+        >>> console, captured = io.StringIO(), io.StringIO()
+        >>> dispatcher = StreamDispatcher(console)
+        >>> with dispatcher.capturing(captured):
+        ...     _ = dispatcher.write('captured\\n')
+        ...     worker = threading.Thread(target=dispatcher.write, args=('other thread\\n',))
+        ...     worker.start()
+        ...     worker.join()
+        >>> captured.getvalue()
+        'captured\\n'
+        >>> console.getvalue()
+        'captured\\nother thread\\n'
+    """
+
+    def __init__(self, target: TextIO):
+        self.target = target
+        self._sinks: ContextVar[Tuple[TextIO, ...]] = ContextVar(
+            "pytb_capture_sinks", default=()
+        )
+
+    def write(self, text: str) -> int:
+        """
+        Write ``text`` to the proxied stream and all sinks of the current context
+
+        :return: the number of characters written to the proxied stream
+        """
+        written = self.target.write(text)
+        for sink in self._sinks.get():
+            sink.write(text)
+        return written
+
+    def flush(self) -> None:
+        """
+        Flush the proxied stream and all sinks of the current context
+        """
+        self.target.flush()
+        for sink in self._sinks.get():
+            sink.flush()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.target, name)
+
+    @contextmanager
+    def capturing(self, sink: TextIO) -> Generator[TextIO, None, None]:
+        """
+        ContextManager that additionally writes everything written
+        in the current context to ``sink``
+
+        :param sink: a writable file-like object
+        """
+        token = self._sinks.set(self._sinks.get() + (sink,))
+        try:
+            yield sink
+        finally:
+            self._sinks.reset(token)
+
+
+_dispatcher_lock = threading.Lock()
+
+
+def _installed_dispatcher(attr: str) -> StreamDispatcher:
+    """
+    Get the :class:`StreamDispatcher` installed as ``sys.{attr}``.
+    Installs a dispatcher for the current stream if there is none yet
+    """
+    with _dispatcher_lock:
+        stream = getattr(sys, attr)
+        if not isinstance(stream, StreamDispatcher):
+            stream = StreamDispatcher(stream)
+            setattr(sys, attr, stream)
+        return stream
+
+
+@contextmanager
+def captured_stdstreams(
+    file: AnyTextIOType, buffer_size: int = 0, overflow: str = "block"
+) -> Generator[TextIO, None, None]:
+    """
+    Version of :meth:`mirrored_stdstreams` that only captures the output
+    of the current thread (or ``asyncio`` task) into ``file``.
+
+    ``sys.stdout`` and ``sys.stderr`` are replaced by :class:`StreamDispatcher`
+    proxies once. Leaving the context only unregisters ``file``, so blocks running
+    concurrently in a thread pool can each capture their own output. Output of
+    threads started within the block is not captured unless they run in a copy
+    of the context (see ``contextvars.copy_context``).
+
+    :param file: string or file-like object to mirror the output to.
+                 If passed a string, the file is opened for writing and closed
+                 after the contextmanager exits
+    :param buffer_size: if set, ``file`` is written by a background thread
+        through a write-behind buffer of this number of characters, see :class:`Tee`
+    :param overflow: what to do if the write-behind buffer is full, see :class:`Tee`
+
+    .. doctest::
+
+        >>> import io
+        >>> from concurrent.futures import ThreadPoolExecutor
+        >>> def task(name):
+        ...     outfile = io.StringIO()
+        ...     with captured_stdstreams(outfile):
+        ...         print(f'output of {name}')
+        ...     return outfile.getvalue()
+        >>> with redirected_stdstreams(io.StringIO()), ThreadPoolExecutor(2) as pool:
+        ...     outputs = list(pool.map(task, ['task 1', 'task 2']))
+        >>> outputs
+        ['output of task 1\\n', 'output of task 2\\n']
+    """
+    with ExitStack() as sinks:
+        out = sinks.enter_context(_permissive_open(file, "w"))
+        out_sink, err_sink = _std_sinks(sinks, out, buffer_size, overflow)
+        sinks.enter_context(_installed_dispatcher("stdout").capturing(out_sink))
+        sinks.enter_context(_installed_dispatcher("stderr").capturing(err_sink))
+        yield out
+
+
+def _flush_std_streams() -> None:
+    """
+    Write the buffered output of the python level standard streams to their file descriptors
+    """
+    for stream in (sys.stdout, sys.stderr, sys.__stdout__, sys.__stderr__):
+        if stream is None:
+            # the interpreter runs without a console
+            continue
+        # pylint: disable=broad-except
+        try:
+            stream.flush()
+        except Exception:
+            # closed or replaced by an object that can't be flushed
+            pass
+
+
+def _write_all(fd: int, data: Union[bytes, memoryview]) -> None:
+    """
+    Write all of ``data`` to the file descriptor ``fd``
+    """
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view) :]
+
+
+class _FdCapture:
+    """
+    Redirects file descriptors into pipes and drains them on a background thread.
+    Used by :meth:`captured_fds`
+    """
+
+    def __init__(
+        self,
+        out: TextIO,
+        fds: Sequence[int],
+        mirror: bool,
+        chunk_size: int,
+        encoding: str,
+    ):
+        self.out: Optional[TextIO] = out
+        self.mirror = mirror
+        # a capture log records the output of each file descriptor as its own stream
+        self._sinks = {fd: _stream_sink(out, fd) for fd in fds}
+        self.chunk_size = chunk_size
+
+        self._selector = selectors.DefaultSelector()
+        self._saved_fds: Dict[int, int] = {}
+
+        _flush_std_streams()
+        for fd in fds:
+            read_end, write_end = os.pipe()
+            self._saved_fds[fd] = os.dup(fd)
+            os.dup2(write_end, fd)
+            os.close(write_end)
+            decoder = codecs.getincrementaldecoder(encoding)("replace")
+            self._selector.register(read_end, selectors.EVENT_READ, (fd, decoder))
+
+        self._thread = threading.Thread(
+            target=self._run, name="pytb-fd-capture", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self, timeout: float) -> None:
+        """
+        Restore the original file descriptors and wait up to ``timeout`` seconds
+        until all captured output is drained. Child processes may keep the pipes open,
+        their output is only mirrored after the capture was stopped
+        """
+        _flush_std_streams()
+        # replacing the write end of the pipe closes it, the reader sees EOF
+        # as soon as no other process holds a copy of it
+        for fd, saved_fd in self._saved_fds.items():
+            os.dup2(saved_fd, fd)
+
+        self._thread.join(timeout)
+        self.out = None
+
+    def _run(self) -> None:
+        try:
+            while self._selector.get_map():
+                for key, _ in self._selector.select():
+                    self._drain(key)
+        finally:
+            self._selector.close()
+            for saved_fd in self._saved_fds.values():
+                os.close(saved_fd)
+
+    def _drain(self, key: selectors.SelectorKey) -> None:
+        fd, decoder = key.data
+        data = os.read(key.fd, self.chunk_size)
+        final = not data
+        if final:
+            self._selector.unregister(key.fd)
+            os.close(key.fd)
+        elif self.mirror:
+            _write_all(self._saved_fds[fd], data)
+
+        text = decoder.decode(data, final)
+        if text and self.out is not None:
+            self._sinks[fd].write(text)
+
+
+@contextmanager
+def captured_fds(
+    file: AnyTextIOType,
+    fds: Sequence[int] = (1, 2),
+    mirror: bool = True,
+    chunk_size: int = 65536,
+    encoding: str = "utf-8",
+    drain_timeout: float = 1.0,
+) -> Generator[TextIO, None, None]:
+    """
+    ContextManager that captures everything written to the file descriptors ``fds``
+    (``stdout`` and ``stderr`` by default) into ``file``.
+
+    In contrast to :meth:`mirrored_stdstreams`, this also captures output that does
+    not go through ``sys.stdout`` and ``sys.stderr``, e.g. output of C extensions,
+    ``os.write`` calls and child processes. Each file descriptor is replaced by a
+    pipe using ``os.dup2``. A background thread reads the pipes in chunks of up to
+    ``chunk_size`` bytes, writes them to the original file descriptors if ``mirror``
+    is set, and writes the decoded text to ``file`` once per chunk.
+
+    :param file: string or file-like object to write the captured output to.
+                 If passed a string, the file is opened for writing and closed
+                 after the contextmanager exits
+    :param fds: the file descriptors to capture
+    :param mirror: if ``True``, also write the captured output to the original file descriptors
+    :param chunk_size: maximum number of bytes read from a pipe at once
+    :param encoding: encoding used to decode the captured bytes. Undecodable bytes are replaced
+    :param drain_timeout: maximum number of seconds to wait for the remaining output when
+        leaving the context. Child processes that are still running keep the pipes
+        open, their later output is only mirrored
+
+    .. doctest::
+
+        >>> import io, os
+        >>> outfile = io.StringIO()
+        >>> with captured_fds(outfile, mirror=False):
+        ...     _ = os.write(1, b'written to the file descriptor\\n')
+        >>> outfile.getvalue()
+        'written to the file descriptor\\n'
+    """
+    with _permissive_open(file, "w") as out:
+        capture = _FdCapture(out, fds, mirror, chunk_size, encoding)
+        try:
+            yield out
+        finally:
+            capture.stop(drain_timeout)
+
+
+class TerminalRenderer:
+    r"""
+    Incrementally render text like an (potentially infinitely wide) terminal would.
+
+    The renderer is a writable stream, so chunks of text can be fed to it as they are
+    produced (e.g. as a sink of a :class:`Tee`). Each chunk is processed in time linear
+    to its length. Only the line under the cursor is kept in a mutable buffer,
+    all other lines are stored as strings.
+
+    The following control characters and VT100 escape sequences are supported:
+
+    - ``\r`` moves the cursor to the start of the line, so subsequent
+      characters overwrite the previous
+    - ``\n`` moves the cursor to the start of the next line
+    - ``\b`` moves the cursor one character to the left
+    - ``ESC[K``, ``ESC[1K`` and ``ESC[2K`` erase the line right of the cursor,
+      left of the cursor or the whole line
+    - ``ESC[nA``, ``ESC[nB`` move the cursor ``n`` lines up or down
+      (used to draw multiple progressbars at once)
+    - ``ESC[nC``, ``ESC[nD`` move the cursor ``n`` characters right or left
+
+    All other escape sequences (e.g. colors) are dropped.
+
+    .. doctest::
+
+        >>> renderer = TerminalRenderer()
+        >>> for progress in range(0, 101, 10):
+        ...     _ = renderer.write(f'\r{progress}%')
+        >>> _ = renderer.write('\nbar 1\nbar 2\x1b[A\rBAR')
+        >>> print(renderer.getvalue())
+        100%
+        BAR 1
+        bar 2
+    """
+
+    _control_sequence = re.compile(
+        r"(\x1b\[[0-9;?]*[ -/]*[@-~]|\x1b[@-Z\\-_]|[\r\n\b])"
+    )
+    _incomplete_sequence = re.compile(r"\x1b(\[[0-9;?]*[ -/]*)?$")
+
+    def __init__(self) -> None:
+        self._lines: List[str] = [""]
+        self._row = 0
+        self._line: List[str] = []
+        self._col = 0
+        self._pending = ""
+
+    def write(self, text: str) -> int:
+        """
+        Feed a chunk of text to the renderer. Escape sequences may be split
+        across multiple chunks
+
+        :return: the number of characters consumed
+        """
+        consumed = len(text)
+        text = self._pending + text
+        self._pending = ""
+
+        incomplete = self._incomplete_sequence.search(text)
+        if incomplete is not None:
+            self._pending = incomplete.group(0)
+            text = text[: incomplete.start()]
+
+        for token in self._control_sequence.split(text):
+            if not token:
+                continue
+            if token == "\r":
+                self._col = 0
+            elif token == "\n":
+                self._move_to_row(self._row + 1)
+                self._col = 0
+            elif token == "\b":
+                self._col = max(0, self._col - 1)
+            elif token[0] == "\x1b":
+                self._escape_sequence(token)
+            else:
+                self._put(token)
+
+        return consumed
+
+    def _put(self, text: str) -> None:
+        if self._col > len(self._line):
+            self._line.extend(" " * (self._col - len(self._line)))
+        self._line[self._col : self._col + len(text)] = text
+        self._col += len(text)
+
+    def _move_to_row(self, row: int) -> None:
+        self._lines[self._row] = "".join(self._line)
+        self._row = max(0, row)
+        while len(self._lines) <= self._row:
+            self._lines.append("")
+        self._line = list(self._lines[self._row])
+
+    def _escape_sequence(self, sequence: str) -> None:
+        command = sequence[-1]
+        arguments = sequence[2:-1]
+        count = int(arguments) if arguments.isdigit() else 1
+
+        if command == "K":
+            if arguments in ("", "0"):
+                del self._line[self._col :]
+            elif arguments == "1":
+                # the character under the cursor is erased as well
+                erased = min(self._col + 1, len(self._line))
+                self._line[:erased] = " " * erased
+            elif arguments == "2":
+                self._line.clear()
+        elif command == "A":
+            self._move_to_row(self._row - count)
+        elif command == "B":
+            self._move_to_row(self._row + count)
+        elif command == "C":
+            self._col += count
+        elif command == "D":
+            self._col = max(0, self._col - count)
+
+    def getvalue(self, maxwidth: int = -1) -> str:
+        """
+        Get the rendered text
+
+        :param maxwidth: if > 0, wrap lines longer than ``maxwidth`` characters.
+            Existing line breaks are kept
+        """
+        lines = list(self._lines)
+        lines[self._row] = "".join(self._line)
+
+        if maxwidth > 0:
+            lines = [
+                line[start : start + maxwidth]
+                for line in lines
+                for start in range(0, max(len(line), 1), maxwidth)
+            ]
+        return "\n".join(lines)
+
+    def flush(self) -> None:
+        """
+        Does nothing, the rendered text is always up to date
+        """
+
+    def writable(self) -> bool:  # pylint: disable=no-self-use
+        """
+        The renderer is always writable
+        """
+        return True
+
+
 def render_text(text: str, maxwidth: int = -1) -> str:
     r"""
     Attempt to render a text like an (potentiall infinitely wide)
-    terminal would.
+    terminal would. See :class:`TerminalRenderer` for the supported
+    control characters.
 
     Thus carriage-returns move the cursor to the start of
     the line, so subsequent characters overwrite the previous.
@@ -239,35 +1875,12 @@ def render_text(text: str, maxwidth: int = -1) -> str:
     .. doctest::
 
         >>> render_text('asd\rbcd\rcde\r\nqwe\rert\n123', maxwidth=2)
-        'cd\ne \ner\nt \n12\n3'
+        'cd\ne\ner\nt\n12\n3'
 
     :param text: Input text to render
-    :param maxwidth: if > 0, wrap the text to the specified maximum length
-        using the textwrapper library
-    """
-    # create a buffer for the rendered ouput text
-    outtext = StringIO()
-    for char in text:
-        if char == "\r":
-            # seek to one character past the last new line in
-            # the current rednered text. This woks nicely because
-            # rfind will return -1 if no newline is found this
-            # this will seek to the beginning of the stream
-            outtext.seek(outtext.getvalue().rfind("\n") + 1)
-
-            # continue to the next character, dont write he carriage return
-            continue
-        if char == "\n":
-            # a newline moves the cursor to the end of he buffer
-            # the newline itself is written below
-            outtext.seek(len(outtext.getvalue()))
-
-        # write he current character to the buffer
-        outtext.write(char)
-
-    rendered_text = outtext.getvalue()
-
-    # connditionnally wrap the text after maxwidth characters
-    if maxwidth > 0:
-        rendered_text = textwrap.fill(rendered_text, maxwidth)
-    return rendered_text
+    :param maxwidth: if > 0, wrap lines longer than ``maxwidth`` characters.
+        Existing line breaks are kept
+    """
+    renderer = TerminalRenderer()
+    renderer.write(text)
+    return renderer.getvalue(maxwidth)
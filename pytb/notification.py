@@ -3,11 +3,29 @@ Automatic task progress and monitoring notification via E-Mail.
 Especially useful to supervise long-running tasks
 """
 
+import os
+import re
+import sys
+import json
+import socket
+import hashlib
+import tempfile
+import zlib
+import atexit
+import http.client
 import smtplib
+import sqlite3
 import logging
 import inspect
 import linecache
+import traceback
+import heapq
 import threading
+import itertools
+import time
+import weakref
+from array import array
+from queue import Queue, Full, Empty
 from typing import (
     Union,
     Any,
@@ -15,20 +33,44 @@ from typing import (
     Generator,
     ContextManager,
     Sequence,
+    Iterable,
+    Iterator,
+    Callable,
+    Mapping,
+    List,
     IO,
+    Dict,
+    Tuple,
+    Type,
     TypeVar,
+    Generic,
+    NamedTuple,
     cast,
 )
 from types import FrameType
-from datetime import timedelta
+from datetime import datetime, timedelta
 from socket import getfqdn
+from urllib.parse import urlsplit, urlunsplit
 from contextlib import contextmanager, nullcontext
+from functools import lru_cache, partial
+from concurrent.futures import (
+    CancelledError,
+    Future,
+    TimeoutError as FutureTimeoutError,
+)
+from email import message_from_bytes, policy as email_policy
 from email.message import EmailMessage
-from io import StringIO  # pylint: disable=no-name-in-module
 from textwrap import dedent
 
-from pytb.config import current_config
-from pytb.io import mirrored_stdstreams, render_text
+from pytb.config import get_config
+from pytb.io import (
+    captured_stdstreams,
+    mirrored_stdstreams,
+    captured_fds,
+    render_text,
+    CaptureBuffer,
+    CaptureSnapshot,
+)
 
 # Union type for a general time interval in (fractional) seconds
 _Interval = Union[int, float, timedelta]
@@ -36,6 +78,20 @@ _Interval = Union[int, float, timedelta]
 # Generic Type Variable to indicate Type of Iterable
 _IterType = TypeVar("_IterType")
 
+# Type Variable of the objects tracked by an _ExitFlushRegistry
+_Tracked = TypeVar("_Tracked")
+
+
+def _interval_seconds(interval: _Interval) -> float:
+    """
+    Convert an interval into a number of (fractional) seconds
+
+    :param interval: ``float``, ``int`` or ``datetime.timedelta`` object
+    """
+    if isinstance(interval, timedelta):
+        return interval.total_seconds()
+    return float(interval)
+
 
 def _get_caller_code_fragment(caller_frame: FrameType, context_size: int = 3) -> str:
     """
@@ -82,7 +138,39 @@ def _get_caller_code_fragment(caller_frame: FrameType, context_size: int = 3) ->
     """
     filename = caller_frame.f_code.co_filename
     lineno = caller_frame.f_lineno
+
+    try:
+        mtime = os.stat(filename).st_mtime_ns
+    except OSError:
+        # not a file on disk (e.g. a doctest or an interactive session),
+        # so we can not tell if the source changed
+        return _render_code_fragment(filename, lineno, context_size)
+
+    return _cached_code_fragment(filename, lineno, mtime, context_size)
+
+
+# mtime is only used as part of the cache key
+@lru_cache(maxsize=256)
+def _cached_code_fragment(  # pylint: disable=unused-argument
+    filename: str, lineno: int, mtime: int, context_size: int
+) -> str:
+    """
+    Memoized version of :func:`_render_code_fragment`. The modification time
+    of the file is part of the cache key, so a changed file is read again
+    """
+    # drop the lines of the old file version from the linecache
+    linecache.checkcache(filename)
+    return _render_code_fragment(filename, lineno, context_size)
+
+
+def _render_code_fragment(filename: str, lineno: int, context_size: int) -> str:
+    """
+    Create the code block for :func:`_get_caller_code_fragment`
+    """
     caller_file_lines = linecache.getlines(filename)
+    if not caller_file_lines:
+        # the source is not available (e.g. the file was removed)
+        return ""
 
     def get_indentation(line: str) -> int:
         level = 0
@@ -95,8 +183,9 @@ def _get_caller_code_fragment(caller_frame: FrameType, context_size: int = 3) ->
 
     levels = [get_indentation(line) for line in caller_file_lines]
 
-    # -1 from lineno because line numbers are 1-indexed
-    block_start = block_end = lineno - 1
+    # -1 from lineno because line numbers are 1-indexed. The file may have been
+    # shortened since the line number was recorded
+    block_start = block_end = max(0, min(lineno, len(levels)) - 1)
 
     # move the start and end line to the block boundaries
     # (next occurence of unindented line)
@@ -104,7 +193,7 @@ def _get_caller_code_fragment(caller_frame: FrameType, context_size: int = 3) ->
         # move up a line
         block_start -= 1
 
-    while len(levels) < block_end and levels[block_end] > 0:
+    while block_end < len(levels) - 1 and levels[block_end] > 0:
         # move down a line
         block_end += 1
 
@@ -145,310 +234,2348 @@ def _get_caller_frame(level: int) -> Optional[FrameType]:
     return caller_frame
 
 
-class Notify:
+class _FrameSnapshot:
     """
-    A :class:`Notify` object captures the basic configuration of how a
-    notification should be handled.
+    A frozen copy of the parts of a stack frame that are needed to render the
+    code block of a notification.
 
-    The methods :meth:`when_done`, :meth:`every` and :meth:`when_stalled`
-    are reenterable context managers. Thus a single :class:`Notify` object
-    can be reused at several places and different context-managers can be
-    reused in the same context.
+    Notifications that are delivered asynchronously are rendered after the
+    calling code moved on, so the original frame would point to a different line
+    by then. The snapshot quacks like a :class:`types.FrameType` as far as
+    :func:`_get_caller_code_fragment` is concerned.
+    """
 
-    Overwrite the method :meth:`_send_notification` in a derived class to
-    specify a custom handling of the notifications
+    __slots__ = ("f_code", "f_lineno")
 
-    :param task: A short description of the monitored block.
-    :param render_outputs: If true, prerender the oputputs using :meth:`pytb.io.render_text`
-        This may be useful if the captured codeblock produces progressbars using carriage returns
+    def __init__(self, frame: FrameType):
+        self.f_code = frame.f_code
+        self.f_lineno = frame.f_lineno
+
+    @classmethod
+    def from_location(cls, filename: str, lineno: int) -> "_FrameSnapshot":
+        """
+        Create a snapshot pointing to a line of a file without an actual frame
+        (e.g. for notifications received from other processes)
+        """
+        snapshot = cls.__new__(cls)
+        # an empty code object is the cheapest way to get a code object for a filename
+        snapshot.f_code = compile("", filename, "exec")
+        snapshot.f_lineno = lineno
+        return snapshot
+
+
+def _snapshot_frame(frame: Optional[FrameType]) -> Optional[FrameType]:
     """
+    Freeze the current line of ``frame`` (see :class:`_FrameSnapshot`)
 
-    def __init__(self, task: str, render_outputs: bool = True):
-        self._logger = logging.getLogger(
-            f"{self.__class__.__module__}.{self.__class__.__name__}"
-        )
+    :param frame: the frame to freeze. ``None`` is passed through
+    """
+    if frame is None:
+        return None
+    return cast(FrameType, _FrameSnapshot(frame))
 
-        self.task = task
-        self.render_outputs = render_outputs
 
-    def now(self, message: str) -> None:
-        """
-        Send a manual notification now. This will use the provided ``message`` as
-        the ``reason`` placeholder. No output can be capured using this function.
+class _QueuedNotification(NamedTuple):
+    """
+    A notification waiting in the queue of a :class:`NotificationDispatcher`
+    """
 
-        :param message: A string used to fill the ``{reason}`` placeholder of the notification
-        """
-        caller_frame = _get_caller_frame(1)
-        self._send_notification(
-            self.task, message, caller_frame, "<output not available>"
-        )
+    notifier: "Notify"
+    task: str
+    reason: str
+    caller_frame: Optional[FrameType]
+    output: str
+    exception: Optional[Exception]
 
-    @contextmanager
-    def when_done(
-        self,
-        only_if_error: bool = False,
-        capture_output: bool = True,
-        caller_frame: Optional[FrameType] = None,
-        reason_prefix: str = "",
-    ) -> Generator[None, None, None]:
-        """
-        Create a context that, when exited, will send notifications.
-        If an unhandled exception is raised during execution, a notification
-        on the failure of the execution is sent. If the context exits cleanly,
-        a notification is only sent if ``only_if_error`` is set to ``False``
 
-        By default, all output to the ``stdio`` and ``stderr`` streams is
-        captured and sent in the notification. If you expect huge amounts of
-        output during the execution of the monitored code, you can disable
-        the capturing with the ``capture_output`` parameter.
+class NotificationDispatcher:
+    """
+    A background worker that delivers notifications off the thread of the monitored code.
 
-        To not spam you with notification when you stop the code execution
-        yourself, ``KeyboardInterrupt`` exceptions will not trigger a notification.
+    :class:`Notify` objects created with ``asynchronous=True`` hand their notifications
+    to the process-wide instance returned by :meth:`instance` instead of calling
+    :meth:`Notify._send_notification` directly. This way a slow or hanging
+    backend (e.g. an unreachable SMTP server) never adds latency to the monitored code
+    or delays the periodic checks of :meth:`Notify.every` and :meth:`Notify.when_stalled`.
 
-        :param only_if_error: if the context manager exits cleanly, do not send
-            any notifications
-        :param capture_output: capture all output to the ``stdout`` and ``stderr``
-            stream and append it to the notification
-        :param caller_frame: the stackframe to use when determining the code block
-            for the notification. If None, the stackframe of the line that called
-            this function is used
-        :param reason_prefix: an additional string that is prepended to the ``reason``
-            placeholder when sending a notification. Used to implement :meth:`on_iteration_of`.
-        """
+    Notifications are delivered one after another in the order they were submitted.
 
-        # if called from user code, the calling frame is unspecified. save it fur future reference
-        if caller_frame is None:
-            # we need to go 2 frames up because the direct parent is the
-            # contextmanagers ``__enter__`` method`
-            caller_frame = _get_caller_frame(2)
+    :param max_queue_size: maximum number of notifications waiting for delivery.
+        A value <= 0 creates an unbounded queue
+    :param overflow: what to do when submitting to a full queue. ``"block"`` waits
+        for a free slot, ``"drop"`` discards the new notification
+    :param block_timeout: maximum number of seconds to wait for a free slot if
+        ``overflow`` is ``"block"``. The notification is dropped after the timeout.
+        ``None`` waits forever
 
-            # only print the debug message when this context is not invoked
-            # from another context in this notifier
-            self._logger.info(f"Entering when-done Context")
+    .. testsetup:: *
 
-        output_buffer = StringIO()
-        output_handler = cast(
-            ContextManager[None],
-            mirrored_stdstreams(output_buffer) if capture_output else nullcontext(),
-        )
+        from pytb.notification import NotificationDispatcher, NotifyViaStream
 
-        exception = None
+    .. doctest::
 
-        # pylint: disable=broad-except
-        try:
-            with output_handler:
-                yield
-        except Exception as current_exception:
-            exception = current_exception
+        >>> import io
+        >>> dispatcher = NotificationDispatcher(max_queue_size=10)
+        >>> stream = io.StringIO()
+        >>> notify = NotifyViaStream("task", stream)
+        >>> notify.notification_template = "{task} {reason}"
+        >>> dispatcher.submit(notify, "task", "done", None, "")
+        True
+        >>> dispatcher.flush()
+        True
+        >>> stream.getvalue()
+        'task done'
+        >>> dispatcher.shutdown()
+    """
 
-        output = (
-            output_buffer.getvalue()
-            if capture_output
-            else "<output capturing disabled>"
-        )
+    overflow_policies = ("block", "drop")
+    """
+    The supported values for the ``overflow`` parameter
+    """
 
-        if exception is None and only_if_error:
-            self._logger.info(
-                f"Notification context left without error. Not firing notification"
-            )
-            return
+    _instance: Optional["NotificationDispatcher"] = None
+    _instance_lock = threading.Lock()
 
-        if exception is not None:
-            self._send_notification(
-                self.task,
-                f"{reason_prefix} failed".lstrip(),
-                caller_frame,
-                output,
-                exception,
+    def __init__(
+        self,
+        max_queue_size: int = 100,
+        overflow: str = "block",
+        block_timeout: Optional[float] = None,
+    ):
+        if overflow not in self.overflow_policies:
+            raise ValueError(
+                f"overflow needs to be one of {self.overflow_policies}, got '{overflow}'"
             )
-            raise exception
 
-        self._send_notification(
-            self.task, f"{reason_prefix} done".lstrip(), caller_frame, output
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
         )
 
-    @contextmanager
-    def every(
-        self,
-        interval: _Interval,
-        incremental_output: bool = False,
-        caller_frame: Optional[FrameType] = None,
-    ) -> Generator[None, None, None]:
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.dropped = 0
         """
-        Send out notifications with a fixed interval to receive progress updates.
-        This contextmanager wraps a :meth:`when_done`, so it is guaranteed to send
-        to notify at least once upon task completion or error.
-
-        :param interval: ``float``, ``int`` or ``datetime.timedelta`` object representing the
-            number of seconds between notifications
-        :param incremental_output: Only send incremental output summaries with each update.
-            If ``False`` the complete captured output is sent each time
-        :param caller_frame: the stackframe to use when determining the code block for
-            the notification. If None, the stackframe of the line that called this
-            function is used
+        Number of notifications that were discarded because the queue was full
         """
 
-        # if called from user code, the calling frame is unspecified. save it fur future reference
-        if caller_frame is None:
-            # we need to go 2 frames up because the direct parent
-            # is the contextmanagers ``__enter__`` method`
-            caller_frame = _get_caller_frame(2)
-
-        output_buffer = StringIO()
-        output_handler = mirrored_stdstreams(output_buffer)
+        self._pid = os.getpid()
+        self._queue: "Queue[Optional[_QueuedNotification]]" = Queue(
+            max(0, max_queue_size)
+        )
 
-        def send_progress() -> None:
-            self._logger.info("sending out scheduled notifications")
-            output = output_buffer.getvalue()
-            # clear the output buffer between progress notification
-            # if we only should send incremental updates of the output
-            if incremental_output:
-                output_buffer.truncate(0)
+        # number of notifications that were submitted but not yet delivered
+        self._pending = 0
+        self._idle = threading.Condition()
 
-            self._send_notification(self.task, "progress update", caller_frame, output)
+        self._worker = threading.Thread(
+            target=self._run, name="pytb-notification-dispatcher", daemon=True
+        )
+        self._worker.start()
 
-        progress_sender = Timer(send_progress)
-        progress_sender.call_every(interval)
+    @classmethod
+    def instance(cls) -> "NotificationDispatcher":
+        """
+        Get the dispatcher of this process. The dispatcher is created on first use
+        from the ``dispatch_*`` options of the effective ``.pytb.conf`` s ``notify`` section.
+        When the interpreter exits, all queued notifications are delivered
+        (waiting at most ``dispatch_flush_timeout`` seconds).
 
-        try:
-            with self.when_done(False, True, caller_frame=caller_frame):
-                with output_handler:
-                    yield
-        finally:
-            # stop the scheduled sending of progress updates
-            progress_sender.stop()
+        A forked child process gets its own dispatcher as the worker thread
+        of the parent does not survive the fork.
+        """
+        with cls._instance_lock:
+            # pylint: disable=protected-access
+            if cls._instance is None or cls._instance._pid != os.getpid():
+                notify_config = get_config()["notify"]
+                cls._instance = cls(
+                    max_queue_size=int(notify_config["dispatch_queue_size"]),
+                    overflow=notify_config["dispatch_overflow"],
+                )
+                atexit.register(
+                    cls._instance.shutdown,
+                    float(notify_config["dispatch_flush_timeout"]),
+                )
+            return cls._instance
 
-    @contextmanager
-    def when_stalled(
+    def submit(
         self,
-        timeout: _Interval,
-        capture_output: bool = True,
-        caller_frame: Optional[FrameType] = None,
-    ) -> Generator[None, None, None]:
+        notifier: "Notify",
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+    ) -> bool:
         """
-        Monitor the output of the code bock to determine a possible stall of the execution.
-        The execution is considered to be stalled when no new output is produced within
-        ``timeout`` seconds.
+        Queue a notification for delivery via ``notifier._send_notification()``.
+        All other parameters are passed to this method.
 
-        Only a single notification is sent each time a stall is detected.
-        If a stall notification was sent previously, new output will cause a notification to
-        be sent that the stall was resolved.
+        :return: ``False`` if the notification was dropped because the queue is full
+        """
+        notification = _QueuedNotification(
+            notifier, task, reason, caller_frame, output, exception
+        )
 
-        Contrary to the :meth:`every` method, this does not wrap the context into a
-        :meth:`when_done` function, thus it may never send a notification. If you want,
-        you can simply use the same :class:`Notify` to create mutliple contexts:
+        with self._idle:
+            self._pending += 1
 
-        .. code-block:: python
+        try:
+            if self.overflow == "block":
+                self._queue.put(notification, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(notification)
+        except Full:
+            self._mark_done()
+            self.dropped += 1
+            self._logger.warning(
+                f"notification queue is full, dropping notification '{task} {reason}'"
+            )
+            return False
 
-            with notify.when_stalled(timeout), notify.when_done():
-                # execute some potentially long-running process
+        return True
 
-        However, it will always send a notification if the code block  exits with an exception.
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued notifications are delivered
 
-        :param timeout: maximum number of seconds where no new output is produced
-            before the code block is considiered to be stalled
-        :param capture_output: append all output to ``stdout`` and ``stderr`` to the notification
-        :param caller_frame: the stackframe to use when determining the code block for
-            the notification. If None, the stackframe of the line that called this
-            function is used
+        :param timeout: maximum number of seconds to wait. ``None`` waits forever
+        :return: ``True`` if the queue was drained within the timeout
         """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
 
-        # if called from user code, the calling frame is unspecified. save it fur future reference
-        if caller_frame is None:
-            # we need to go 2 frames up because the direct parent is
-            # the contextmanagers ``__enter__`` method`
-            caller_frame = _get_caller_frame(2)
+    def shutdown(self, timeout: Optional[float] = None) -> None:
+        """
+        Deliver all queued notifications and stop the worker thread.
+        No notifications can be submitted after calling this method.
 
-        output_buffer = StringIO()
-        output_handler = mirrored_stdstreams(output_buffer)
+        :param timeout: maximum number of seconds to wait for queued notifications
+            to be delivered. ``None`` waits forever
+        """
+        if not self.flush(timeout):
+            self._logger.warning(
+                f"{self._pending} notifications were not delivered before shutdown"
+            )
+            return
 
-        last_output = output_buffer.getvalue()
-        was_stalled = False
+        self._queue.put(None)
+        self._worker.join(timeout)
 
-        def check_stalled() -> None:
-            nonlocal last_output, was_stalled
+    def _mark_done(self) -> None:
+        with self._idle:
+            self._pending -= 1
+            if self._pending == 0:
+                self._idle.notify_all()
 
-            self._logger.info("Checking for stalled code block")
+    def _run(self) -> None:
+        while True:
+            notification = self._queue.get()
+            if notification is None:
+                break
 
-            output = output_buffer.getvalue()
-            output_in_notification = (
-                output_buffer.getvalue()
-                if capture_output
-                else "<output capturing disabled>"
-            )
-            if output == last_output and not was_stalled:
-                # we're probably stalled. send out a notification
-                self._send_notification(
-                    self.task, "probably stalled", caller_frame, output_in_notification
-                )
-                was_stalled = True
-            elif was_stalled:
-                # wrong alert previously, send a notification that everything is ok again
-                self._send_notification(
-                    self.task, "no longer stalled", caller_frame, output_in_notification
+            # pylint: disable=broad-except,protected-access
+            try:
+                notification.notifier._send_notification(
+                    notification.task,
+                    notification.reason,
+                    notification.caller_frame,
+                    notification.output,
+                    notification.exception,
                 )
-                was_stalled = False
+            except Exception:
+                # a broken notifier must not kill the worker for all other notifiers
+                self._logger.exception("error during asynchronous notification")
+            finally:
+                self._mark_done()
 
-            last_output = output
 
-        stall_checker = Timer(check_stalled)
-        stall_checker.call_every(timeout)
+# A rate limit given as the maximum number of notifications per time interval
+_RateLimit = Tuple[int, _Interval]
 
-        try:
-            with self.when_done(True, capture_output, caller_frame=caller_frame):
-                with output_handler:
-                    yield
-        finally:
-            # stop the scheduled sending of progress updates
-            stall_checker.stop()
 
-    def on_iteration_of(
-        self,
-        iterable: Sequence[_IterType],
-        capture_output: bool = True,
-        after_every: int = 1,
-        caller_frame: Optional[FrameType] = None,
-    ) -> Generator[_IterType, None, None]:
-        """
-        Send a message *after* each iteration of an iterable. The current iteration
-        and total number of iterations (if the iterable implements :meth:`len`)
-        will be part of the ``reason`` placeholder in the notification.
+class _TokenBucket:
+    """
+    A token bucket holding at most ``capacity`` tokens that are refilled
+    at a constant rate of ``capacity`` tokens per ``period`` seconds.
+    """
 
-        .. code-block:: python
+    def __init__(self, capacity: int, period: float):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
 
-            for x in notify.on_iteration_of(range(5)):
-                # execute some potentially long-running process on x
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._last_refill) * self.rate
+        )
+        self._last_refill = now
 
-        :param iterable: the iterable which items will be yielded by this generator
+    def consume(self) -> bool:
+        """
+        Take a token from the bucket
+
+        :return: ``False`` if the bucket is empty
+        """
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def time_until_available(self) -> float:
+        """
+        Number of seconds until the next token is available
+        """
+        self._refill()
+        return max(0.0, (1 - self._tokens) / self.rate)
+
+
+class _DigestEvent(NamedTuple):
+    """
+    A notification held back by a :class:`_NotificationDigest`
+    """
+
+    timestamp: datetime
+    task: str
+    reason: str
+    caller_frame: Optional[FrameType]
+    output: str
+
+
+class _ExitFlushRegistry(Generic[_Tracked]):
+    """
+    Weakly tracks objects and flushes those that are still alive when the
+    interpreter exits. The exit hook is registered when the first object is added.
+
+    :param flush: called with each tracked object by :meth:`flush_all`
+    """
+
+    def __init__(self, flush: Callable[[_Tracked], Any]):
+        self._flush = flush
+        self._instances: "weakref.WeakSet[_Tracked]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+        self._exit_hook_registered = False
+
+    def add(self, instance: _Tracked) -> None:
+        """
+        Track ``instance`` until it is garbage collected
+        """
+        with self._lock:
+            if not self._exit_hook_registered:
+                atexit.register(self.flush_all)
+                self._exit_hook_registered = True
+            self._instances.add(instance)
+
+    def flush_all(self) -> None:
+        """
+        Flush all tracked objects that are still alive
+        """
+        with self._lock:
+            instances = list(self._instances)
+        for instance in instances:
+            self._flush(instance)
+
+
+class _NotificationDigest:
+    """
+    Coalesces the notifications of a :class:`Notify` into digests.
+
+    Notifications that exceed the rate limit of their kind, and all notifications
+    if a ``window`` is set, are held back. When the window closes (or a token
+    of the rate limit is available again) all held back notifications are
+    delivered as a single digest.
+
+    :param deliver: function used to deliver the notifications
+    :param window: number of seconds to collect notifications into a digest.
+        If ``None``, only rate limited notifications are collected
+    :param rate_limits: mapping of notification kind to a rate limit.
+        The kind ``*`` applies to all kinds without a rate limit of their own
+    """
+
+    _exit_flush: "_ExitFlushRegistry[_NotificationDigest]" = _ExitFlushRegistry(
+        lambda digest: digest.flush()
+    )
+
+    def __init__(
+        self,
+        deliver: Callable[[str, str, Optional[FrameType], str], None],
+        window: Optional[_Interval],
+        rate_limits: Mapping[str, _RateLimit],
+    ):
+        self._deliver = deliver
+        self.window = None if window is None else _interval_seconds(window)
+        self._buckets = {
+            kind: _TokenBucket(capacity, _interval_seconds(period))
+            for kind, (capacity, period) in rate_limits.items()
+        }
+        self._pending: List[_DigestEvent] = []
+        self._flush_handle: Optional[TimerHandle] = None
+        self._lock = threading.Lock()
+
+        # held back notifications are delivered when the interpreter exits
+        _NotificationDigest._exit_flush.add(self)
+
+    @classmethod
+    def flush_all(cls) -> None:
+        """
+        Deliver the held back notifications of all digests that are still alive
+        """
+        cls._exit_flush.flush_all()
+
+    def add(
+        self,
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        kind: str,
+    ) -> None:
+        """
+        Deliver the notification or hold it back for the next digest
+        """
+        bucket = self._buckets.get(kind, self._buckets.get("*"))
+        with self._lock:
+            is_limited = bucket is not None and not bucket.consume()
+            if self.window is None and not is_limited:
+                deliver_now = True
+            else:
+                deliver_now = False
+                self._pending.append(
+                    _DigestEvent(
+                        datetime.now(),
+                        task,
+                        reason,
+                        _snapshot_frame(caller_frame),
+                        output,
+                    )
+                )
+                if self._flush_handle is None:
+                    delay = (
+                        self.window
+                        if self.window is not None
+                        else cast(_TokenBucket, bucket).time_until_available()
+                    )
+                    self._flush_handle = TimerService.instance().call_later(
+                        delay, self.flush
+                    )
+
+        if deliver_now:
+            self._deliver(task, reason, caller_frame, output)
+
+    def flush(self) -> None:
+        """
+        Deliver all held back notifications now
+        """
+        with self._lock:
+            events, self._pending = self._pending, []
+            if self._flush_handle is not None:
+                self._flush_handle.cancel()
+                self._flush_handle = None
+
+        if not events:
+            return
+
+        latest = events[-1]
+        if len(events) == 1:
+            self._deliver(
+                latest.task, latest.reason, latest.caller_frame, latest.output
+            )
+            return
+
+        # name the task of each event if the digest covers multiple tasks
+        tasks = {event.task for event in events}
+        summary = "\n".join(
+            f"{event.timestamp:%Y-%m-%d %H:%M:%S} "
+            + ("" if len(tasks) == 1 else f"{event.task} ")
+            + event.reason
+            for event in events
+        )
+        output = f"{summary}\n\nlatest output:\n{latest.output}"
+        self._deliver(
+            latest.task if len(tasks) == 1 else f"{len(tasks)} tasks",
+            f"digest of {len(events)} notifications",
+            latest.caller_frame,
+            output,
+        )
+
+
+class _ProgressTracker:
+    """
+    Keeps track of the progress of a loop.
+
+    The loop only updates :attr:`count`. The throughput is estimated from
+    periodic calls to :meth:`sample` and exponentially smoothed.
+
+    :param total: the total number of iterations or ``None`` if unknown
+    :param smoothing: weight of the latest sample in the smoothed throughput
+
+    >>> tracker = _ProgressTracker(total=100, smoothing=0.5)
+    >>> tracker.count = 20
+    >>> tracker.sample(now=tracker.start + 10)
+    >>> tracker.count = 50
+    >>> tracker.sample(now=tracker.start + 20)
+    >>> tracker.rate
+    2.5
+    >>> tracker.eta
+    datetime.timedelta(seconds=20)
+    >>> tracker.describe()
+    '50/100 (50.0%) iterations, 2.50 it/s, ETA 0:00:20'
+    """
+
+    def __init__(self, total: Optional[int], smoothing: float):
+        if not 0 < smoothing <= 1:
+            raise ValueError(f"smoothing must be in (0, 1], got {smoothing}")
+
+        self.total = total
+        self.smoothing = smoothing
+        self.count = 0
+        self.rate: Optional[float] = None
+        self.start = time.monotonic()
+        self._last_count = 0
+        self._last_sample = self.start
+
+    def sample(self, now: Optional[float] = None) -> None:
+        """
+        Update the smoothed throughput with the iterations since the last sample
+        """
+        if now is None:
+            now = time.monotonic()
+        count = self.count
+        elapsed = now - self._last_sample
+        if elapsed <= 0:
+            return
+
+        current_rate = (count - self._last_count) / elapsed
+        if self.rate is None:
+            self.rate = current_rate
+        else:
+            self.rate = self.smoothing * current_rate + (1 - self.smoothing) * self.rate
+        self._last_count = count
+        self._last_sample = now
+
+    @property
+    def eta(self) -> Optional[timedelta]:
+        """
+        The estimated remaining time or ``None`` if it can not be estimated
+        """
+        if self.total is None or not self.rate:
+            return None
+        remaining = max(0, self.total - self.count) / self.rate
+        return timedelta(seconds=round(remaining))
+
+    def describe(self) -> str:
+        """
+        Describe the current progress in a single line
+        """
+        if self.total:
+            progress = (
+                f"{self.count}/{self.total} ({self.count / self.total:.1%}) iterations"
+            )
+        else:
+            progress = f"{self.count} iterations"
+
+        rate = "?" if self.rate is None else f"{self.rate:.2f}"
+        eta = self.eta
+        return f"{progress}, {rate} it/s" + ("" if eta is None else f", ETA {eta}")
+
+    def summary(self) -> str:
+        """
+        Describe the finished loop in a single line
+        """
+        elapsed = time.monotonic() - self.start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        return (
+            f"{self.count} iterations done in "
+            f"{timedelta(seconds=round(elapsed))}, {rate:.2f} it/s"
+        )
+
+
+class _TimeSeries:
+    """
+    A ring buffer of the last ``capacity`` samples of a metric backed by an
+    :class:`array.array`, so its memory usage is fixed.
+
+    >>> series = _TimeSeries(3)
+    >>> for value in (1, 2, 3, 4):
+    ...     series.append(value)
+    >>> list(series)
+    [2.0, 3.0, 4.0]
+    """
+
+    __slots__ = ("values", "capacity", "count", "_next")
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.values = array("d", bytes(8 * self.capacity))
+        self.count = 0
+        self._next = 0
+
+    def append(self, value: float) -> None:
+        """
+        Add a sample, overwriting the oldest one if the buffer is full
+        """
+        self.values[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def __iter__(self) -> Iterator[float]:
+        start = (self._next - self.count) % self.capacity
+        for i in range(self.count):
+            yield self.values[(start + i) % self.capacity]
+
+    def __len__(self) -> int:
+        return self.count
+
+
+class ResourceMonitor:
+    """
+    Samples the resource usage of the current process from ``/proc/self``
+    (so this only works on Linux) into fixed size time series.
+
+    The following metrics are recorded: CPU usage, resident memory (RSS), the rate
+    of bytes read and written by I/O system calls, the number of open file
+    descriptors and the number of threads. Each metric keeps the last ``capacity``
+    samples.
+
+    Call :meth:`start` to sample the metrics periodically on the :class:`TimerService`
+    thread. The CPU time spent sampling is tracked in :attr:`overhead`.
+
+    :param capacity: number of samples kept per metric
+
+    .. testsetup:: *
+
+        from pytb.notification import ResourceMonitor
+
+    .. doctest::
+
+        >>> monitor = ResourceMonitor(capacity=10)
+        >>> monitor.sample()
+        >>> monitor.sample()
+        >>> len(monitor.series["threads"])
+        2
+        >>> print(monitor.summary())  # doctest: +ELLIPSIS
+        resource usage (2 samples, ...):
+        cpu      ...
+    """
+
+    metrics = ("cpu", "rss", "io read", "io write", "fds", "threads")
+    """
+    Names of the recorded metrics
+    """
+
+    _units = {
+        "cpu": "%",
+        "rss": "B",
+        "io read": "B/s",
+        "io write": "B/s",
+        "fds": "",
+        "threads": "",
+    }
+
+    _sparkline_characters = "▁▂▃▄▅▆▇█"
+
+    def __init__(self, capacity: int = 360):
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
+        )
+
+        self.series = {metric: _TimeSeries(capacity) for metric in self.metrics}
+        self.sampling_time = 0.0
+        """
+        CPU time spent in :meth:`sample` in seconds
+        """
+
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._started = time.monotonic()
+        self._previous: Optional[Tuple[float, float, int, int]] = None
+        self._handle: Optional[TimerHandle] = None
+
+    @property
+    def overhead(self) -> float:
+        """
+        Fraction of the wall-clock time since the creation of the monitor that
+        was spent sampling
+        """
+        elapsed = time.monotonic() - self._started
+        return self.sampling_time / elapsed if elapsed > 0 else 0.0
+
+    def start(self, interval: _Interval) -> None:
+        """
+        Sample the metrics every ``interval`` seconds on the :class:`TimerService`
+        """
+        self._handle = TimerService.instance().call_every(interval, self.sample)
+
+    def stop(self) -> None:
+        """
+        Stop sampling started with :meth:`start`
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def sample(self) -> None:
+        """
+        Read the current resource usage and append it to the time series
+        """
+        sample_start = time.thread_time()
+        now = time.monotonic()
+
+        with open("/proc/self/stat", "rb") as stat_file:
+            # the process name may contain spaces, the fields start after it
+            stat = stat_file.read().rpartition(b")")[2].split()
+        cpu_seconds = (int(stat[11]) + int(stat[12])) / self._clock_ticks
+
+        with open("/proc/self/statm", "rb") as statm_file:
+            rss = int(statm_file.read().split()[1]) * self._page_size
+
+        io_counters = {}
+        with open("/proc/self/io", "rb") as io_file:
+            for line in io_file:
+                name, _, value = line.partition(b":")
+                io_counters[name] = int(value)
+        read_bytes, write_bytes = io_counters[b"rchar"], io_counters[b"wchar"]
+
+        # the rates can only be computed from the second sample on
+        if self._previous is not None:
+            last_time, last_cpu, last_read, last_write = self._previous
+            elapsed = now - last_time
+            if elapsed > 0:
+                self.series["cpu"].append(100 * (cpu_seconds - last_cpu) / elapsed)
+                self.series["io read"].append((read_bytes - last_read) / elapsed)
+                self.series["io write"].append((write_bytes - last_write) / elapsed)
+        self._previous = (now, cpu_seconds, read_bytes, write_bytes)
+
+        self.series["rss"].append(rss)
+        self.series["fds"].append(len(os.listdir("/proc/self/fd")))
+        self.series["threads"].append(int(stat[17]))
+
+        self.sampling_time += time.thread_time() - sample_start
+
+    @classmethod
+    def _format_value(cls, value: float, unit: str) -> str:
+        if unit in ("B", "B/s"):
+            for prefix in ("", "Ki", "Mi", "Gi"):
+                if abs(value) < 1024:
+                    break
+                value /= 1024
+            else:
+                prefix = "Ti"
+            return f"{value:.1f}{prefix}{unit}"
+        if unit == "%":
+            return f"{value:.1f}%"
+        return f"{value:.0f}"
+
+    @classmethod
+    def sparkline(cls, values: Sequence[float], width: int = 40) -> str:
+        """
+        Render ``values`` as a line of block characters. If there are more
+        than ``width`` values, consecutive values are averaged
+
+        >>> ResourceMonitor.sparkline([0, 1, 2, 3, 4, 5, 6, 7])
+        '▁▂▃▄▅▆▇█'
+        """
+        if not values:
+            return ""
+        if len(values) > width:
+            buckets = [
+                values[len(values) * i // width : len(values) * (i + 1) // width]
+                for i in range(width)
+            ]
+            values = [sum(bucket) / len(bucket) for bucket in buckets]
+
+        low, high = min(values), max(values)
+        steps = len(cls._sparkline_characters) - 1
+        return "".join(
+            cls._sparkline_characters[
+                round((value - low) / (high - low) * steps) if high > low else 0
+            ]
+            for value in values
+        )
+
+    def summary(self, width: int = 40) -> str:
+        """
+        Describe the recorded metrics with their minimum, mean and maximum
+        and a sparkline of ``width`` characters
+        """
+        lines = [
+            f"resource usage ({len(self.series['threads'])} samples, "
+            f"sampling overhead {self.overhead:.4%}):"
+        ]
+        for metric in self.metrics:
+            values = list(self.series[metric])
+            if not values:
+                continue
+            unit = self._units[metric]
+            stats = " / ".join(
+                self._format_value(value, unit)
+                for value in (min(values), sum(values) / len(values), max(values))
+            )
+            lines.append(
+                f"{metric:<8} {self._format_value(values[-1], unit):>10}  "
+                f"min/mean/max {stats:<32} {self.sparkline(values, width)}"
+            )
+        return "\n".join(lines)
+
+
+class ProgressCounter:
+    """
+    A counter that is incremented by monitored code to signal progress
+    to :meth:`Notify.when_stuck`. Incrementing is a single attribute update,
+    so it can be called in tight loops.
+
+    .. testsetup::
+
+        from pytb.notification import ProgressCounter
+
+    .. doctest::
+
+        >>> counter = ProgressCounter()
+        >>> counter.tick()
+        >>> counter.tick(10)
+        >>> counter.value
+        11
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        self.value = 0
+
+    def tick(self, count: int = 1) -> None:
+        """
+        Signal that the monitored code made progress
+        """
+        self.value += count
+
+
+def _stack_signature(frame: Optional[FrameType]) -> Tuple[Tuple[Any, int], ...]:
+    """
+    A hashable representation of the code locations on the stack of ``frame``
+    """
+    signature = []
+    while frame is not None:
+        signature.append((frame.f_code, frame.f_lineno))
+        frame = frame.f_back
+    return tuple(signature)
+
+
+def _format_thread_stacks(frames: Mapping[int, FrameType]) -> str:
+    """
+    Format the current stack of each thread in ``frames`` (as returned by
+    :func:`sys._current_frames`)
+    """
+    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+    stacks = []
+    for thread_id, frame in frames.items():
+        name = thread_names.get(thread_id, "unknown thread")
+        stack = "".join(traceback.format_stack(frame))
+        stacks.append(f"Thread {name} ({thread_id}), most recent call last:\n{stack}")
+    return "\n".join(stacks)
+
+
+class Notify:
+    """
+    A :class:`Notify` object captures the basic configuration of how a
+    notification should be handled.
+
+    The methods :meth:`when_done`, :meth:`every` and :meth:`when_stalled`
+    are reenterable context managers. Thus a single :class:`Notify` object
+    can be reused at several places and different context-managers can be
+    reused in the same context.
+
+    Overwrite the method :meth:`_send_notification` in a derived class to
+    specify a custom handling of the notifications
+
+    :param task: A short description of the monitored block.
+    :param render_outputs: If true, prerender the oputputs using :meth:`pytb.io.render_text`
+        This may be useful if the captured codeblock produces progressbars using carriage returns
+    :param asynchronous: If true, hand all notifications to the process-wide
+        :class:`NotificationDispatcher` instead of sending them on the thread of
+        the monitored code. If ``None``, the value is read from the effective
+        ``.pytb.config`` s ``notify`` section
+    :param digest_window: If set, collect all notifications within this number of
+        seconds and deliver them as a single digest. Failures are always delivered
+        immediately (after any pending digest)
+    :param rate_limits: A mapping of notification kinds to a rate limit
+        ``(count, interval)`` that allows at most ``count`` notifications of this kind
+        per ``interval`` seconds. Notifications exceeding the limit are delivered
+        with the next digest. The kinds are ``done``, ``iteration``, ``progress update``,
+        ``probably stalled``, ``no longer stalled``, ``progress`` and ``manual``.
+        The kind ``*`` applies to all kinds without a limit of their own.
+    :param capture_mode: How the output of monitored blocks is captured. ``streams``
+        replaces ``sys.stdout`` and ``sys.stderr`` for the whole process using
+        :meth:`pytb.io.mirrored_stdstreams`. ``thread`` only captures the output
+        written to ``sys.stdout`` and ``sys.stderr`` by the thread running the block
+        using :meth:`pytb.io.captured_stdstreams`, so blocks monitored in parallel
+        threads do not capture each others output. ``fds`` replaces the file descriptors
+        1 and 2 using :meth:`pytb.io.captured_fds` to also capture the output of
+        C extensions and child processes. If ``None``, the value is read from the
+        effective ``.pytb.config`` s ``notify`` section
+    """
+
+    capture_modes = ("streams", "thread", "fds")
+
+    def __init__(
+        self,
+        task: str,
+        render_outputs: bool = True,
+        asynchronous: Optional[bool] = None,
+        digest_window: Optional[_Interval] = None,
+        rate_limits: Optional[Mapping[str, _RateLimit]] = None,
+        capture_mode: Optional[str] = None,
+    ):
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
+        )
+
+        if asynchronous is None:
+            asynchronous = get_config()["notify"].getboolean("asynchronous")
+
+        if capture_mode is None:
+            capture_mode = get_config()["notify"]["capture_mode"]
+        if capture_mode not in self.capture_modes:
+            raise ValueError(
+                f"capture_mode must be one of {self.capture_modes}, got {capture_mode!r}"
+            )
+
+        self.task = task
+        self.render_outputs = render_outputs
+        self.asynchronous = asynchronous
+        self.capture_mode = capture_mode
+
+        self._digest = (
+            _NotificationDigest(
+                self._deliver_notification, digest_window, rate_limits or {}
+            )
+            if digest_window is not None or rate_limits
+            else None
+        )
+
+    def now(self, message: str) -> None:
+        """
+        Send a manual notification now. This will use the provided ``message`` as
+        the ``reason`` placeholder. No output can be capured using this function.
+
+        :param message: A string used to fill the ``{reason}`` placeholder of the notification
+        """
+        caller_frame = _get_caller_frame(1)
+        self._dispatch_notification(
+            self.task, message, caller_frame, "<output not available>", kind="manual"
+        )
+
+    @contextmanager
+    def when_done(
+        self,
+        only_if_error: bool = False,
+        capture_output: bool = True,
+        caller_frame: Optional[FrameType] = None,
+        reason_prefix: str = "",
+    ) -> Generator[None, None, None]:
+        """
+        Create a context that, when exited, will send notifications.
+        If an unhandled exception is raised during execution, a notification
+        on the failure of the execution is sent. If the context exits cleanly,
+        a notification is only sent if ``only_if_error`` is set to ``False``
+
+        By default, all output to the ``stdio`` and ``stderr`` streams is
+        captured and sent in the notification. If you expect huge amounts of
+        output during the execution of the monitored code, you can disable
+        the capturing with the ``capture_output`` parameter.
+
+        To not spam you with notification when you stop the code execution
+        yourself, ``KeyboardInterrupt`` exceptions will not trigger a notification.
+
+        :param only_if_error: if the context manager exits cleanly, do not send
+            any notifications
         :param capture_output: capture all output to the ``stdout`` and ``stderr``
             stream and append it to the notification
-        :param after_every: Only notify about each N-th iteration
         :param caller_frame: the stackframe to use when determining the code block
             for the notification. If None, the stackframe of the line that called
             this function is used
+        :param reason_prefix: an additional string that is prepended to the ``reason``
+            placeholder when sending a notification. Used to implement :meth:`on_iteration_of`.
         """
 
-        if caller_frame is None:
-            caller_frame = _get_caller_frame(1)
+        # if called from user code, the calling frame is unspecified. save it fur future reference
+        if caller_frame is None:
+            # we need to go 2 frames up because the direct parent is the
+            # contextmanagers ``__enter__`` method`
+            caller_frame = _get_caller_frame(2)
+
+            # only print the debug message when this context is not invoked
+            # from another context in this notifier
+            self._logger.info(f"Entering when-done Context")
+
+        output_buffer = self._create_capture_buffer()
+        output_handler = cast(
+            ContextManager[None],
+            self._capture(output_buffer) if capture_output else nullcontext(),
+        )
+
+        exception = None
+
+        # pylint: disable=broad-except
+        try:
+            with output_handler:
+                yield
+        except Exception as current_exception:
+            exception = current_exception
+
+        output = (
+            output_buffer.snapshot()
+            if capture_output
+            else "<output capturing disabled>"
+        )
+        # the snapshot keeps its own reference to the spilled output
+        output_buffer.close()
+
+        if exception is None and only_if_error:
+            self._logger.info(
+                f"Notification context left without error. Not firing notification"
+            )
+            return
+
+        if exception is not None:
+            self._dispatch_notification(
+                self.task,
+                f"{reason_prefix} failed".lstrip(),
+                caller_frame,
+                output,
+                exception,
+            )
+            raise exception
+
+        self._dispatch_notification(
+            self.task,
+            f"{reason_prefix} done".lstrip(),
+            caller_frame,
+            output,
+            kind="iteration" if reason_prefix else "done",
+        )
+
+    @contextmanager
+    def every(
+        self,
+        interval: _Interval,
+        incremental_output: bool = False,
+        caller_frame: Optional[FrameType] = None,
+        telemetry: Optional[bool] = None,
+    ) -> Generator[None, None, None]:
+        """
+        Send out notifications with a fixed interval to receive progress updates.
+        This contextmanager wraps a :meth:`when_done`, so it is guaranteed to send
+        to notify at least once upon task completion or error.
+
+        :param interval: ``float``, ``int`` or ``datetime.timedelta`` object representing the
+            number of seconds between notifications
+        :param incremental_output: Only send incremental output summaries with each update.
+            If ``False`` the complete captured output is sent each time
+        :param caller_frame: the stackframe to use when determining the code block for
+            the notification. If None, the stackframe of the line that called this
+            function is used
+        :param telemetry: Record the resource usage of the process with a
+            :class:`ResourceMonitor` and put a summary in front of the output of each
+            progress update. If ``None``, the ``telemetry`` option of the effective
+            ``.pytb.config`` s ``notify`` section is used
+        """
+
+        # if called from user code, the calling frame is unspecified. save it fur future reference
+        if caller_frame is None:
+            # we need to go 2 frames up because the direct parent
+            # is the contextmanagers ``__enter__`` method`
+            caller_frame = _get_caller_frame(2)
+
+        output_buffer = self._create_capture_buffer()
+        output_handler = self._capture(output_buffer)
+        monitor = self._create_resource_monitor(telemetry)
+
+        def send_progress() -> None:
+            self._logger.info("sending out scheduled notifications")
+            output = output_buffer.snapshot()
+            # clear the output buffer between progress notification
+            # if we only should send incremental updates of the output
+            if incremental_output:
+                output_buffer.truncate(0)
+
+            if monitor is not None:
+                output = output.prepend(f"{monitor.summary()}\n\n")
+
+            self._dispatch_notification(
+                self.task, "progress update", caller_frame, output
+            )
+
+        progress_sender = Timer(send_progress)
+        progress_sender.call_every(interval)
+
+        try:
+            with self.when_done(False, True, caller_frame=caller_frame):
+                with output_handler:
+                    yield
+        finally:
+            # stop the scheduled sending of progress updates
+            progress_sender.stop()
+            if monitor is not None:
+                monitor.stop()
+            output_buffer.close()
+
+    @contextmanager
+    def when_stalled(
+        self,
+        timeout: _Interval,
+        capture_output: bool = True,
+        caller_frame: Optional[FrameType] = None,
+    ) -> Generator[None, None, None]:
+        """
+        Monitor the output of the code bock to determine a possible stall of the execution.
+        The execution is considered to be stalled when no new output is produced within
+        ``timeout`` seconds. The check only compares a counter of writes and the time
+        of the last write, so its cost does not depend on the amount of produced output.
+        Thus the output is monitored even if ``capture_output`` is ``False``.
+
+        Only a single notification is sent each time a stall is detected.
+        If a stall notification was sent previously, new output will cause a notification to
+        be sent that the stall was resolved.
+
+        Contrary to the :meth:`every` method, this does not wrap the context into a
+        :meth:`when_done` function, thus it may never send a notification. If you want,
+        you can simply use the same :class:`Notify` to create mutliple contexts:
+
+        .. code-block:: python
+
+            with notify.when_stalled(timeout), notify.when_done():
+                # execute some potentially long-running process
+
+        However, it will always send a notification if the code block  exits with an exception.
+
+        :param timeout: maximum number of seconds where no new output is produced
+            before the code block is considiered to be stalled
+        :param capture_output: append all output to ``stdout`` and ``stderr`` to the notification
+        :param caller_frame: the stackframe to use when determining the code block for
+            the notification. If None, the stackframe of the line that called this
+            function is used
+        """
+
+        # if called from user code, the calling frame is unspecified. save it fur future reference
+        if caller_frame is None:
+            # we need to go 2 frames up because the direct parent is
+            # the contextmanagers ``__enter__`` method`
+            caller_frame = _get_caller_frame(2)
+
+        # without capturing, the buffer only keeps track of the write activity
+        output_buffer = (
+            self._create_capture_buffer()
+            if capture_output
+            else CaptureBuffer(head_size=0, tail_size=0, spill=False)
+        )
+        output_handler = self._capture(output_buffer)
+
+        timeout_seconds = _interval_seconds(timeout)
+        last_write_count = output_buffer.write_count
+        was_stalled = False
+
+        def check_stalled() -> None:
+            nonlocal last_write_count, was_stalled
+
+            self._logger.info("Checking for stalled code block")
+
+            # only compare the write activity here, the captured output
+            # is only needed if we actually send a notification
+            write_count = output_buffer.write_count
+            has_new_output = write_count != last_write_count
+            idle_time = time.monotonic() - output_buffer.last_write
+            last_write_count = write_count
+
+            if not has_new_output and idle_time >= timeout_seconds and not was_stalled:
+                # we're probably stalled. send out a notification
+                reason = "probably stalled"
+                was_stalled = True
+            elif has_new_output and was_stalled:
+                # wrong alert previously, send a notification that everything is ok again
+                reason = "no longer stalled"
+                was_stalled = False
+            else:
+                return
+
+            output_in_notification = (
+                output_buffer.snapshot()
+                if capture_output
+                else "<output capturing disabled>"
+            )
+            self._dispatch_notification(
+                self.task, reason, caller_frame, output_in_notification
+            )
+
+        stall_checker = Timer(check_stalled)
+        stall_checker.call_every(timeout)
+
+        try:
+            with self.when_done(True, capture_output, caller_frame=caller_frame):
+                with output_handler:
+                    yield
+        finally:
+            # stop the scheduled sending of progress updates
+            stall_checker.stop()
+            output_buffer.close()
+
+    @contextmanager
+    def when_stuck(
+        self,
+        timeout: _Interval,
+        sample_interval: Optional[_Interval] = None,
+        capture_output: bool = True,
+        caller_frame: Optional[FrameType] = None,
+    ) -> Generator[ProgressCounter, None, None]:
+        """
+        Detect a stall of a code block from its call stack instead of its output.
+        This is useful for code that is silent on purpose for long periods of time
+        or may deadlock.
+
+        The stack of the thread that entered the context is sampled every
+        ``sample_interval`` seconds on the :class:`TimerService` thread using
+        :func:`sys._current_frames`, so the monitored code is neither traced nor slowed down.
+        The block is considered to be stuck if its stack did not change for ``timeout``
+        seconds. The context yields a :class:`ProgressCounter`. If the monitored code
+        increments it, the block is only considered to be stuck if the counter did not
+        change as well. This avoids false alarms for code that legitimately spends a
+        long time in a single line (e.g. a big computation in an extension module).
+
+        The stall notification contains the current stack of every thread of the process
+        in front of the captured output. Same as with :meth:`when_stalled`, a notification
+        is sent if the block continues after a stall was reported.
+
+        .. code-block:: python
+
+            with notify.when_stuck(timedelta(minutes=10)) as progress:
+                for batch in loader:
+                    train(batch)
+                    progress.tick()
+
+        :param timeout: number of seconds the stack and the progress counter have
+            to stay the same before the code block is considered to be stuck
+        :param sample_interval: number of seconds between two samples of the stack.
+            Defaults to a tenth of the ``timeout``
+        :param capture_output: append all output to ``stdout`` and ``stderr`` to the notification
+        :param caller_frame: the stackframe to use when determining the code block for
+            the notification. If None, the stackframe of the line that called this
+            function is used
+        """
+
+        # if called from user code, the calling frame is unspecified. save it fur future reference
+        if caller_frame is None:
+            # we need to go 2 frames up because the direct parent is
+            # the contextmanagers ``__enter__`` method`
+            caller_frame = _get_caller_frame(2)
+
+        output_buffer = self._create_capture_buffer()
+        output_handler = cast(
+            ContextManager[None],
+            self._capture(output_buffer) if capture_output else nullcontext(),
+        )
+
+        timeout_seconds = _interval_seconds(timeout)
+        if sample_interval is None:
+            sample_interval = timeout_seconds / 10
+
+        progress = ProgressCounter()
+        monitored_thread = threading.get_ident()
+        last_state: Tuple[Any, ...] = ()
+        last_change = time.monotonic()
+        was_stuck = False
+
+        def check_stuck() -> None:
+            nonlocal last_state, last_change, was_stuck
+
+            frames = sys._current_frames()  # pylint: disable=protected-access
+            state = (
+                progress.value,
+                _stack_signature(frames.get(monitored_thread)),
+            )
+            now = time.monotonic()
+
+            if state != last_state:
+                last_state = state
+                last_change = now
+                if not was_stuck:
+                    return
+                reason = "no longer stalled"
+                was_stuck = False
+            elif now - last_change >= timeout_seconds and not was_stuck:
+                reason = "probably stalled"
+                was_stuck = True
+            else:
+                return
+
+            # do not report the stack of the thread sampling the stacks
+            frames.pop(threading.get_ident(), None)
+            stacks = f"{_format_thread_stacks(frames)}\n"
+            output = (
+                output_buffer.snapshot().prepend(f"{stacks}\noutput:\n")
+                if capture_output
+                else stacks
+            )
+            self._dispatch_notification(self.task, reason, caller_frame, output)
+
+        stack_sampler = Timer(check_stuck)
+        stack_sampler.call_every(sample_interval)
+
+        try:
+            with self.when_done(True, capture_output, caller_frame=caller_frame):
+                with output_handler:
+                    yield progress
+        finally:
+            stack_sampler.stop()
+            output_buffer.close()
+
+    def on_iteration_of(
+        self,
+        iterable: Sequence[_IterType],
+        capture_output: bool = True,
+        after_every: int = 1,
+        caller_frame: Optional[FrameType] = None,
+    ) -> Generator[_IterType, None, None]:
+        """
+        Send a message *after* each iteration of an iterable. The current iteration
+        and total number of iterations (if the iterable implements :meth:`len`)
+        will be part of the ``reason`` placeholder in the notification.
+
+        .. code-block:: python
+
+            for x in notify.on_iteration_of(range(5)):
+                # execute some potentially long-running process on x
+
+        :param iterable: the iterable which items will be yielded by this generator
+        :param capture_output: capture all output to the ``stdout`` and ``stderr``
+            stream and append it to the notification
+        :param after_every: Only notify about each N-th iteration
+        :param caller_frame: the stackframe to use when determining the code block
+            for the notification. If None, the stackframe of the line that called
+            this function is used
+        """
+
+        if caller_frame is None:
+            caller_frame = _get_caller_frame(1)
+
+        total_iterations = str(len(iterable)) if hasattr(iterable, "__len__") else "???"
+
+        # capture the output of the whole loop once. Each notification contains
+        # the output since the previous notification
+        output_buffer = self._create_capture_buffer()
+        output_handler = cast(
+            ContextManager[None],
+            self._capture(output_buffer) if capture_output else nullcontext(),
+        )
+
+        try:
+            with output_handler:
+                for iteration_num, item in enumerate(iterable, 1):
+                    yield item
+
+                    if (
+                        iteration_num % after_every == 0
+                        or str(iteration_num) == total_iterations
+                    ):
+                        output = (
+                            output_buffer.snapshot()
+                            if capture_output
+                            else "<output capturing disabled>"
+                        )
+                        output_buffer.clear()
+                        self._dispatch_notification(
+                            self.task,
+                            f"Iteration {iteration_num}/{total_iterations} done",
+                            caller_frame,
+                            output,
+                            kind="iteration",
+                        )
+        finally:
+            output_buffer.close()
+
+    def track_progress(
+        self,
+        iterable: Iterable[_IterType],
+        interval: _Interval,
+        total: Optional[int] = None,
+        smoothing: float = 0.3,
+        capture_output: bool = True,
+        caller_frame: Optional[FrameType] = None,
+    ) -> Generator[_IterType, None, None]:
+        """
+        Yield all items of an iterable and send a progress notification every
+        ``interval`` seconds. The notification contains the number of finished
+        iterations, the current throughput and (if the total number of iterations
+        is known) the estimated time until the loop finishes. A final notification
+        is sent once the iterable is exhausted.
+
+        Contrary to :meth:`on_iteration_of`, the loop itself only counts the
+        iterations. The progress is sampled by the :class:`TimerService`, so this is
+        suited for tight loops with many short iterations.
+
+        .. code-block:: python
+
+            for x in notify.track_progress(range(1000000), interval=60):
+                # execute some short step on x
+
+        :param iterable: the iterable which items will be yielded by this generator
+        :param interval: ``float``, ``int`` or ``datetime.timedelta`` object representing the
+            number of seconds between notifications
+        :param total: the total number of iterations. If ``None``, :meth:`len` of the
+            iterable is used if available
+        :param smoothing: weight of the latest sample in the exponentially smoothed
+            throughput. ``1`` only uses the throughput since the last notification
+        :param capture_output: capture all output to the ``stdout`` and ``stderr``
+            stream and append it to the notification
+        :param caller_frame: the stackframe to use when determining the code block
+            for the notification. If None, the stackframe of the line that called
+            this function is used
+        """
+
+        if caller_frame is None:
+            caller_frame = _get_caller_frame(1)
+
+        if total is None and hasattr(iterable, "__len__"):
+            total = len(cast(Sequence[_IterType], iterable))
+
+        tracker = _ProgressTracker(total, smoothing)
+        output_buffer = self._create_capture_buffer()
+        output_handler = cast(
+            ContextManager[None],
+            self._capture(output_buffer) if capture_output else nullcontext(),
+        )
+
+        def send_progress(reason: str, kind: str) -> None:
+            output = (
+                output_buffer.snapshot()
+                if capture_output
+                else "<output capturing disabled>"
+            )
+            self._dispatch_notification(
+                self.task, reason, caller_frame, output, kind=kind
+            )
+
+        def sample_progress() -> None:
+            self._logger.info("sending out progress notification")
+            tracker.sample()
+            send_progress(tracker.describe(), "progress")
+
+        progress_sender = Timer(sample_progress)
+        progress_sender.call_every(interval)
+
+        try:
+            try:
+                with output_handler:
+                    for tracker.count, item in enumerate(iterable, 1):
+                        yield item
+            finally:
+                progress_sender.stop()
+
+            send_progress(tracker.summary(), "done")
+        finally:
+            output_buffer.close()
+
+    def _create_resource_monitor(
+        self, telemetry: Optional[bool]
+    ) -> Optional[ResourceMonitor]:
+        """
+        Create and start a :class:`ResourceMonitor` configured from the ``telemetry_*``
+        options of the effective ``.pytb.config`` s ``notify`` section.
+
+        :param telemetry: if ``None``, the ``telemetry`` option decides whether
+            a monitor is created
+        :return: the started monitor or ``None`` if telemetry is disabled or not
+            available on this system
+        """
+        if telemetry is None:
+            telemetry = get_config().getboolean("notify", "telemetry")
+        if not telemetry:
+            return None
+
+        if not os.path.exists("/proc/self/stat"):
+            self._logger.warning("telemetry is only available on Linux")
+            return None
+
+        notify_config = get_config()["notify"]
+        monitor = ResourceMonitor(int(notify_config["telemetry_samples"]))
+        monitor.sample()
+        monitor.start(float(notify_config["telemetry_interval"]))
+        return monitor
+
+    def _capture(self, output_buffer: CaptureBuffer) -> ContextManager[Any]:
+        """
+        Capture the output of a monitored block into ``output_buffer``
+        according to the :attr:`capture_mode`
+        """
+        if self.capture_mode == "fds":
+            return captured_fds(output_buffer)
+
+        notify_config = get_config()["notify"]
+        capture_streams = (
+            captured_stdstreams if self.capture_mode == "thread" else mirrored_stdstreams
+        )
+        return capture_streams(
+            output_buffer,
+            buffer_size=int(notify_config["mirror_buffer_size"]),
+            overflow=notify_config["mirror_overflow"],
+        )
+
+    @staticmethod
+    def _create_capture_buffer() -> CaptureBuffer:
+        """
+        Create a buffer to capture the output of a monitored block. The buffer is
+        configured from the ``capture_*`` options of the effective ``.pytb.config`` s
+        ``notify`` section
+        """
+        notify_config = get_config()["notify"]
+        return CaptureBuffer(
+            head_size=int(notify_config["capture_head_size"]),
+            tail_size=int(notify_config["capture_tail_size"]),
+            spill=get_config().getboolean("notify", "capture_spill"),
+        )
+
+    def _dispatch_notification(
+        self,
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+        kind: Optional[str] = None,
+    ) -> None:
+        """
+        Hand a notification over for delivery. If a digest window or rate limits
+        are configured, the notification may be held back for the next digest.
+        Failures are never held back.
+
+        :param kind: the kind of notification used to select the rate limit.
+            Defaults to the ``reason``
+        """
+        if self._digest is None:
+            self._deliver_notification(task, reason, caller_frame, output, exception)
+        elif exception is not None:
+            # failures are delivered right away, but after all events
+            # that happened before
+            self._digest.flush()
+            self._deliver_notification(task, reason, caller_frame, output, exception)
+        else:
+            self._digest.add(task, reason, caller_frame, output, kind or reason)
+
+    def _deliver_notification(
+        self,
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+    ) -> None:
+        """
+        Send a notification. Depending on :attr:`asynchronous`
+        this either calls :meth:`_send_notification` directly or queues the
+        notification in the :class:`NotificationDispatcher`.
+        Notifications sent by callbacks of the :class:`TimerService` are always
+        queued, so a slow backend does not delay the timers of the process
+        """
+        if not self.asynchronous and not TimerService.in_timer_thread():
+            self._send_notification(task, reason, caller_frame, output, exception)
+            return
+
+        NotificationDispatcher.instance().submit(
+            self, task, reason, _snapshot_frame(caller_frame), output, exception
+        )
+
+    def _send_notification(
+        self,
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+    ) -> None:
+        """
+        Handle the actual notification. Overwrite this method to specify your own Notifier
+        over any communication mechanism you may desire.
+        """
+        raise NotImplementedError()
+
+
+class SMTPConnectionPool:
+    """
+    Keeps a session to an SMTP server open between notifications, so frequent
+    notifications do not pay for the TCP connect, the TLS handshake and the
+    ``EHLO`` exchange each time.
+
+    While a session is idle, a ``NOOP`` command is sent every ``keepalive``
+    seconds to keep it from timing out on the server side. Sessions that have
+    been idle for more than ``max_idle`` seconds are closed. If the server dropped
+    the connection anyway, the session is reopened transparently and the
+    message is sent again.
+
+    All :class:`NotifyViaEmail` objects of a process that talk to the same server share
+    a pool, use :meth:`shared` to get it.
+
+    :param smtp_class: either ``smtplib.SMTP`` or ``smtplib.SMTP_SSL``
+    :param host: The SMTP servers address
+    :param port: The TCP port of the SMTP server
+    :param keepalive: number of idle seconds after which a ``NOOP`` is sent to the server
+    :param max_idle: number of idle seconds after which the session is closed
+    :param timeout: number of seconds to wait for the server to accept the connection
+        or to answer a command
+    """
+
+    _shared_pools: Dict[Tuple[Type[smtplib.SMTP], str, int], "SMTPConnectionPool"] = {}
+    _shared_pools_lock = threading.Lock()
+
+    def __init__(
+        self,
+        smtp_class: Type[smtplib.SMTP],
+        host: str,
+        port: int,
+        keepalive: float = 30,
+        max_idle: float = 300,
+        timeout: float = 60,
+    ):
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
+        )
+
+        self.smtp_class = smtp_class
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.max_idle = max_idle
+        self.timeout = timeout
+
+        self.connections_opened = 0
+        """
+        Number of sessions opened by this pool during its lifetime
+        """
+
+        self._smtp: Optional[smtplib.SMTP] = None
+        self._last_used = 0.0
+        self._keepalive_timer: Optional[Timer] = None
+        self._lock = threading.RLock()
+
+    @classmethod
+    def shared(
+        cls, smtp_class: Type[smtplib.SMTP], host: str, port: int
+    ) -> "SMTPConnectionPool":
+        """
+        Get the pool of this process for the server at ``host:port``.
+        The ``keepalive``, ``max_idle`` and ``timeout`` parameters are read from the
+        effective ``.pytb.config`` s ``notify`` section when the pool is created.
+        All shared pools are closed when the interpreter exits.
+        """
+        key = (smtp_class, host, port)
+        with cls._shared_pools_lock:
+            if not cls._shared_pools:
+                atexit.register(cls.close_shared)
+            if key not in cls._shared_pools:
+                notify_config = get_config()["notify"]
+                cls._shared_pools[key] = cls(
+                    smtp_class,
+                    host,
+                    port,
+                    keepalive=float(notify_config["smtp_keepalive"]),
+                    max_idle=float(notify_config["smtp_max_idle"]),
+                    timeout=float(notify_config["smtp_timeout"]),
+                )
+            return cls._shared_pools[key]
+
+    @classmethod
+    def close_shared(cls) -> None:
+        """
+        Close the sessions of all pools created via :meth:`shared`
+        """
+        with cls._shared_pools_lock:
+            for pool in cls._shared_pools.values():
+                pool.close()
+
+    def send_messages(self, messages: Iterable[EmailMessage]) -> None:
+        """
+        Send all ``messages`` over the pooled session, opening a session if none is open
+
+        :raises smtplib.SMTPException: if the server rejects a message
+        """
+        with self._lock:
+            for message in messages:
+                self._logger.info(f"sending message '{message['Subject']}'")
+                try:
+                    self._connection().send_message(message)
+                except Exception as error:  # pylint: disable=broad-except
+                    if not self._is_disconnect(error):
+                        raise
+                    # the server closed the session behind our back. retry once
+                    # over a fresh session, a second failure is a real problem
+                    self._logger.info("SMTP session was closed, reconnecting")
+                    self._disconnect()
+                    self._connection().send_message(message)
+                self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        """
+        Quit the pooled session. The next message will open a new session
+        """
+        with self._lock:
+            if self._keepalive_timer is not None:
+                self._keepalive_timer.stop()
+                self._keepalive_timer = None
+            if self._smtp is not None:
+                # pylint: disable=broad-except
+                try:
+                    self._smtp.quit()
+                except Exception:
+                    # the session is gone anyway
+                    pass
+                self._disconnect()
+
+    @staticmethod
+    def _is_disconnect(error: Exception) -> bool:
+        if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError)):
+            return True
+        # 421: the service is not available and will close the connection
+        return getattr(error, "smtp_code", None) == 421
+
+    def _connection(self) -> smtplib.SMTP:
+        if self._smtp is None:
+            # always pass the timeout, a blocking connect would never return if the
+            # server does not answer
+            self._smtp = self.smtp_class(self.host, self.port, timeout=self.timeout)
+            self.connections_opened += 1
+            self._last_used = time.monotonic()
+
+        if self._keepalive_timer is None:
+            self._keepalive_timer = Timer(self._keep_alive)
+            self._keepalive_timer.call_every(self.keepalive)
+
+        return self._smtp
+
+    def _disconnect(self) -> None:
+        if self._smtp is not None:
+            self._smtp.close()
+            self._smtp = None
+
+    def _keep_alive(self) -> None:
+        # runs on the shared timer thread, so never wait for a send in progress.
+        # the session is in use anyway and does not need a NOOP
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            if self._smtp is None:
+                return
+
+            idle_time = time.monotonic() - self._last_used
+            if idle_time >= self.max_idle:
+                self._logger.info("closing idle SMTP session")
+                self.close()
+                return
+
+            if idle_time < self.keepalive:
+                return
+
+            # pylint: disable=broad-except
+            try:
+                code, _ = self._smtp.noop()
+            except Exception:
+                code = -1
+            if code != 250:
+                # the session is broken, reopen it lazily with the next message
+                self._disconnect()
+        finally:
+            self._lock.release()
+
+
+class NotificationOutbox:
+    """
+    A durable queue of rendered notifications in a SQLite database in WAL mode.
+
+    Adding a message with :meth:`put` is a single local insert, so the monitored
+    code never waits for the network. A background thread hands the stored messages
+    to ``deliver`` and deletes them afterwards. If ``deliver`` raises, the message is
+    retried with an exponential backoff starting at ``backoff`` seconds (capped at
+    ``max_backoff`` seconds) and dropped after ``max_attempts`` failed attempts.
+
+    Messages survive crashes of the process: they stay in the database
+    and are delivered by the next outbox opened on the same ``path`` and ``channel``,
+    e.g. the next job using the same :class:`NotifyViaEmail` configuration.
+    Several processes can share an outbox, a message being delivered is leased
+    for ``lease`` seconds so it is not sent twice.
+
+    :param path: path of the SQLite database
+    :param channel: name of the destination of the messages. Outboxes only deliver
+        messages of their own channel, so several destinations can share a database
+    :param deliver: called with a stored message, raises if the message could not be delivered
+    :param backoff: number of seconds to wait before the first retry (doubled with each retry)
+    :param max_backoff: maximum number of seconds to wait between two retries
+    :param max_attempts: number of failed attempts after which a message is dropped
+    :param lease: number of seconds a message is reserved for the process delivering it
+
+    .. testsetup::
+
+        from pytb.notification import NotificationOutbox
+
+    .. doctest::
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), "outbox.db")
+        >>> delivered = []
+        >>> outbox = NotificationOutbox(path, "test", delivered.append)
+        >>> outbox.put(b"message")
+        >>> outbox.flush(5)
+        True
+        >>> delivered
+        [b'message']
+        >>> outbox.close()
+    """
+
+    _shared_outboxes: Dict[Tuple[str, str], "NotificationOutbox"] = {}
+    _shared_outboxes_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str,
+        channel: str,
+        deliver: Callable[[bytes], None],
+        backoff: float = 30,
+        max_backoff: float = 3600,
+        max_attempts: int = 10,
+        lease: float = 300,
+    ):
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
+        )
+
+        self.path = os.path.expanduser(path)
+        self.channel = channel
+        self.deliver = deliver
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_attempts = max_attempts
+        self.lease = lease
+
+        self.delivered = 0
+        """
+        Number of messages delivered by this outbox
+        """
+
+        # the connection is shared by the caller and the sender thread
+        self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+        self._db.isolation_level = None
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # with WAL, commits survive crashes of the process without an fsync
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, next_attempt REAL NOT NULL, "
+                "message BLOB NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS outbox_due ON outbox (channel, next_attempt)"
+            )
+
+        self._wakeup = threading.Event()
+        self._idle = threading.Condition()
+        self._delivering = False
+        self._closed = False
+        # deliver messages left behind by previous processes right away
+        self._thread = threading.Thread(
+            target=self._run, name="pytb-outbox", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def shared(
+        cls, path: str, channel: str, deliver: Callable[[bytes], None]
+    ) -> "NotificationOutbox":
+        """
+        Get the outbox of this process for ``channel`` in the database at ``path``.
+        The retry parameters are read from the effective ``.pytb.config`` s
+        ``notify`` section when the outbox is created. When the interpreter exits,
+        all shared outboxes try to deliver their due messages for up to
+        ``outbox_exit_timeout`` seconds.
+        """
+        key = (os.path.abspath(os.path.expanduser(path)), channel)
+        with cls._shared_outboxes_lock:
+            if not cls._shared_outboxes:
+                atexit.register(cls.close_shared)
+            if key not in cls._shared_outboxes:
+                notify_config = get_config()["notify"]
+                cls._shared_outboxes[key] = cls(
+                    path,
+                    channel,
+                    deliver,
+                    backoff=float(notify_config["outbox_backoff"]),
+                    max_backoff=float(notify_config["outbox_max_backoff"]),
+                    max_attempts=int(notify_config["outbox_max_attempts"]),
+                )
+            return cls._shared_outboxes[key]
+
+    @classmethod
+    def close_shared(cls) -> None:
+        """
+        Close all outboxes created via :meth:`shared`. The configured
+        ``outbox_exit_timeout`` is shared by all outboxes, so exiting is
+        never delayed longer if the network is down
+        """
+        deadline = time.monotonic() + float(
+            get_config()["notify"]["outbox_exit_timeout"]
+        )
+        with cls._shared_outboxes_lock:
+            for outbox in cls._shared_outboxes.values():
+                outbox.close(max(0, deadline - time.monotonic()))
+            cls._shared_outboxes.clear()
+
+    def put(self, message: bytes) -> None:
+        """
+        Durably store ``message`` and wake up the background sender
+        """
+        with self._db_lock:
+            self._db.execute(
+                "INSERT INTO outbox (channel, next_attempt, message) VALUES (?, ?, ?)",
+                (self.channel, time.time(), message),
+            )
+        self._wakeup.set()
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of messages of this channel that are not delivered yet
+        """
+        with self._db_lock:
+            (count,) = self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE channel = ?", (self.channel,)
+            ).fetchone()
+        return cast(int, count)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all due messages of this channel are delivered.
+        Messages waiting for a retry are not waited for.
+
+        :param timeout: maximum number of seconds to wait. If None, wait indefinitely
+        :return: ``True`` if all due messages were delivered in time
+        """
+        self._wakeup.set()
+        with self._idle:
+            return self._idle.wait_for(
+                lambda: not self._delivering and self._next_due() is None, timeout
+            )
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """
+        Stop the background sender after trying to deliver all due messages
+        for up to ``timeout`` seconds. Undelivered messages stay in the database.
+        """
+        self.flush(timeout)
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+        # a sender stuck in ``deliver`` still needs the database
+        if not self._thread.is_alive():
+            with self._db_lock:
+                self._db.close()
+
+    def _next_due(self) -> Optional[Tuple[int, int, float, bytes]]:
+        with self._db_lock:
+            if self._closed:
+                return None
+            return cast(
+                Optional[Tuple[int, int, float, bytes]],
+                self._db.execute(
+                    "SELECT id, attempts, next_attempt, message FROM outbox "
+                    "WHERE channel = ? AND next_attempt <= ? "
+                    "ORDER BY next_attempt, id LIMIT 1",
+                    (self.channel, time.time()),
+                ).fetchone(),
+            )
+
+    def _claim(self, message_id: int, next_attempt: float) -> bool:
+        # another process may be delivering the same message. only the process that
+        # moves the next attempt out of the due range gets to deliver it
+        with self._db_lock:
+            claimed = self._db.execute(
+                "UPDATE outbox SET next_attempt = ? WHERE id = ? AND next_attempt = ?",
+                (time.time() + self.lease, message_id, next_attempt),
+            )
+        return claimed.rowcount == 1
+
+    def _seconds_until_due(self) -> Optional[float]:
+        with self._db_lock:
+            (next_attempt,) = self._db.execute(
+                "SELECT MIN(next_attempt) FROM outbox WHERE channel = ?",
+                (self.channel,),
+            ).fetchone()
+        return None if next_attempt is None else max(0, next_attempt - time.time())
+
+    def _run(self) -> None:
+        while not self._closed:
+            due = self._next_due()
+            if due is None:
+                with self._idle:
+                    self._idle.notify_all()
+                self._wakeup.wait(self._seconds_until_due())
+                self._wakeup.clear()
+                continue
+
+            message_id, attempts, next_attempt, message = due
+            self._delivering = True
+            try:
+                if self._claim(message_id, next_attempt):
+                    self._attempt_delivery(message_id, attempts, message)
+            finally:
+                self._delivering = False
+
+    def _attempt_delivery(self, message_id: int, attempts: int, message: bytes) -> None:
+        # pylint: disable=broad-except
+        try:
+            self.deliver(message)
+        except Exception:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                self._logger.exception(
+                    f"dropping message after {attempts} failed attempts"
+                )
+                self._delete(message_id)
+                return
+
+            delay = min(self.backoff * 2 ** (attempts - 1), self.max_backoff)
+            self._logger.warning(
+                f"delivery failed, retrying in {delay} seconds", exc_info=True
+            )
+            with self._db_lock:
+                self._db.execute(
+                    "UPDATE outbox SET attempts = ?, next_attempt = ? WHERE id = ?",
+                    (attempts, time.time() + delay, message_id),
+                )
+        else:
+            self._delete(message_id)
+            self.delivered += 1
+
+    def _delete(self, message_id: int) -> None:
+        with self._db_lock:
+            self._db.execute("DELETE FROM outbox WHERE id = ?", (message_id,))
+
+
+def _send_email(
+    smtp_class: Type[smtplib.SMTP],
+    host: str,
+    port: int,
+    timeout: float,
+    connection_pool: Optional[SMTPConnectionPool],
+    message: EmailMessage,
+) -> None:
+    """
+    Send ``message`` to the SMTP server at ``host`` and ``port``, through
+    ``connection_pool`` if it is not ``None``
+
+    :raises smtplib.SMTPException: if the message could not be sent
+    """
+    if connection_pool is not None:
+        connection_pool.send_messages([message])
+    else:
+        with smtp_class(host, port, timeout=timeout) as smtp:
+            smtp.send_message(message)
+
+
+def _send_stored_email(
+    smtp_class: Type[smtplib.SMTP],
+    host: str,
+    port: int,
+    timeout: float,
+    connection_pool: Optional[SMTPConnectionPool],
+    data: bytes,
+) -> None:
+    """
+    Send a message stored in a :class:`NotificationOutbox` with :func:`_send_email`
+    """
+    message = message_from_bytes(data, policy=email_policy.default)
+    _send_email(smtp_class, host, port, timeout, connection_pool, message)
+
+
+class NotifyViaEmail(Notify):
+    r"""
+    A :class:`NotifyViaEmail` object uses an SMTP connection to send notification via emails.
+    The SMTP server is configured either at runtime or via the effective ``.pytb.config``
+    files ``notify`` section.
+
+    :param email_addresses: a single email address or a list of addresses. Each entry is a seperate
+        recipient of the notification send by this ``Notify``. A notification is sent
+        as a single message to all recipients
+    :param task: A short description of the monitored block.
+    :param sender: Sender name to use. If empty, use this machines FQDN
+    :param smtp_host: The SMTP servers address used to send the notifications
+    :param smtp_port: The TCP port of the SMTP server
+    :param smtp_ssl: Whether or not to use SSL for the SMTP connection
+    :param persistent_connection: Keep the SMTP session open between notifications
+        using a shared :class:`SMTPConnectionPool`
+    :param bcc: Send the message to the recipients as blind carbon copy, so
+        the recipients do not see each other
+    :param attach_output: Only put a summary of the start and end of the output
+        into the message and attach the complete output as gzip compressed file
+        if the output is longer than ``email_attachment_threshold`` characters.
+        The attachment is cut off after ``email_attachment_max_size`` bytes
+    :param outbox: path of a :class:`NotificationOutbox` database. If set, messages are
+        stored in the outbox and sent by a background thread that retries failed
+        deliveries, so no notification is lost if the SMTP server is unavailable.
+        An empty string sends the messages directly
+
+    :param \**kwargs: additional keyword parameters passed to :class:`Notify`
+
+    All optional parameters are initialized from the effective ``.pytb.config``
+    if they are passed ``None``
+    """
+
+    message_template = dedent(
+        """\
+        Hello {recipient},
+        {task} {reason}. {exinfo}
+
+        {code_block}
+
+        produced output:
+
+        {output}
+    """
+    )
+    """
+    The message template used to create the message content.
+
+    You can customize it by overwriting the instance-variable or by
+    deriving your custom :class:`NotifyViaEmail`.
+
+    The following placeholders are available:
+
+    - ``task``
+    - ``sender``
+    - ``recipient`` (all recipients or ``undisclosed-recipients`` if :attr:`bcc` is set)
+    - ``reason``
+    - ``exinfo``
+    - ``code_block``
+    - ``output``
+    """
+
+    subject_template = "{task} on {sender} {reason}"
+    """
+    The template that is used as subject line in the mail.
+
+    You can customize it by the same techniques as the :attr:`message_template`.
+    The same placeholders are available.
+    """
+
+    def __init__(
+        self,
+        task: str,
+        email_addresses: Optional[Sequence[str]] = None,
+        sender: Optional[str] = None,
+        smtp_host: Optional[str] = None,
+        smtp_port: Optional[int] = None,
+        smtp_ssl: Optional[bool] = None,
+        persistent_connection: Optional[bool] = None,
+        bcc: Optional[bool] = None,
+        attach_output: Optional[bool] = None,
+        outbox: Optional[str] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(task, **kwargs)
+
+        notify_config = get_config()["notify"]
+
+        if isinstance(email_addresses, str):
+            email_addresses = [email_addresses]
+        if email_addresses is None:
+            email_addresses = notify_config.getlist("email_addresses")
+        self.email_addresses = email_addresses
+
+        if smtp_host is None:
+            smtp_host = notify_config.get("smtp_host")
+
+        if smtp_port is None:
+            smtp_port = notify_config.getint("smtp_port")
+
+        if smtp_ssl is None:
+            smtp_ssl = notify_config.getboolean("smtp_ssl")
+
+        if persistent_connection is None:
+            persistent_connection = notify_config.getboolean("smtp_persistent")
+
+        if bcc is None:
+            bcc = notify_config.getboolean("email_bcc")
+        self.bcc = bcc
+
+        if attach_output is None:
+            attach_output = notify_config.getboolean("email_attach_output")
+        self.attach_output = attach_output
+        self.attachment_threshold = int(notify_config["email_attachment_threshold"])
+        self.inline_head_size = int(notify_config["email_inline_head_size"])
+        self.inline_tail_size = int(notify_config["email_inline_tail_size"])
+        self.attachment_max_size = int(notify_config["email_attachment_max_size"])
+
+        if sender is None:
+            sender = notify_config.get("sender")
+        if not sender:
+            sender = f"notify@{getfqdn()}"
+        self.sender = sender
+
+        if not email_addresses:
+            self._logger.warning(
+                "email_addresses is an empty list, no emails will be sent"
+            )
+            self.smtp_class = None
+            self.connection_pool = None
+            self.outbox = None
+        else:
+            self._logger.info(
+                f"Notify object configured to send emails to {email_addresses}"
+            )
+            self.smtp_class = smtplib.SMTP_SSL if smtp_ssl else smtplib.SMTP
+            self.smtp_host = smtp_host
+            self.smtp_port = smtp_port
+            self.smtp_timeout = float(notify_config["smtp_timeout"])
+            self.connection_pool = (
+                SMTPConnectionPool.shared(
+                    self.smtp_class, cast(str, smtp_host), cast(int, smtp_port)
+                )
+                if persistent_connection
+                else None
+            )
+
+            if outbox is None:
+                outbox = notify_config.get("email_outbox")
+            scheme = "smtps" if smtp_ssl else "smtp"
+            # the outbox is shared by all notifiers sending to this server, so it
+            # delivers through the server settings instead of this notifier
+            self.outbox = (
+                NotificationOutbox.shared(
+                    outbox,
+                    f"{scheme}://{smtp_host}:{smtp_port}",
+                    partial(
+                        _send_stored_email,
+                        self.smtp_class,
+                        cast(str, smtp_host),
+                        cast(int, smtp_port),
+                        self.smtp_timeout,
+                        self.connection_pool,
+                    ),
+                )
+                if outbox
+                else None
+            )
+
+    def _create_message(
+        self,
+        recipients: Sequence[str],
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+        attachment: Optional[bytes] = None,
+    ) -> EmailMessage:
+        if caller_frame is not None:
+            code_block = _get_caller_code_fragment(caller_frame)
+        else:
+            code_block = "<caller not available>"
+
+        output = "<No output produced>" if not output else output
+        exinfo = (
+            f"\n\nThe following exception occurred:\n{str(exception)}\n"
+            if exception is not None
+            else ""
+        )
 
-        total_iterations = str(len(iterable)) if hasattr(iterable, "__len__") else "???"
+        recipient = "undisclosed-recipients" if self.bcc else ", ".join(recipients)
 
-        for iteration, item in enumerate(iterable):
-            iteration_num = iteration + 1
-            notification_context = nullcontext()
-            if (
-                iteration_num % after_every == 0
-                or str(iteration_num) == total_iterations
-            ):
-                notification_context = self.when_done(
-                    capture_output=capture_output,
-                    only_if_error=False,
-                    caller_frame=caller_frame,
-                    reason_prefix=f"Iteration {iteration_num}/{total_iterations}",
-                )
+        subject = self.subject_template.format(
+            task=task,
+            sender=self.sender,
+            recipient=recipient,
+            reason=reason,
+            exinfo=exinfo,
+            code_block=code_block,
+            output=output,
+        )
+
+        content = self.message_template.format(
+            task=task,
+            sender=self.sender,
+            recipient=recipient,
+            reason=reason,
+            exinfo=exinfo,
+            code_block=code_block,
+            output=output,
+        )
 
-            with notification_context:
-                yield item
+        msg = EmailMessage()
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        # smtplib sends the message to all Bcc addresses but removes the header
+        msg["Bcc" if self.bcc else "To"] = ", ".join(recipients)
+        msg.set_content(content)
+        msg.set_type("text/plain")
+
+        if attachment is not None:
+            filename = re.sub(r"[^\w.-]+", "_", task) + "-output.txt.gz"
+            msg.add_attachment(
+                attachment, maintype="application", subtype="gzip", filename=filename
+            )
+        return msg
+
+    def _summarize_output(
+        self, output: Union[CaptureSnapshot, str]
+    ) -> Tuple[str, Optional[bytes]]:
+        """
+        If :attr:`attach_output` is set and the output exceeds the
+        :attr:`attachment_threshold`, shorten the output to its first
+        :attr:`inline_head_size` and last :attr:`inline_tail_size` characters
+        and compress the complete output.
+
+        The output is compressed chunk by chunk, so the complete output of a
+        :class:`pytb.io.CaptureSnapshot` is never held in memory. The compressed
+        data is kept in memory, compression stops once it reaches
+        :attr:`attachment_max_size` bytes and the rest of the output is not attached.
+
+        :param output: the captured output
+        :return: the (shortened) output and the compressed attachment or
+            ``None`` if no attachment is needed
+        """
+        total_length = (
+            output.total_length if isinstance(output, CaptureSnapshot) else len(output)
+        )
+        if not self.attach_output or total_length <= self.attachment_threshold:
+            return output, None
+
+        chunks: Iterable[str] = (
+            output.chunks()
+            if isinstance(output, CaptureSnapshot)
+            else (output[i : i + 65536] for i in range(0, len(output), 65536))
+        )
+        attached_length = 0
+        # wbits=31 selects the gzip container format
+        compressor = zlib.compressobj(wbits=31)
+        compressed = bytearray()
+        for chunk in chunks:
+            if len(compressed) >= self.attachment_max_size:
+                break
+            compressed += compressor.compress(chunk.encode("utf-8"))
+            attached_length += len(chunk)
+        compressed += compressor.flush()
+        attachment = bytes(compressed)
+
+        note = "see attachment"
+        if attached_length < total_length:
+            note += f", truncated after {attached_length} characters"
+        omitted = total_length - self.inline_head_size - self.inline_tail_size
+        if omitted > 0:
+            tail = output[-self.inline_tail_size :] if self.inline_tail_size else ""
+            output = (
+                f"{output[: self.inline_head_size]}\n"
+                f"<{omitted} characters omitted, {note}>\n"
+                f"{tail}"
+            )
+        return output, attachment
 
     def _send_notification(
         self,
@@ -458,163 +2585,636 @@ class Notify:
         output: str,
         exception: Optional[Exception] = None,
     ) -> None:
-        """
-        Handle the actual notification. Overwrite this method to specify your own Notifier
-        over any communication mechanism you may desire.
-        """
-        raise NotImplementedError()
 
+        if self.smtp_class is not None:
+            output, attachment = self._summarize_output(output)
+            if self.render_outputs:
+                output = render_text(output)
+
+            # a single message in a single transaction for all recipients
+            message = self._create_message(
+                self.email_addresses,
+                task,
+                reason,
+                caller_frame,
+                output,
+                exception,
+                attachment,
+            )
 
-class NotifyViaEmail(Notify):
-    """
-    A :class:`NotifyViaEmail` object uses an SMTP connection to send notification via emails.
-    The SMTP server is configured either at runtime or via the effective ``.pytb.config``
-    files ``notify`` section.
+            if self.outbox is not None:
+                self._logger.info(f"storing message to {self.email_addresses}")
+                self.outbox.put(message.as_bytes())
+                return
 
-    :param email_addresses: a single email address or a list of addresses. Each entry is a seperate
-        recipient of the notification send by this ``Notify``
-    :param task: A short description of the monitored block.
-    :param sender: Sender name to use. If empty, use this machines FQDN
-    :param smtp_host: The SMTP servers address used to send the notifications
-    :param smtp_port: The TCP port of the SMTP server
-    :param smtp_ssl: Whether or not to use SSL for the SMTP connection
+            self._logger.info(f"sending message to {self.email_addresses}")
 
-    All optional parameters are initialized from the effective ``.pytb.config``
-    if they are passed ``None``
-    """
+            # pylint: disable=broad-except
+            try:
+                self._send_message(message)
+            except Exception as current_exception:
+                # we do not want to disrupt the user program if we fail to send the message
+                self._logger.exception(
+                    f"error during sending of notification", current_exception
+                )
 
-    message_template = dedent(
-        """\
-        Hello {recipient},
-        {task} {reason}. {exinfo}
+    def _send_message(self, message: EmailMessage) -> None:
+        """
+        Send ``message`` via the configured SMTP server
 
-        {code_block}
+        :raises smtplib.SMTPException: if the message could not be sent
+        """
+        _send_email(
+            cast(Type[smtplib.SMTP], self.smtp_class),
+            cast(str, self.smtp_host),
+            cast(int, self.smtp_port),
+            self.smtp_timeout,
+            self.connection_pool,
+            message,
+        )
 
-        produced output:
 
-        {output}
-    """
-    )
+class NotifyViaStream(Notify):
+    r"""
+    :class:`NotifyViaStream` will write string representations of notifications
+    to the specified writable ``stream``. This may be useful when the stream is
+    a UNIX or TCP socket.
+
+    Also useful when when the stream is a ``io.StringIO`` object for testing.
+
+    The string representation of the notification can be configured via the
+    :attr:`notification_template` attribute which can be overwritten on a
+    per-instance basis.
+
+    :param task: A short description of the monitored block.
+    :param stream: A writable stream where notification should be written to.
+    :param \**kwargs: additional keyword parameters passed to :class:`Notify`
     """
-    The message template used to create the message content.
 
-    You can customize it by overwriting the instance-variable or by
-    deriving your custom :class:`NotifyViaEmail`.
+    notification_template = "{task}\t{reason}\t{exinfo}\t{output}\n"
+    """
+    The string that is written to the stream after replacing all placeholders
+    with the notifications properties.
 
-    The following placeholders are available:
+    The following placeholders are available
 
     - ``task``
-    - ``sender``
-    - ``recipient``
     - ``reason``
     - ``exinfo``
     - ``code_block``
     - ``output``
     """
 
-    subject_template = "{task} on {sender} {reason}"
-    """
-    The template that is used as subject line in the mail.
+    def __init__(self, task: str, stream: IO[Any], **kwargs: Any):
+        super().__init__(task, **kwargs)
+        self.stream = stream
+
+    def _send_notification(
+        self,
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+    ) -> None:
+        if caller_frame is not None:
+            code_block = _get_caller_code_fragment(caller_frame)
+        else:
+            code_block = "<caller not available>"
+
+        output = "<No output produced>" if not output else output.strip()
+
+        if self.render_outputs:
+            output = render_text(output)
+
+        exinfo = f"{str(exception)}" if exception is not None else ""
+
+        content = self.notification_template.format(
+            task=task,
+            reason=reason,
+            exinfo=exinfo,
+            code_block=code_block,
+            output=output,
+        )
+
+        self.stream.write(content)
+
+
+class NotifyViaWebhook(Notify):
+    r"""
+    :class:`NotifyViaWebhook` posts notifications as JSON to an HTTP(S) endpoint,
+    e.g. the incoming webhook of a chat or incident management tool.
+
+    Notifications are queued and sent by a background thread of the notifier,
+    so the monitored code is never blocked by the HTTP requests. All notifications
+    that arrive within ``batch_interval`` seconds (up to ``batch_size``) are sent
+    in a single request. The HTTP connection is kept open between requests.
+    Failed requests (connection errors, status ``429`` and ``5xx``) are
+    retried ``max_retries`` times with exponential backoff.
+
+    By default, the request body is an object with a list of ``notifications``
+    with the keys ``task``, ``host``, ``reason``, ``exinfo``, ``code_block``, ``output``
+    and ``timestamp``. Overwrite :meth:`_create_payload` to create the payload your
+    endpoint expects.
+
+    :param task: A short description of the monitored block.
+    :param url: The ``http://`` or ``https://`` url the notifications are posted to
+    :param headers: additional HTTP headers sent with each request (e.g. for authorization)
+    :param batch_size: maximum number of notifications sent in a single request
+    :param batch_interval: number of seconds to wait for more notifications
+        before sending a request
+    :param max_retries: number of retries of a failed request
+    :param backoff: number of seconds to wait before the first retry.
+        The time is doubled for each further retry
+    :param timeout: timeout of the HTTP connection in seconds
+    :param \**kwargs: additional keyword parameters passed to :class:`Notify`
+
+    All optional parameters are initialized from the ``webhook_*`` options of the
+    effective ``.pytb.config`` s ``notify`` section if they are passed ``None``
+    """
+
+    retry_status_codes = (429, 500, 502, 503, 504)
+    """
+    HTTP status codes of responses that cause a retry of the request
+    """
+
+    worker_idle_timeout = 30.0
+    """
+    Number of seconds the background thread waits for new notifications before it exits.
+    A new thread is started for the next notification
+    """
+
+    _exit_flush: "_ExitFlushRegistry[NotifyViaWebhook]" = _ExitFlushRegistry(
+        lambda notifier: notifier.flush(
+            float(get_config()["notify"]["dispatch_flush_timeout"])
+        )
+    )
+
+    def __init__(
+        self,
+        task: str,
+        url: Optional[str] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        batch_size: Optional[int] = None,
+        batch_interval: Optional[_Interval] = None,
+        max_retries: Optional[int] = None,
+        backoff: Optional[_Interval] = None,
+        timeout: Optional[_Interval] = None,
+        **kwargs: Any,
+    ):
+        super().__init__(task, **kwargs)
+
+        notify_config = get_config()["notify"]
+
+        if url is None:
+            url = notify_config["webhook_url"]
+        if batch_size is None:
+            batch_size = int(notify_config["webhook_batch_size"])
+        if batch_interval is None:
+            batch_interval = float(notify_config["webhook_batch_interval"])
+        if max_retries is None:
+            max_retries = int(notify_config["webhook_max_retries"])
+        if backoff is None:
+            backoff = float(notify_config["webhook_backoff"])
+        if timeout is None:
+            timeout = float(notify_config["webhook_timeout"])
+
+        parsed_url = urlsplit(url)
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.hostname:
+            raise ValueError(f"'{url}' is not a valid http(s) url")
+
+        self.url = url
+        self.headers = {"Content-Type": "application/json", **(headers or {})}
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = _interval_seconds(batch_interval)
+        self.max_retries = max_retries
+        self.backoff = _interval_seconds(backoff)
+        self.timeout = _interval_seconds(timeout)
+        self.host = getfqdn()
+
+        self._connection_class = (
+            http.client.HTTPSConnection
+            if parsed_url.scheme == "https"
+            else http.client.HTTPConnection
+        )
+        self._address = (parsed_url.hostname, parsed_url.port)
+        self._path = urlunsplit(("", "", parsed_url.path or "/", parsed_url.query, ""))
+        self._connection: Optional[http.client.HTTPConnection] = None
+
+        self.connections_opened = 0
+        """
+        Number of HTTP connections opened by this notifier
+        """
+
+        self._queue: "Queue[Dict[str, Any]]" = Queue(
+            int(notify_config["webhook_queue_size"])
+        )
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_lock = threading.Lock()
+
+        # queued notifications are sent when the interpreter exits
+        NotifyViaWebhook._exit_flush.add(self)
+
+    @classmethod
+    def flush_all(cls) -> None:
+        """
+        Wait until the queued notifications of all notifiers that are still alive are
+        sent, at most ``dispatch_flush_timeout`` seconds each
+        """
+        cls._exit_flush.flush_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until all queued notifications are sent (or given up on)
+
+        :param timeout: maximum number of seconds to wait. ``None`` waits forever
+        :return: ``True`` if the queue was drained within the timeout
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _create_payload(self, notifications: List[Dict[str, Any]]) -> Any:
+        """
+        Create the JSON serializable body of a request from a batch of notifications.
+        Overwrite this method to adapt the payload to your endpoint.
+        """
+        return {"notifications": notifications}
+
+    def _send_notification(
+        self,
+        task: str,
+        reason: str,
+        caller_frame: Optional[FrameType],
+        output: str,
+        exception: Optional[Exception] = None,
+    ) -> None:
+        if caller_frame is not None:
+            code_block = _get_caller_code_fragment(caller_frame)
+        else:
+            code_block = "<caller not available>"
+
+        if self.render_outputs:
+            output = render_text(output)
+
+        notification = {
+            "task": task,
+            "host": self.host,
+            "reason": reason,
+            "exinfo": str(exception) if exception is not None else "",
+            "code_block": code_block,
+            "output": str(output),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        }
+
+        with self._idle:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(notification)
+        except Full:
+            self._mark_done()
+            self._logger.warning(
+                f"webhook queue is full, dropping notification '{task} {reason}'"
+            )
+            return
+
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="pytb-webhook", daemon=True
+                )
+                self._worker.start()
+
+    def _mark_done(self, count: int = 1) -> None:
+        with self._idle:
+            self._pending -= count
+            if self._pending == 0:
+                self._idle.notify_all()
+
+    def _next_batch(self) -> List[Dict[str, Any]]:
+        """
+        Wait for the next notification and collect all notifications that arrive
+        within :attr:`batch_interval` (up to :attr:`batch_size`)
+
+        :raises queue.Empty: if no notification arrived within :attr:`worker_idle_timeout`
+        """
+        batch = [self._queue.get(timeout=self.worker_idle_timeout)]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            try:
+                batch = self._next_batch()
+            except Empty:
+                # exit while idle, so the thread does not keep the notifier alive.
+                # notifications queued after the check start a new thread
+                with self._worker_lock:
+                    if self._queue.empty():
+                        self._worker = None
+                        return
+                continue
+            # pylint: disable=broad-except
+            try:
+                self._post(batch)
+            except Exception:
+                self._logger.exception("error during sending of webhook notification")
+            finally:
+                self._mark_done(len(batch))
+
+    def _post(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        Send a batch of notifications. Retry with exponential backoff if the request fails
+
+        :return: ``True`` if the endpoint accepted the request
+        """
+        body = json.dumps(self._create_payload(batch)).encode("utf-8")
+
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                time.sleep(self.backoff * 2 ** (attempt - 1))
+
+            try:
+                connection = self._get_connection()
+                connection.request("POST", self._path, body, self.headers)
+                response = connection.getresponse()
+                # read the whole response, otherwise the connection can not be reused
+                response.read()
+            except (OSError, http.client.HTTPException) as error:
+                self._logger.warning(f"webhook request failed: {error}")
+                self._disconnect()
+                continue
+
+            if response.status < 300:
+                return True
+
+            self._logger.warning(
+                f"webhook request failed with status {response.status} {response.reason}"
+            )
+            if response.status not in self.retry_status_codes:
+                break
+
+        self._logger.error(f"giving up on {len(batch)} webhook notifications")
+        return False
+
+    def _get_connection(self) -> http.client.HTTPConnection:
+        if self._connection is None:
+            host, port = self._address
+            self._connection = self._connection_class(host, port, timeout=self.timeout)
+            self.connections_opened += 1
+        return self._connection
+
+    def _disconnect(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+
+class _NotifierWorker:
+    """
+    Calls :meth:`Notify._send_notification` of a single notifier on a
+    daemon thread, one notification after another.
+    Used by :class:`NotifyViaMultiple`.
+
+    While the notifier is busy, only the latest notification is kept. An older
+    pending notification is dropped (its future is cancelled), so a hanging
+    backend does not pile up notifications in memory.
+    """
+
+    def __init__(self, notifier: Notify):
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
+        )
+
+        self.notifier = notifier
+        self._pending: Optional[Tuple["Future[None]", Tuple[Any, ...]]] = None
+        self._pending_changed = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+
+    def submit(self, *args: Any) -> "Future[None]":
+        """
+        Queue a notification. All ``args`` are passed to ``_send_notification``
+
+        :return: a future that is resolved once the notification is sent
+            and cancelled if a newer notification replaces it
+        """
+        future: "Future[None]" = Future()
+
+        with self._pending_changed:
+            if self._pending is not None:
+                dropped, (task, reason, *_) = self._pending
+                dropped.cancel()
+                self._logger.warning(
+                    f"{type(self.notifier).__name__} is still busy, dropped the "
+                    f"notification '{task} {reason}'"
+                )
+            self._pending = (future, args)
+            self._pending_changed.notify()
+
+            # (re)start the thread lazily, it does not survive a fork
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name=f"pytb-{type(self.notifier).__name__}",
+                    daemon=True,
+                )
+                self._thread.start()
+        return future
+
+    def _run(self) -> None:
+        while True:
+            with self._pending_changed:
+                while self._pending is None:
+                    self._pending_changed.wait()
+                future, args = self._pending
+                self._pending = None
+
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            # pylint: disable=broad-except,protected-access
+            try:
+                self.notifier._send_notification(*args)
+                future.set_result(None)
+            except Exception as exception:
+                future.set_exception(exception)
+
+
+class NotifyViaMultiple(Notify):
+    r"""
+    :class:`NotifyViaMultiple` delivers each notification via several other
+    :class:`Notify` objects (e.g. an email and a webhook).
+
+    Contrary to stacking the contexts of several notifiers, the output is captured
+    only once. The notifications are sent by calling the :meth:`Notify._send_notification`
+    method of all ``notifiers`` concurrently. Each notifier gets its own
+    worker thread, so a slow or hanging backend does not delay the others.
+    The monitored code waits at most ``timeout`` seconds for the backends.
+    Backends that did not finish in time keep sending in the background.
+    While a backend is busy, only its latest notification waits, older ones
+    are dropped with a warning.
+
+    The ``asynchronous``, ``digest_window`` and ``rate_limits`` options of the
+    ``notifiers`` are not used, pass them to the :class:`NotifyViaMultiple` instead.
 
-    You can customize it by the same techniques as the :attr:`message_template`.
-    The same placeholders are available.
+    :param task: A short description of the monitored block.
+    :param notifiers: the :class:`Notify` objects used to deliver the notifications
+    :param timeout: maximum number of seconds to wait for each backend.
+        If ``None``, the ``multiple_timeout`` option of the effective ``.pytb.config``
+        s ``notify`` section is used
+    :param \**kwargs: additional keyword parameters passed to :class:`Notify`
+
+    .. testsetup:: *
+
+        from pytb.notification import NotifyViaMultiple, NotifyViaStream
+
+    .. doctest::
+
+        >>> import io
+        >>> streams = [io.StringIO(), io.StringIO()]
+        >>> notify = NotifyViaMultiple(
+        ...     "task", [NotifyViaStream("task", stream) for stream in streams]
+        ... )
+        >>> notify.now("manual notification")
+        >>> for stream in streams:
+        ...     print(repr(stream.getvalue()))
+        'task\tmanual notification\t\t<output not available>\n'
+        'task\tmanual notification\t\t<output not available>\n'
     """
 
     def __init__(
         self,
         task: str,
-        email_addresses: Optional[Sequence[str]] = None,
-        sender: Optional[str] = None,
-        smtp_host: Optional[str] = None,
-        smtp_port: Optional[int] = None,
-        smtp_ssl: Optional[bool] = None,
+        notifiers: Sequence[Notify],
+        timeout: Optional[_Interval] = None,
+        **kwargs: Any,
     ):
-        super().__init__(task)
-
-        notify_config = current_config["notify"]
-
-        if isinstance(email_addresses, str):
-            email_addresses = list(email_addresses)
-        if email_addresses is None:
-            email_addresses = notify_config.getlist("email_addresses")
-
-        if smtp_host is None:
-            smtp_host = notify_config.get("smtp_host")
-
-        if smtp_port is None:
-            smtp_port = notify_config.getint("smtp_port")
-
-        if smtp_ssl is None:
-            smtp_ssl = notify_config.getboolean("smtp_ssl")
+        super().__init__(task, **kwargs)
 
-        if sender is None:
-            sender = notify_config.get("sender")
-        if not sender:
-            sender = f"notify@{getfqdn()}"
-        self.sender = sender
+        if timeout is None:
+            timeout = float(get_config()["notify"]["multiple_timeout"])
 
-        if not email_addresses:
-            self._logger.warning(
-                "email_addresses is an empty list, no emails will be sent"
-            )
-            self.smtp_class = None
-        else:
-            self._logger.info(
-                f"Notify object configured to send emails to {email_addresses}"
-            )
-            self.email_addresses = email_addresses
-            self.smtp_class = smtplib.SMTP_SSL if smtp_ssl else smtplib.SMTP
-            self.smtp_host = smtp_host
-            self.smtp_port = smtp_port
+        self.notifiers = list(notifiers)
+        self.timeout = _interval_seconds(timeout)
+        self._workers = [_NotifierWorker(notifier) for notifier in self.notifiers]
 
-    def _create_message(
+    def _send_notification(
         self,
-        recipient: str,
         task: str,
         reason: str,
         caller_frame: Optional[FrameType],
         output: str,
         exception: Optional[Exception] = None,
-    ) -> EmailMessage:
-        if caller_frame is not None:
-            code_block = _get_caller_code_fragment(caller_frame)
-        else:
-            code_block = "<caller not available>"
+    ) -> None:
+        # the backends render the code block after the caller moved on
+        caller_frame = _snapshot_frame(caller_frame)
 
-        output = "<No output produced>" if not output else output
-        exinfo = (
-            f"\n\nThe following exception occurred:\n{str(exception)}\n"
-            if exception is not None
-            else ""
-        )
+        futures = [
+            worker.submit(task, reason, caller_frame, output, exception)
+            for worker in self._workers
+        ]
 
-        subject = self.subject_template.format(
-            task=task,
-            sender=self.sender,
-            recipient=recipient,
-            reason=reason,
-            exinfo=exinfo,
-            code_block=code_block,
-            output=output,
-        )
+        deadline = time.monotonic() + self.timeout
+        for notifier, future in zip(self.notifiers, futures):
+            try:
+                future.result(max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                self._logger.warning(
+                    f"{type(notifier).__name__} did not send the notification "
+                    f"'{task} {reason}' within {self.timeout} seconds"
+                )
+            except CancelledError:
+                # replaced by a newer notification, the worker logged the drop
+                pass
+            except Exception:  # pylint: disable=broad-except
+                # one broken backend must not prevent the others from sending
+                self._logger.exception(
+                    f"error during sending of notification via {type(notifier).__name__}"
+                )
 
-        content = self.message_template.format(
-            task=task,
-            sender=self.sender,
-            recipient=recipient,
-            reason=reason,
-            exinfo=exinfo,
-            code_block=code_block,
-            output=output,
+
+def _default_daemon_socket() -> str:
+    """
+    The socket path of the notification daemon. If the ``daemon_socket`` option of
+    the effective ``.pytb.config`` s ``notify`` section is empty, a per-user path in
+    the temporary directory is used
+    """
+    socket_path = str(get_config()["notify"]["daemon_socket"])
+    if not socket_path:
+        socket_path = os.path.join(
+            tempfile.gettempdir(), f"pytb-notify-{os.getuid()}.sock"
         )
+    return os.path.expanduser(socket_path)
 
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = self.sender
-        msg["To"] = recipient
-        msg.set_content(content)
-        msg.set_type("text/plain")
-        return msg
+
+class _RemoteException(Exception):
+    """
+    An exception that was raised in the process that sent a notification
+    to the :class:`NotificationDaemon`
+    """
+
+
+class NotifyViaDaemon(Notify):
+    r"""
+    :class:`NotifyViaDaemon` sends notifications to a :class:`NotificationDaemon`
+    running on the same machine (e.g. started with ``pytb notify-daemon``).
+
+    Each notification is a single datagram written to the daemons UNIX socket.
+    The write only waits if the receive queue of the daemon is full and at most
+    ``daemon_send_timeout`` seconds. If the daemon is not running or can not keep up,
+    the notification is dropped with a warning. The daemon takes care of deduplication,
+    digests and the delivery via a single SMTP session for all processes.
+
+    The output is shortened to its first and last ``daemon_max_output / 2`` characters
+    so a notification fits into a single datagram. The code block is not sent,
+    the daemon reads it from the source file.
+
+    :param task: A short description of the monitored block.
+    :param socket_path: Path of the daemons socket. If ``None``, the ``daemon_socket``
+        option of the effective ``.pytb.config`` s ``notify`` section is used
+    :param \**kwargs: additional keyword parameters passed to :class:`Notify`
+    """
+
+    def __init__(self, task: str, socket_path: Optional[str] = None, **kwargs: Any):
+        super().__init__(task, **kwargs)
+
+        if socket_path is None:
+            socket_path = _default_daemon_socket()
+        self.socket_path = socket_path
+        self.max_output = int(get_config()["notify"]["daemon_max_output"])
+        self.send_timeout = float(get_config()["notify"]["daemon_send_timeout"])
+
+        self._socket: Optional[socket.socket] = None
+        self._pid = os.getpid()
+
+    def close(self) -> None:
+        """
+        Close the socket used to send notifications to the daemon.
+        It is opened again for the next notification
+        """
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def _get_socket(self) -> socket.socket:
+        # a forked child must not share the socket with its parent
+        if self._pid != os.getpid():
+            self.close()
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            # a send only blocks if the receive queue of the daemon is full
+            self._socket.settimeout(self.send_timeout)
+            self._pid = os.getpid()
+        return self._socket
 
     def _send_notification(
         self,
@@ -624,92 +3224,401 @@ class NotifyViaEmail(Notify):
         output: str,
         exception: Optional[Exception] = None,
     ) -> None:
-
         if self.render_outputs:
             output = render_text(output)
 
-        messages = (
-            self._create_message(address, task, reason, caller_frame, output, exception)
-            for address in self.email_addresses
+        if len(output) > self.max_output:
+            keep = self.max_output // 2
+            output = (
+                f"{output[:keep]}\n"
+                f"<{len(output) - 2 * keep} characters omitted>\n"
+                f"{output[-keep:]}"
+            )
+
+        message = {
+            "task": task,
+            "reason": reason,
+            "exinfo": str(exception) if exception is not None else None,
+            "filename": (
+                caller_frame.f_code.co_filename if caller_frame is not None else None
+            ),
+            "lineno": caller_frame.f_lineno if caller_frame is not None else None,
+            "output": str(output),
+        }
+
+        try:
+            self._get_socket().sendto(
+                json.dumps(message, ensure_ascii=False).encode("utf-8"),
+                self.socket_path,
+            )
+        except OSError as error:
+            # fire and forget, the monitored code must never wait for the daemon
+            self._logger.warning(
+                f"could not send notification '{task} {reason}' to the daemon "
+                f"at {self.socket_path}: {error}"
+            )
+
+
+class NotificationDaemon:
+    """
+    Receives notifications of :class:`NotifyViaDaemon` objects from all processes of
+    the machine on a UNIX datagram socket and delivers them with a single ``notifier``
+    (usually a :class:`NotifyViaEmail` with a ``digest_window``).
+
+    Notifications with the same task, reason, exception, code location and output
+    that are received again within ``dedupe_window`` seconds are dropped.
+    Failures are never held back by the digest of the ``notifier``.
+
+    :param notifier: the :class:`Notify` used to deliver all received notifications
+    :param socket_path: path of the socket to listen on. If ``None``, the ``daemon_socket``
+        option of the effective ``.pytb.config`` s ``notify`` section is used
+    :param dedupe_window: number of seconds to drop duplicate notifications.
+        If ``None``, the ``daemon_dedupe_window`` option is used
+    """
+
+    def __init__(
+        self,
+        notifier: Notify,
+        socket_path: Optional[str] = None,
+        dedupe_window: Optional[_Interval] = None,
+    ):
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
         )
 
-        if self.smtp_class is not None:
-            # pylint: disable=broad-except
+        if socket_path is None:
+            socket_path = _default_daemon_socket()
+        if dedupe_window is None:
+            dedupe_window = float(get_config()["notify"]["daemon_dedupe_window"])
+
+        self.notifier = notifier
+        self.socket_path = socket_path
+        self.dedupe_window = _interval_seconds(dedupe_window)
+        self.received = 0
+        """
+        Number of received notifications (including duplicates)
+        """
+        self.duplicates = 0
+        """
+        Number of dropped duplicate notifications
+        """
+
+        self._seen: Dict[bytes, float] = {}
+        self._stop = threading.Event()
+        self._socket = self._bind()
+
+    def _bind(self) -> socket.socket:
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
             try:
-                with self.smtp_class(self.smtp_host, self.smtp_port) as smtp:
-                    for message in messages:
-                        self._logger.info(f"sending message to {message['To']}")
-                        smtp.send_message(message)
-            except Exception as current_exception:
-                # we do not want to disrupt the user program if we fail to send the message
-                self._logger.exception(
-                    f"error during sending of notification", current_exception
+                probe.connect(self.socket_path)
+            except ConnectionRefusedError:
+                # left over by a daemon that did not exit cleanly
+                os.unlink(self.socket_path)
+            else:
+                raise RuntimeError(
+                    f"a notification daemon is already listening on {self.socket_path}"
                 )
+            finally:
+                probe.close()
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        server.bind(self.socket_path)
+        # only the user running the daemon may send notifications
+        os.chmod(self.socket_path, 0o600)
+        # absorb bursts of notifications without dropping them in the clients
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        server.settimeout(0.5)
+        return server
+
+    def serve_forever(self) -> None:
+        """
+        Receive and deliver notifications until :meth:`close` is called
+        """
+        self._logger.info(f"listening for notifications on {self.socket_path}")
+        while not self._stop.is_set():
+            try:
+                data = self._socket.recv(1024 * 1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                if self._stop.is_set():
+                    break
+                raise
 
+            # pylint: disable=broad-except
+            try:
+                self.handle_message(data)
+            except Exception:
+                self._logger.exception("could not handle received notification")
 
-class NotifyViaStream(Notify):
-    """
-    :class:`NotifyViaStream` will write string representations of notifications
-    to the specified writable ``stream``. This may be useful when the stream is
-    a UNIX or TCP socket.
+    def handle_message(self, data: bytes) -> None:
+        """
+        Deliver a single notification received from a :class:`NotifyViaDaemon`
+        """
+        message = json.loads(data)
+        self.received += 1
+
+        now = time.monotonic()
+        self._seen = {
+            key: expires for key, expires in self._seen.items() if expires > now
+        }
+        # a stable digest, unlike hash() it does not depend on the process
+        key = hashlib.sha1(
+            json.dumps(
+                [
+                    message["task"],
+                    message["reason"],
+                    message["exinfo"],
+                    message["filename"],
+                    message["lineno"],
+                    message["output"],
+                ]
+            ).encode()
+        ).digest()
+        if key in self._seen:
+            self.duplicates += 1
+            return
+        self._seen[key] = now + self.dedupe_window
 
-    Also useful when when the stream is a ``io.StringIO`` object for testing.
+        caller_frame = (
+            cast(
+                FrameType,
+                _FrameSnapshot.from_location(message["filename"], message["lineno"]),
+            )
+            if message["filename"] is not None
+            else None
+        )
+        exception = (
+            _RemoteException(message["exinfo"])
+            if message["exinfo"] is not None
+            else None
+        )
+        # pylint: disable=protected-access
+        self.notifier._dispatch_notification(
+            message["task"],
+            message["reason"],
+            caller_frame,
+            message["output"],
+            exception,
+        )
 
-    The string representation of the notification can be configured via the
-    :attr:`notification_template` attribute which can be overwritten on a
-    per-instance basis.
+    def close(self) -> None:
+        """
+        Stop :meth:`serve_forever`, deliver all pending digests and remove the socket
+        """
+        self._stop.set()
+        self._socket.close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        # pylint: disable=protected-access
+        if self.notifier._digest is not None:
+            self.notifier._digest.flush()
 
-    :param task: A short description of the monitored block.
-    :param stream: A writable stream where notification should be written to.
+
+class TimerHandle:
+    """
+    A callback scheduled on the :class:`TimerService`
+
+    :param deadline: ``time.monotonic()`` value of the next execution
+    :param interval: number of seconds between executions or ``None``
+        to execute the callback only once
+    :param callback: the function to execute
+    :param args: positional parameters passed to the callback
+    :param kwargs: keyword parameters passed to the callback
     """
 
-    notification_template = "{task}\t{reason}\t{exinfo}\t{output}\n"
+    __slots__ = ("deadline", "interval", "callback", "args", "kwargs", "_cancelled")
+
+    def __init__(
+        self,
+        deadline: float,
+        interval: Optional[float],
+        callback: Callable[..., Any],
+        args: Sequence[Any],
+        kwargs: Mapping[str, Any],
+    ):
+        self.deadline = deadline
+        self.interval = interval
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self._cancelled = False
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        ``True`` if the handle was cancelled via :meth:`cancel`
+        """
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """
+        Prevent all future executions of the callback. An execution that
+        is currently running is not interrupted
+        """
+        self._cancelled = True
+
+
+class TimerService:
     """
-    The string that is written to the stream after replacing all placeholders
-    with the notifications properties.
+    Runs scheduled callbacks of the whole process on a single background thread.
 
-    The following placeholders are available
+    Pending callbacks are kept in a heap ordered by their deadline, so the thread
+    only wakes up when the next callback is due, no matter how many callbacks are
+    scheduled. All callbacks share the thread, so a callback should not block for
+    a long time. Notifications sent from callbacks are handed to the
+    :class:`NotificationDispatcher` automatically.
 
-    - ``task``
-    - ``reason``
-    - ``exinfo``
-    - ``code_block``
-    - ``output``
+    Use :meth:`instance` to get the service of the current process.
+
+    .. testsetup:: *
+
+        from pytb.notification import TimerService
+
+    .. doctest::
+
+        >>> import threading
+        >>> called = threading.Event()
+        >>> handle = TimerService.instance().call_later(0.01, called.set)
+        >>> called.wait(1)
+        True
     """
 
-    def __init__(self, task: str, stream: IO[Any]):
-        super().__init__(task)
-        self.stream = stream
+    _instance: Optional["TimerService"] = None
+    _instance_lock = threading.Lock()
 
-    def _send_notification(
+    def __init__(self) -> None:
+        self._logger = logging.getLogger(
+            f"{self.__class__.__module__}.{self.__class__.__name__}"
+        )
+
+        self._heap: List[Tuple[float, int, TimerHandle]] = []
+        self._sequence = itertools.count()
+        self._pushes_since_prune = 0
+        self._condition = threading.Condition()
+        self._pid = os.getpid()
+        self._thread = threading.Thread(
+            target=self._run, name="pytb-timer-service", daemon=True
+        )
+        self._thread.start()
+
+    @classmethod
+    def instance(cls) -> "TimerService":
+        """
+        Get the service of this process. The service is started on first use.
+        A forked child process gets its own service as the thread of the
+        parent does not survive the fork
+        """
+        with cls._instance_lock:
+            # pylint: disable=protected-access
+            if cls._instance is None or cls._instance._pid != os.getpid():
+                cls._instance = cls()
+            return cls._instance
+
+    @classmethod
+    def in_timer_thread(cls) -> bool:
+        """
+        ``True`` if the calling code runs in a callback of the service of this process
+        """
+        service = cls._instance
+        # pylint: disable=protected-access
+        return service is not None and threading.current_thread() is service._thread
+
+    def call_later(
+        self, delay: _Interval, callback: Callable[..., Any], *args: Any, **kwargs: Any
+    ) -> TimerHandle:
+        """
+        Execute ``callback`` once after ``delay`` seconds.
+        All other parameters are passed to the callback.
+        """
+        return self._schedule(_interval_seconds(delay), None, callback, args, kwargs)
+
+    def call_every(
         self,
-        task: str,
-        reason: str,
-        caller_frame: Optional[FrameType],
-        output: str,
-        exception: Optional[Exception] = None,
-    ) -> None:
-        if caller_frame is not None:
-            code_block = _get_caller_code_fragment(caller_frame)
-        else:
-            code_block = "<caller not available>"
+        interval: _Interval,
+        callback: Callable[..., Any],
+        *args: Any,
+        **kwargs: Any,
+    ) -> TimerHandle:
+        """
+        Execute ``callback`` every ``interval`` seconds until the returned handle is
+        cancelled. The callback is first executed after waiting the interval.
+        All other parameters are passed to the callback.
 
-        output = "<No output produced>" if not output else output.strip()
+        The executions are scheduled at a fixed rate. If a callback was delayed by
+        another callback, it runs as soon as possible and the following execution
+        is scheduled relative to that
+        """
+        seconds = _interval_seconds(interval)
+        return self._schedule(seconds, seconds, callback, args, kwargs)
 
-        if self.render_outputs:
-            output = render_text(output)
+    def _schedule(
+        self,
+        delay: float,
+        interval: Optional[float],
+        callback: Callable[..., Any],
+        args: Sequence[Any],
+        kwargs: Mapping[str, Any],
+    ) -> TimerHandle:
+        handle = TimerHandle(time.monotonic() + delay, interval, callback, args, kwargs)
+        with self._condition:
+            self._push(handle)
+        return handle
+
+    # number of pushes after which cancelled handles are removed from the heap.
+    # without pruning, many short-lived contexts with long intervals would
+    # accumulate in the heap until their deadlines pass
+    _prune_interval = 1024
+
+    def _push(self, handle: TimerHandle) -> None:
+        self._pushes_since_prune += 1
+        if self._pushes_since_prune >= self._prune_interval:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._pushes_since_prune = 0
+
+        heapq.heappush(self._heap, (handle.deadline, next(self._sequence), handle))
+        # wake up the thread in case the new deadline is the next one due
+        self._condition.notify()
+
+    def _next_due(self) -> TimerHandle:
+        with self._condition:
+            while True:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
 
-        exinfo = f"{str(exception)}" if exception is not None else ""
+                deadline, _, handle = self._heap[0]
+                if handle.cancelled:
+                    heapq.heappop(self._heap)
+                    continue
 
-        content = self.notification_template.format(
-            task=task,
-            reason=reason,
-            exinfo=exinfo,
-            code_block=code_block,
-            output=output,
-        )
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._condition.wait(remaining)
+                    continue
 
-        self.stream.write(content)
+                heapq.heappop(self._heap)
+                return handle
+
+    def _run(self) -> None:
+        while True:
+            handle = self._next_due()
+
+            # pylint: disable=broad-except
+            try:
+                handle.callback(*handle.args, **handle.kwargs)
+            except Exception:
+                # a failing callback must not stop the timers of everybody else
+                self._logger.exception("error in scheduled callback")
+
+            if handle.interval is not None and not handle.cancelled:
+                handle.deadline = max(
+                    handle.deadline + handle.interval, time.monotonic()
+                )
+                with self._condition:
+                    self._push(handle)
 
 
 class Timer(threading.Thread):
@@ -717,6 +3626,9 @@ class Timer(threading.Thread):
     A gracefully stoppable Thread with means to run a target function
     repedatley every ``X`` seconds.
 
+    Repeated executions started via :meth:`call_every` run on the
+    shared :class:`TimerService` instead of a thread of their own.
+
     :param target: the target function that will be executed in the thread
     :param \*args: additional positional parameters passed to the target function
     :param \**kwargs: additional keyword parameters passed to the target function
@@ -735,7 +3647,7 @@ class Timer(threading.Thread):
         self.args = args
         self.kwargs = kwargs
         self.interval: float = -1
-        self._stop_event = threading.Event()
+        self._handle: Optional[TimerHandle] = None
         super().__init__()
 
     def stop(self) -> None:
@@ -746,10 +3658,12 @@ class Timer(threading.Thread):
 
         :raises RuntimeError: if the thread was not started via :meth:`call_every`
         """
-        if self._stop_event is None:
+        if self._handle is None:
             raise RuntimeError("thread not started via 'run_every' function")
 
-        self._stop_event.set()
+        self._handle.cancel()
+        self._handle = None
+        self.interval = -1
 
     def call_every(self, interval: _Interval) -> None:
         """
@@ -761,26 +3675,12 @@ class Timer(threading.Thread):
             number of seconds between invocations of the target function
         """
         # make sure the interval is number representing fractional seconds
-        if isinstance(interval, timedelta):
-            interval = interval.total_seconds()
+        self.interval = _interval_seconds(interval)
 
-        self.interval = float(interval)
-
-        self.start()
+        self._handle = TimerService.instance().call_every(
+            self.interval, self.target, *self.args, **self.kwargs
+        )
 
     def run(self) -> None:
-        if self.interval == -1:
-            # this thread was not started via the ``call_every()``
-            # method, exit after the first execution
-            self.target(*self.args, **self.kwargs)
-        else:
-            while True:
-                self._stop_event.wait(self.interval)
-                # check if we got stopped while sleeping
-                # in this case, do not run the target again
-                if self._stop_event.is_set():
-                    break
-                self.target(*self.args, **self.kwargs)
-
-            self._stop_event.clear()
-            self.interval = -1
+        # this thread was started via ``start()``, exit after the first execution
+        self.target(*self.args, **self.kwargs)
@@ -12,7 +12,7 @@ from typing import Any, Optional, Iterator, TextIO, Mapping
 from io import RawIOBase
 from contextlib import contextmanager
 
-from pytb.config import current_config as pytb_config
+from pytb.config import get_config
 
 
 @contextmanager
@@ -79,9 +79,9 @@ class Rdb(pdb.Pdb):
         )
 
         # load the parameters from the config
-        config = pytb_config["rdb"]
+        config = get_config()["rdb"]
         host = config.get("bind_to") if host is None else host
-        port = int(config.get("port")) if port is None else port
+        port = config.getint("port") if port is None else port
         patch_stdio = (
             config.getboolean("patch_stdio") if patch_stdio is None else patch_stdio
         )
@@ -225,9 +225,9 @@ class RdbClient:
     def __init__(self, host: Optional[str] = None, port: Optional[int] = None):
 
         # load the parameters from the config
-        config = pytb_config["rdb"]
+        config = get_config()["rdb"]
         host = config.get("host") if host is None else host
-        port = int(config.get("port")) if port is None else port
+        port = config.getint("port") if port is None else port
 
         self.socket = socket.create_connection((host, port))
         self.socket_closed = False
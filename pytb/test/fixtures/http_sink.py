@@ -0,0 +1,65 @@
+"""
+A minimal local HTTP server that accepts and stores all posted JSON documents.
+Used as a stand-in for a webhook endpoint in the notification tests.
+"""
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _HTTPSinkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+
+        if self.server.failures > 0:
+            self.server.failures -= 1
+            status = 503
+        else:
+            status = 200
+            self.server.requests.append(
+                (self.path, dict(self.headers), json.loads(body))
+            )
+
+        self.send_response(status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPSink(ThreadingHTTPServer):
+    """
+    HTTP server listening on a random local port that stores all posted JSON documents.
+
+    :param failures: number of requests that are answered with ``503`` before
+        requests are accepted
+    """
+
+    daemon_threads = True
+
+    def __init__(self, failures=0):
+        super().__init__(("127.0.0.1", 0), _HTTPSinkHandler)
+        self.failures = failures
+        self.connections = 0
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
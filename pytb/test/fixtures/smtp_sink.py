@@ -0,0 +1,103 @@
+"""
+A minimal local SMTP server that accepts and stores all messages.
+Used as a stand-in for a real mail server in the notification tests.
+"""
+
+import socketserver
+import threading
+import time
+
+import pytb.notification
+
+
+class _SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self):
+        self.server.connections += 1
+        # simulate the cost of connection setup (e.g. a TLS handshake)
+        time.sleep(self.server.connect_delay)
+        self.reply("220 sink ESMTP")
+
+        messages_in_session = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+
+            command = line.decode("ascii", "replace").strip()
+            verb = command[:4].upper()
+            self.server.commands.append(verb)
+
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 sink")
+            elif verb == "DATA":
+                self.reply("354 end data with <CR><LF>.<CR><LF>")
+                data = b""
+                while not data.endswith(b"\r\n.\r\n"):
+                    data += self.rfile.readline()
+                self.server.messages.append(data[:-5].decode("utf-8", "replace"))
+                self.reply("250 ok")
+
+                messages_in_session += 1
+                if messages_in_session == self.server.messages_per_connection:
+                    # drop the connection without saying goodbye
+                    break
+            elif verb == "QUIT":
+                self.reply("221 bye")
+                break
+            else:
+                self.reply("250 ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    SMTP server listening on a local port that stores all received messages.
+
+    :param port: the port to listen on, a random free port if 0
+    :param connect_delay: seconds to wait before greeting a new client
+    :param messages_per_connection: close the connection after this many messages
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, connect_delay=0.0, messages_per_connection=None):
+        super().__init__(("127.0.0.1", port), _SMTPSinkHandler)
+        self.connect_delay = connect_delay
+        self.messages_per_connection = messages_per_connection
+        self.connections = 0
+        self.commands = []
+        self.messages = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
+
+
+def email_notifier(port, **kwargs):
+    """
+    Create a :class:`pytb.notification.NotifyViaEmail` that sends to the
+    ``SMTPSink`` on ``port`` via a new connection per message.
+    ``kwargs`` override the defaults
+    """
+    options = dict(
+        email_addresses=["recipient@example.com"],
+        sender="notify@example.com",
+        smtp_host="127.0.0.1",
+        smtp_port=port,
+        persistent_connection=False,
+        bcc=False,
+    )
+    options.update(kwargs)
+    return pytb.notification.NotifyViaEmail("task", **options)
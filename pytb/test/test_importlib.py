@@ -2,15 +2,22 @@ import doctest
 import unittest
 
 import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest.mock
 
 from pytb import importlib, test, io as pyio
 
 
 class TestNotebookLoader(unittest.TestCase):
     def test_load_notebook(self):
+        # make sure the notebook is executed, even if it was imported before
+        sys.modules.pop("pytb.test.fixtures.TestNB", None)
         out = io.StringIO()
         with pyio.redirected_stdout(out):
-            with importlib.NotebookLoader(), importlib.no_module_cache:
+            with importlib.NotebookLoader(), importlib.NoModuleCacheContext():
                 import pytb.test.fixtures.TestNB
         self.assertEqual(out.getvalue(), "Hello from Notebook\n")
 
@@ -22,8 +29,71 @@ class TestNotebookLoader(unittest.TestCase):
         self.assertEqual(out.getvalue(), "Hello from Notebook\r\nHello from Notebook\n")
 
 
+class TestNotebookBytecodeCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.nb_path = os.path.join(self.directory.name, "TestNB.ipynb")
+        fixture = os.path.join(os.path.dirname(__file__), "fixtures", "TestNB.ipynb")
+        shutil.copy(fixture, self.nb_path)
+        self.loader = importlib.NotebookLoader(bytecode_cache=True)
+
+        patcher = unittest.mock.patch.object(sys, "dont_write_bytecode", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_code(self):
+        with unittest.mock.patch(
+            "pytb.importlib.read_notebook", wraps=importlib.read_notebook
+        ) as read_notebook:
+            code = self.loader.get_code(self.nb_path)
+        return code, read_notebook.call_count
+
+    def test_warm_import_skips_parsing(self):
+        cold_code, cold_reads = self.get_code()
+        warm_code, warm_reads = self.get_code()
+
+        self.assertTrue(os.path.isfile(self.loader.cache_path(self.nb_path)))
+        self.assertEqual((cold_reads, warm_reads), (1, 0))
+        self.assertEqual(
+            [code.co_code for code in cold_code], [code.co_code for code in warm_code]
+        )
+
+    def test_touched_notebook_is_validated_by_hash(self):
+        self.get_code()
+        stat = os.stat(self.nb_path)
+        os.utime(self.nb_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+        _, reads = self.get_code()
+        self.assertEqual(reads, 0)
+
+    def test_changed_notebook_is_compiled_again(self):
+        self.get_code()
+        with open(self.nb_path, encoding="utf-8") as nb_file:
+            notebook = nb_file.read()
+        with open(self.nb_path, "w", encoding="utf-8") as nb_file:
+            nb_file.write(notebook.replace("Hello from Notebook", "Hello from changes"))
+
+        code, reads = self.get_code()
+        self.assertEqual(reads, 1)
+        out = io.StringIO()
+        with pyio.redirected_stdout(out):
+            exec(code[0], {})  # pylint: disable=exec-used
+        self.assertEqual(out.getvalue(), "Hello from changes\n")
+
+    def test_disabled_cache(self):
+        self.loader.bytecode_cache = False
+        self.get_code()
+        _, reads = self.get_code()
+
+        self.assertEqual(reads, 1)
+        self.assertFalse(os.path.exists(self.loader.cache_path(self.nb_path)))
+
+
 class TestNoModuleCache(unittest.TestCase):
-    def test_reload_on_import(self):
+    def test_loaded_modules_are_not_reloaded(self):
 
         from pytb.test.fixtures import random_module
 
@@ -32,13 +102,79 @@ class TestNoModuleCache(unittest.TestCase):
             from pytb.test.fixtures import random_module
 
         rand_num_two = random_module.random_number
-        self.assertNotEqual(rand_num_one, rand_num_two)
+        self.assertEqual(rand_num_one, rand_num_two)
 
-        with importlib.no_module_cache:
-            from pytb.test.fixtures import random_module
+    def test_stdlib_is_not_reloaded(self):
+        with unittest.mock.patch("pytb.importlib.reload_module") as reload_module:
+            with importlib.NoModuleCacheContext():
+                import socket
+                import pathlib
+                from email import message
+        reload_module.assert_not_called()
+
+
+class TestChangeAwareReload(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        sys.path.insert(0, self.directory.name)
+        self.write_module("pytb_reload_dependency", "value = 1\n")
+        self.write_module(
+            "pytb_reload_dependent",
+            "from pytb_reload_dependency import value\ntoken = object()\n",
+        )
+        self.context = importlib.NoModuleCacheContext()
+
+    def tearDown(self):
+        sys.path.remove(self.directory.name)
+        for name in ("pytb_reload_dependency", "pytb_reload_dependent"):
+            sys.modules.pop(name, None)
+        self.directory.cleanup()
+
+    def write_module(self, name, source):
+        path = os.path.join(self.directory.name, name + ".py")
+        mtime = os.stat(path).st_mtime_ns if os.path.exists(path) else 0
+        with open(path, "w") as module_file:
+            module_file.write(source)
+        # make sure the change is visible even on filesystems with a coarse mtime
+        os.utime(path, ns=(mtime + 2 * 10 ** 9, mtime + 2 * 10 ** 9))
+
+    def import_dependent(self):
+        with self.context:
+            import pytb_reload_dependent  # pylint: disable=import-error
+
+        return pytb_reload_dependent
+
+    def test_unchanged_modules_are_not_reloaded(self):
+        token = self.import_dependent().token
+        with unittest.mock.patch("pytb.importlib.reload_module") as reload_module:
+            self.assertIs(self.import_dependent().token, token)
+        reload_module.assert_not_called()
+
+    def test_touched_module_is_not_reloaded(self):
+        token = self.import_dependent().token
+        self.write_module("pytb_reload_dependency", "value = 1\n")
+        self.assertIs(self.import_dependent().token, token)
+
+    def test_change_after_first_import_outside_of_context(self):
+        import pytb_reload_dependent  # pylint: disable=import-error
+
+        token = pytb_reload_dependent.token
+        self.assertIs(self.import_dependent().token, token)
+
+        self.write_module("pytb_reload_dependency", "value = 1000\n")
+        module = self.import_dependent()
+        self.assertIsNot(module.token, token)
+        self.assertEqual(module.value, 1000)
+
+    def test_changed_dependency_reloads_dependents(self):
+        module = self.import_dependent()
+        token = module.token
+        self.write_module("pytb_reload_dependency", "value = 1000\n")
 
-        rand_num_three = random_module.random_number
-        self.assertNotEqual(rand_num_two, rand_num_three)
+        module = self.import_dependent()
+        self.assertIsNot(module.token, token)
+        self.assertEqual(module.value, 1000)
+        self.assertEqual(sys.modules["pytb_reload_dependency"].value, 1000)
 
 
 suite = unittest.TestSuite()
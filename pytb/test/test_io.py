@@ -1,9 +1,15 @@
 import doctest
 import unittest
 
-from io import StringIO
+from io import StringIO, BytesIO
+import array
+import os
 import sys
+import time
 import tempfile
+import subprocess
+import threading
+import unittest.mock
 
 import pytb.io
 
@@ -28,6 +34,290 @@ class TestTeeManifold(unittest.TestCase):
         self.assertFalse(err.closed)
 
 
+class SlowStream(StringIO):
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.writes = 0
+        self.released = threading.Event()
+
+    def write(self, text):
+        self.released.wait(self.delay)
+        self.writes += 1
+        return super().write(text)
+
+
+class TestWriteBehindTee(unittest.TestCase):
+    def test_slow_stream_does_not_block_writer(self):
+        slow, fast = SlowStream(10), StringIO()
+        tee_piece = pytb.io.Tee(slow, fast, buffer_size=1024)
+
+        for i in range(100):
+            tee_piece.write(f"{i}\n")
+        # all writes returned while the slow stream is still held back
+        self.assertEqual(slow.writes, 0)
+
+        slow.released.set()
+        tee_piece.flush()
+        expected = "".join(f"{i}\n" for i in range(100))
+        self.assertEqual(slow.getvalue(), expected)
+        self.assertEqual(fast.getvalue(), expected)
+        # the small writes are batched into a few large ones
+        self.assertLess(slow.writes, 5)
+        tee_piece.close()
+
+    def test_drop_newest(self):
+        slow = SlowStream(10)
+        tee_piece = pytb.io.Tee(slow, buffer_size=4, overflow="drop_newest")
+        tee_piece.write("0")
+        # wait until the writer thread is blocked in the first write
+        while tee_piece._sinks[0]._chunks:
+            time.sleep(0.001)
+        for text in ("1234", "5678"):
+            tee_piece.write(text)
+        slow.released.set()
+        tee_piece.flush()
+
+        self.assertEqual(slow.getvalue(), "01234")
+        self.assertEqual(tee_piece.dropped, 4)
+
+    def test_drop_oldest(self):
+        slow = SlowStream(10)
+        tee_piece = pytb.io.Tee(slow, buffer_size=4, overflow="drop_oldest")
+        tee_piece.write("0")
+        while tee_piece._sinks[0]._chunks:
+            time.sleep(0.001)
+        for text in ("12", "34", "56"):
+            tee_piece.write(text)
+        slow.released.set()
+        tee_piece.flush()
+
+        self.assertEqual(slow.getvalue(), "03456")
+        self.assertEqual(tee_piece.dropped, 2)
+
+    def test_block_waits_for_room(self):
+        slow = SlowStream(0.01)
+        tee_piece = pytb.io.Tee(slow, buffer_size=4, batch_size=2)
+        for text in ("ab", "cd", "ef", "gh"):
+            tee_piece.write(text)
+        tee_piece.flush()
+
+        self.assertEqual(slow.getvalue(), "abcdefgh")
+        self.assertEqual(tee_piece.dropped, 0)
+
+    def test_write_errors_are_raised_on_flush(self):
+        broken = StringIO()
+        broken.close()
+        tee_piece = pytb.io.Tee(broken, buffer_size=16)
+        tee_piece.write("lost")
+        with self.assertRaises(ValueError):
+            tee_piece.flush()
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            pytb.io.Tee(StringIO(), buffer_size=16, overflow="drop")
+
+    def test_buffered_mirrored_stdstreams(self):
+        buffer = pytb.io.CaptureBuffer()
+        console = StringIO()
+        with pytb.io.redirected_stdstreams(console):
+            with pytb.io.mirrored_stdstreams(buffer, buffer_size=1024):
+                print("stdout")
+                print("stderr", file=sys.stderr)
+        self.assertEqual(buffer.getvalue(), "stdout\nstderr\n")
+        self.assertEqual(console.getvalue(), "stdout\nstderr\n")
+        buffer.close()
+
+
+class TestStreamDispatcher(unittest.TestCase):
+    def test_nested_captures(self):
+        console, outer, inner = StringIO(), StringIO(), StringIO()
+        dispatcher = pytb.io.StreamDispatcher(console)
+        with dispatcher.capturing(outer):
+            dispatcher.write("outer ")
+            with dispatcher.capturing(inner):
+                dispatcher.write("inner ")
+            dispatcher.write("outer")
+
+        self.assertEqual(console.getvalue(), "outer inner outer")
+        self.assertEqual(outer.getvalue(), "outer inner outer")
+        self.assertEqual(inner.getvalue(), "inner ")
+
+    def test_threads_capture_separately(self):
+        barrier = threading.Barrier(4)
+        captured = [StringIO() for _ in range(4)]
+        dispatcher = pytb.io.StreamDispatcher(StringIO())
+
+        def capture(index):
+            with dispatcher.capturing(captured[index]):
+                barrier.wait()
+                for _ in range(100):
+                    dispatcher.write(str(index))
+
+        workers = [threading.Thread(target=capture, args=(i,)) for i in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        for index, buffer in enumerate(captured):
+            self.assertEqual(buffer.getvalue(), str(index) * 100)
+
+    def test_proxies_attributes(self):
+        console = StringIO()
+        dispatcher = pytb.io.StreamDispatcher(console)
+        self.assertIs(dispatcher.getvalue.__self__, console)
+
+    def test_captured_stdstreams_installs_dispatchers_once(self):
+        console = StringIO()
+        with pytb.io.redirected_stdstreams(console):
+            with pytb.io.captured_stdstreams(StringIO()):
+                dispatcher = sys.stdout
+                with pytb.io.captured_stdstreams(StringIO()):
+                    self.assertIs(sys.stdout, dispatcher)
+                print("stdout")
+                print("stderr", file=sys.stderr)
+            self.assertIs(sys.stdout, dispatcher)
+            self.assertIsInstance(sys.stderr, pytb.io.StreamDispatcher)
+        self.assertEqual(console.getvalue(), "stdout\nstderr\n")
+
+    def test_captured_stdstreams_to_capture_log(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "output.cap")
+            log = pytb.io.CaptureLog(path)
+            with pytb.io.redirected_stdstreams(StringIO()):
+                with pytb.io.captured_stdstreams(log):
+                    sys.stdout.write("stdout\n")
+                    sys.stderr.write("stderr\n")
+            log.close()
+
+            self.assertEqual(
+                [
+                    (record.stream, record.text)
+                    for record in pytb.io.read_capture_log(path)
+                ],
+                [(1, "stdout\n"), (2, "stderr\n")],
+            )
+
+
+class TestBinaryTee(unittest.TestCase):
+    def read_all(self, fd):
+        chunks = []
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                os.close(fd)
+                return b"".join(chunks)
+            chunks.append(chunk)
+
+    def test_write_bytes_like(self):
+        log = BytesIO()
+        read_end, write_end = os.pipe()
+        tee_piece = pytb.io.BinaryTee(log, write_end)
+        self.assertEqual(tee_piece.write(b"bytes "), 6)
+        self.assertEqual(tee_piece.write(memoryview(bytearray(b"view "))), 5)
+        self.assertEqual(tee_piece.write(array.array("B", b"array")), 5)
+        os.close(write_end)
+
+        self.assertEqual(log.getvalue(), b"bytes view array")
+        self.assertEqual(self.read_all(read_end), b"bytes view array")
+
+    def test_writelines_uses_writev(self):
+        log = tempfile.TemporaryFile()
+        tee_piece = pytb.io.BinaryTee(log.fileno())
+        chunks = [b"a", b"", memoryview(b"bc"), bytearray(b"d")] * 1000
+        with unittest.mock.patch("os.writev", wraps=os.writev) as writev:
+            self.assertEqual(tee_piece.writelines(chunks), 4000)
+        self.assertLessEqual(writev.call_count, 3)
+
+        log.seek(0)
+        self.assertEqual(log.read(), b"abcd" * 1000)
+        log.close()
+
+    def write_and_close(self, fd, data):
+        pytb.io._write_all(fd, data)
+        os.close(fd)
+
+    def test_writelines_partial_writes(self):
+        read_end, write_end = os.pipe()
+        chunks = [os.urandom(1000) for _ in range(1000)]
+        output = []
+        reader = threading.Thread(
+            target=lambda: output.append(self.read_all(read_end))
+        )
+        reader.start()
+        # the pipe is too small for all chunks, so writev only writes some of them
+        pytb.io.BinaryTee(write_end).writelines(chunks)
+        os.close(write_end)
+        reader.join()
+
+        self.assertEqual(output, [b"".join(chunks)])
+
+    def test_copy_from_pipe_splices(self):
+        data = os.urandom(1024 * 1024)
+        source_read, source_write = os.pipe()
+        writer = threading.Thread(
+            target=self.write_and_close, args=(source_write, data)
+        )
+        writer.start()
+        log = tempfile.TemporaryFile()
+        with unittest.mock.patch("os.readv", wraps=os.readv) as readv:
+            copied = pytb.io.BinaryTee(log.fileno()).copy_from(source_read)
+        writer.join()
+        os.close(source_read)
+
+        self.assertEqual(copied, len(data))
+        if hasattr(os, "splice"):
+            readv.assert_not_called()
+        log.seek(0)
+        self.assertEqual(log.read(), data)
+        log.close()
+
+    def test_copy_from_to_multiple_sinks(self):
+        data = os.urandom(200000)
+        source = tempfile.TemporaryFile()
+        source.write(data)
+        source.seek(0)
+        log, copy = BytesIO(), tempfile.TemporaryFile()
+
+        copied = pytb.io.BinaryTee(log, copy.fileno()).copy_from(
+            source.fileno(), chunk_size=4096
+        )
+
+        self.assertEqual(copied, len(data))
+        self.assertEqual(log.getvalue(), data)
+        copy.seek(0)
+        self.assertEqual(copy.read(), data)
+        source.close()
+        copy.close()
+
+    def test_copy_from_without_splice_support(self):
+        source = tempfile.TemporaryFile()
+        source.write(b"regular file")
+        source.seek(0)
+        target = tempfile.TemporaryFile()
+
+        # neither of the files is a pipe, so splice fails
+        copied = pytb.io.BinaryTee(target.fileno()).copy_from(source.fileno())
+
+        self.assertEqual(copied, 12)
+        target.seek(0)
+        self.assertEqual(target.read(), b"regular file")
+        source.close()
+        target.close()
+
+    def test_close_leaves_file_descriptors_open(self):
+        log = BytesIO()
+        read_end, write_end = os.pipe()
+        pytb.io.BinaryTee(log, write_end, sys.__stdout__.buffer).close()
+
+        self.assertTrue(log.closed)
+        self.assertFalse(sys.__stdout__.closed)
+        os.write(write_end, b"still open")
+        os.close(write_end)
+        self.assertEqual(self.read_all(read_end), b"still open")
+
+
 class TestIORedirection(unittest.TestCase):
     def test__permissive_open_does_not_close_unopened(self):
         outfile = StringIO()
@@ -70,6 +360,312 @@ class TestIORedirection(unittest.TestCase):
         self.assertEqual(outfile.getvalue(), "stdout\nstderr\n")
 
 
+class TestCaptureBuffer(unittest.TestCase):
+    def test_keeps_head_and_tail(self):
+        buffer = pytb.io.CaptureBuffer(head_size=10, tail_size=10, spill=False)
+        for i in range(1000):
+            buffer.write(f"{i:04d}\n")
+
+        snapshot = buffer.snapshot()
+        self.assertEqual(snapshot.head, "0000\n0001\n")
+        self.assertEqual(snapshot.tail, "0998\n0999\n")
+        self.assertEqual(snapshot.omitted, 4980)
+        self.assertEqual(snapshot.total_length, 5000)
+        self.assertFalse(snapshot.is_complete)
+        self.assertIn("<4980 characters omitted>", snapshot)
+        buffer.close()
+
+    def test_spilled_output_is_complete(self):
+        buffer = pytb.io.CaptureBuffer(head_size=5, tail_size=5, spill=True)
+        text = "".join(f"{i} äöü\n" for i in range(1000))
+        buffer.write(text)
+
+        snapshot = buffer.snapshot()
+        self.assertTrue(snapshot.is_complete)
+        self.assertEqual("".join(snapshot.chunks(chunk_size=7)), text)
+        buffer.close()
+
+    def test_snapshot_survives_clear(self):
+        buffer = pytb.io.CaptureBuffer(head_size=1, tail_size=1)
+        buffer.write("abc")
+        snapshot = buffer.snapshot()
+        buffer.truncate(0)
+        buffer.write("xyz")
+
+        self.assertEqual("".join(snapshot.chunks()), "abc")
+        self.assertEqual("".join(buffer.snapshot().chunks()), "xyz")
+        buffer.close()
+
+    def test_mirrored_stdstreams(self):
+        buffer = pytb.io.CaptureBuffer(head_size=3, tail_size=3)
+        with pytb.io.redirected_stdout(StringIO()):
+            with pytb.io.mirrored_stdstreams(buffer):
+                print("stdout")
+                print("stderr", file=sys.stderr)
+        self.assertEqual("".join(buffer.snapshot().chunks()), "stdout\nstderr\n")
+        buffer.close()
+
+
+class TestFdCapture(unittest.TestCase):
+    def test_child_process_output(self):
+        outfile = StringIO()
+        with pytb.io.captured_fds(outfile, mirror=False):
+            subprocess.run([sys.executable, "-c", "print('child')"], check=True)
+            os.write(2, b"os.write\n")
+        self.assertEqual(outfile.getvalue(), "child\nos.write\n")
+
+    def test_mirror_to_original_fds(self):
+        original = StringIO()
+        captured = StringIO()
+        # the outer capture stands in for the terminal
+        with pytb.io.captured_fds(original, fds=[1], mirror=False):
+            with pytb.io.captured_fds(captured, fds=[1]):
+                os.write(1, b"mirrored\n")
+        self.assertEqual(captured.getvalue(), "mirrored\n")
+        self.assertEqual(original.getvalue(), "mirrored\n")
+
+    def test_fds_are_restored(self):
+        stat_before = os.fstat(1)
+        with pytb.io.captured_fds(StringIO(), mirror=False):
+            self.assertNotEqual(os.fstat(1).st_ino, stat_before.st_ino)
+        self.assertEqual(os.fstat(1).st_ino, stat_before.st_ino)
+
+    def test_characters_split_across_writes(self):
+        buffer = pytb.io.CaptureBuffer()
+        encoded = "ä€".encode("utf-8")
+        with pytb.io.captured_fds(buffer, fds=[1], mirror=False):
+            for i in range(len(encoded)):
+                os.write(1, encoded[i : i + 1])
+        self.assertEqual(buffer.getvalue(), "ä€")
+        buffer.close()
+
+
+class TestRotatingFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "output.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_rotates_and_compresses_segments(self):
+        log = pytb.io.RotatingFile(self.path, max_size=10, compression="xz")
+        for i in range(5):
+            log.write(f"line {i}\n")
+        log.close()
+
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            [
+                "output.log",
+                "output.log.000001.xz",
+                "output.log.000002.xz",
+                "output.log.000003.xz",
+                "output.log.000004.xz",
+                "output.log.index",
+            ],
+        )
+        self.assertEqual(
+            "".join(pytb.io.read_rotated(self.path)),
+            "".join(f"line {i}\n" for i in range(5)),
+        )
+
+    def test_retention_limit(self):
+        log = pytb.io.RotatingFile(self.path, max_size=10, max_segments=2)
+        for i in range(5):
+            log.write(f"line {i}\n")
+        log.close()
+
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            [
+                "output.log",
+                "output.log.000003.gz",
+                "output.log.000004.gz",
+                "output.log.index",
+            ],
+        )
+        self.assertEqual(
+            "".join(pytb.io.read_rotated(self.path)), "line 2\nline 3\nline 4\n"
+        )
+
+    def test_time_based_rotation(self):
+        log = pytb.io.RotatingFile(
+            self.path, max_size=0, max_age=0.05, compression=None
+        )
+        log.write("before\n")
+        time.sleep(0.1)
+        since = time.time()
+        log.write("after\n")
+        log.close()
+
+        self.assertTrue(os.path.exists(f"{self.path}.000001"))
+        self.assertEqual("".join(pytb.io.read_rotated(self.path)), "before\nafter\n")
+        self.assertEqual("".join(pytb.io.read_rotated(self.path, since)), "after\n")
+
+    def test_continues_existing_log(self):
+        log = pytb.io.RotatingFile(self.path, max_size=10)
+        log.write("line 0\n")
+        log.write("line 1\n")
+        log.close()
+
+        log = pytb.io.RotatingFile(self.path, max_size=10)
+        log.write("line 2\n")
+        log.close()
+
+        self.assertTrue(os.path.exists(f"{self.path}.000002.gz"))
+        self.assertEqual(
+            "".join(pytb.io.read_rotated(self.path)), "line 0\nline 1\nline 2\n"
+        )
+
+    def test_mirrored_stdout(self):
+        log = pytb.io.RotatingFile(self.path, max_size=16)
+        with pytb.io.mirrored_stdout(log):
+            for i in range(4):
+                print(f"mirrored {i}")
+        log.close()
+
+        self.assertEqual(
+            "".join(pytb.io.read_rotated(self.path)),
+            "".join(f"mirrored {i}\n" for i in range(4)),
+        )
+
+    def test_invalid_compression(self):
+        with self.assertRaises(ValueError):
+            pytb.io.RotatingFile(self.path, compression="zip")
+
+
+class TestCaptureLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "output.cap")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def records(self, **kwargs):
+        return [
+            (record.stream, record.text)
+            for record in pytb.io.read_capture_log(self.path, **kwargs)
+        ]
+
+    def test_records_streams(self):
+        log = pytb.io.CaptureLog(self.path)
+        console = StringIO()
+        with pytb.io.redirected_stdstreams(console):
+            with pytb.io.mirrored_stdstreams(log):
+                sys.stdout.write("stdout\n")
+                sys.stderr.write("stderr\n")
+        log.close()
+
+        self.assertEqual(self.records(), [(1, "stdout\n"), (2, "stderr\n")])
+        self.assertEqual(self.records(streams=[2]), [(2, "stderr\n")])
+        self.assertEqual(console.getvalue(), "stdout\nstderr\n")
+
+    def test_buffered_mirrored_stdstreams(self):
+        log = pytb.io.CaptureLog(self.path)
+        with pytb.io.redirected_stdstreams(StringIO()):
+            with pytb.io.mirrored_stdstreams(log, buffer_size=1024):
+                sys.stdout.write("stdout\n")
+                sys.stderr.write("stderr\n")
+        log.close()
+
+        self.assertCountEqual(self.records(), [(1, "stdout\n"), (2, "stderr\n")])
+
+    def test_captured_fds(self):
+        log = pytb.io.CaptureLog(self.path)
+        with pytb.io.captured_fds(log, mirror=False):
+            subprocess.run(["sh", "-c", "echo out; echo err >&2"], check=True)
+        log.close()
+
+        self.assertCountEqual(self.records(), [(1, "out\n"), (2, "err\n")])
+
+    def test_time_filter(self):
+        log = pytb.io.CaptureLog(self.path)
+        log.write("first")
+        time.sleep(0.1)
+        log.write("second")
+        log.close()
+
+        records = list(pytb.io.read_capture_log(self.path))
+        self.assertEqual(records[0].offset, 0)
+        self.assertGreaterEqual(records[1].offset, 0.1)
+        self.assertEqual(self.records(start=0.05), [(1, "second")])
+        self.assertEqual(self.records(end=0.05), [(1, "first")])
+
+    def test_appends_to_existing_log(self):
+        for text in ("first", "second"):
+            log = pytb.io.CaptureLog(self.path)
+            log.write(text)
+            log.close()
+
+        records = list(pytb.io.read_capture_log(self.path))
+        self.assertEqual([record.text for record in records], ["first", "second"])
+        self.assertLessEqual(records[0].time, records[1].time)
+
+    def test_partial_record_ends_log(self):
+        log = pytb.io.CaptureLog(self.path)
+        log.write("complete")
+        log.write("truncated")
+        log.close()
+        with open(self.path, "r+b") as log_file:
+            log_file.truncate(os.path.getsize(self.path) - 1)
+
+        self.assertEqual(self.records(), [(1, "complete")])
+
+    def test_not_a_capture_log(self):
+        with open(self.path, "w") as log_file:
+            log_file.write("plain text output")
+        with self.assertRaises(ValueError):
+            list(pytb.io.read_capture_log(self.path))
+
+
+class TestTerminalRenderer(unittest.TestCase):
+    def test_carriage_return_and_backspace(self):
+        self.assertEqual(pytb.io.render_text("abc\rx\n12\b3"), "xbc\n13")
+
+    def test_erase_line(self):
+        self.assertEqual(pytb.io.render_text("abcdef\r\x1b[2Kxy"), "xy")
+        self.assertEqual(pytb.io.render_text("abcdef\rxy\x1b[K"), "xy")
+        self.assertEqual(pytb.io.render_text("abcdef\x1b[3D\x1b[1K"), "    ef")
+
+    def test_multiple_progressbars(self):
+        renderer = pytb.io.TerminalRenderer()
+        renderer.write("bar1 0%\nbar2 0%")
+        for progress in range(0, 101, 25):
+            renderer.write(f"\x1b[A\rbar1 {progress}%\x1b[B\rbar2 {progress // 2}%")
+        self.assertEqual(renderer.getvalue(), "bar1 100%\nbar2 50%")
+
+    def test_escape_sequence_split_across_writes(self):
+        renderer = pytb.io.TerminalRenderer()
+        for char in "abc\x1b[31mred\x1b[0m\x1b[2K":
+            renderer.write(char)
+        renderer.write("d")
+        self.assertEqual(renderer.getvalue(), "      d")
+
+    def test_wrapping_keeps_line_breaks(self):
+        self.assertEqual(
+            pytb.io.render_text("abcde\n\nfg", maxwidth=2), "ab\ncd\ne\n\nfg"
+        )
+
+    def test_carriage_returns_do_not_rewrite_lines(self):
+        updates = 1000
+        lines = "\n".join(f"line {i}" for i in range(updates))
+        bars = "".join(f"\r{i:6d} [{'#' * (i % 50):50s}]" for i in range(updates))
+
+        with unittest.mock.patch.object(
+            pytb.io.TerminalRenderer,
+            "_move_to_row",
+            autospec=True,
+            side_effect=pytb.io.TerminalRenderer._move_to_row,
+        ) as move_to_row:
+            rendered = pytb.io.render_text(lines + bars)
+
+        # only the line breaks store a line, a carriage return just moves the cursor
+        self.assertEqual(move_to_row.call_count, updates - 1)
+        self.assertEqual(rendered.splitlines()[-1], f"   999 [{'#' * 49} ]")
+
+
 suite = unittest.TestSuite()
 suite.addTest(doctest.DocTestSuite(pytb.io))
 
@@ -1,7 +1,1044 @@
 import doctest
 import unittest
 
+import io
+import os
+import gzip
+import email
+import email.policy
+import sys
+import time
+import socket
+import json
+import sqlite3
+import tempfile
+import linecache
+import unittest.mock
+import contextlib
+import smtplib
+import threading
+import concurrent.futures
+import weakref
+import gc
+
+import pytb.config
+import pytb.io
 import pytb.notification
+from pytb.test.fixtures.smtp_sink import SMTPSink, email_notifier
+from pytb.test.fixtures.http_sink import HTTPSink
+
+
+class SlowNotifier(pytb.notification.NotifyViaStream):
+    def __init__(self, delay, **kwargs):
+        super().__init__("slow task", io.StringIO(), **kwargs)
+        self.notification_template = "{reason}\n"
+        self.delay = delay
+        self.sent_from = []
+
+    def _send_notification(self, *args, **kwargs):
+        time.sleep(self.delay)
+        self.sent_from.append(threading.current_thread())
+        super()._send_notification(*args, **kwargs)
+
+
+class GatedNotifier(SlowNotifier):
+    # sends its notifications only after the gate is set
+    def __init__(self, **kwargs):
+        super().__init__(0, **kwargs)
+        self.gate = threading.Event()
+        self.delivered = threading.Event()
+
+    def _send_notification(self, *args, **kwargs):
+        self.gate.wait(5)
+        super()._send_notification(*args, **kwargs)
+        self.delivered.set()
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    def test_asynchronous_notify_does_not_block(self):
+        notify = SlowNotifier(0.2, asynchronous=True)
+
+        start = time.monotonic()
+        with notify.when_done():
+            pass
+        self.assertLess(time.monotonic() - start, 0.2)
+
+        self.assertTrue(pytb.notification.NotificationDispatcher.instance().flush(5))
+        self.assertEqual(notify.stream.getvalue(), "done\n")
+        self.assertIsNot(notify.sent_from[0], threading.current_thread())
+
+    def test_synchronous_notify_is_default(self):
+        notify = SlowNotifier(0)
+        notify.now("manual")
+        self.assertEqual(notify.sent_from, [threading.current_thread()])
+
+    def test_drop_on_overflow(self):
+        dispatcher = pytb.notification.NotificationDispatcher(
+            max_queue_size=1, overflow="drop"
+        )
+        notify = SlowNotifier(0.2)
+
+        results = [dispatcher.submit(notify, notify.task, "0", None, "")]
+        # give the worker time to pick up the first notification
+        time.sleep(0.05)
+        results += [
+            dispatcher.submit(notify, notify.task, str(i), None, "") for i in (1, 2)
+        ]
+        dispatcher.shutdown(5)
+
+        # the second notification waits in the queue and the third one is dropped
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(dispatcher.dropped, 1)
+        self.assertEqual(notify.stream.getvalue(), "0\n1\n")
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            pytb.notification.NotificationDispatcher(overflow="ignore")
+
+
+class TestStallDetection(unittest.TestCase):
+    def test_sub_second_stall_without_capture(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream)
+        notify.notification_template = "{reason}: {output}\n"
+
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            with notify.when_stalled(0.05, capture_output=False):
+                time.sleep(0.18)
+                print("progress")
+                time.sleep(0.07)
+
+        self.assertEqual(
+            stream.getvalue().splitlines()[:2],
+            [
+                "probably stalled: <output capturing disabled>",
+                "no longer stalled: <output capturing disabled>",
+            ],
+        )
+
+    def test_capture_buffer_tracks_writes(self):
+        buffer = pytb.io.CaptureBuffer(head_size=0, tail_size=0, spill=False)
+        before = buffer.last_write
+        buffer.write("x" * 1000)
+        buffer.write("y")
+
+        self.assertEqual(buffer.write_count, 2)
+        self.assertGreaterEqual(buffer.last_write, before)
+        self.assertEqual(buffer.getvalue(), "\n<1001 characters omitted>\n")
+
+    def test_capture_file_descriptors(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream, capture_mode="fds")
+        notify.notification_template = "{reason}|{output}"
+
+        with pytb.io.captured_fds(io.StringIO(), mirror=False):
+            with notify.when_done():
+                os.write(1, b"written by an extension\n")
+
+        self.assertEqual(stream.getvalue(), "done|written by an extension")
+
+    def test_parallel_blocks_capture_own_output(self):
+        barrier = threading.Barrier(2)
+        streams = {name: io.StringIO() for name in ("first", "second")}
+
+        def monitored(name):
+            notify = pytb.notification.NotifyViaStream(
+                name, streams[name], capture_mode="thread"
+            )
+            notify.notification_template = "{reason}|{output}"
+            with notify.when_done():
+                print(f"{name} before")
+                barrier.wait()
+                print(f"{name} after")
+
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            workers = [
+                threading.Thread(target=monitored, args=(name,)) for name in streams
+            ]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+
+        for name, stream in streams.items():
+            self.assertEqual(stream.getvalue(), f"done|{name} before\n{name} after")
+
+    def test_capture_output_of_worker_threads(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream)
+        notify.notification_template = "{reason}|{output}"
+
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            with notify.when_done():
+                print("main")
+                worker = threading.Thread(target=print, args=("from thread",))
+                worker.start()
+                worker.join()
+                with concurrent.futures.ThreadPoolExecutor(1) as pool:
+                    pool.submit(print, "from pool").result()
+
+        self.assertEqual(stream.getvalue(), "done|main\nfrom thread\nfrom pool")
+
+    def test_invalid_capture_mode(self):
+        with self.assertRaises(ValueError):
+            pytb.notification.NotifyViaStream("task", io.StringIO(), capture_mode="fd")
+
+    def test_stuck_without_output(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream)
+        notify.notification_template = "{reason}|{output}\n"
+        blocker = threading.Event()
+
+        def wait_for_blocker():
+            blocker.wait(0.2)
+
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            with notify.when_stuck(0.05, sample_interval=0.01, capture_output=False):
+                wait_for_blocker()
+                time.sleep(0.05)
+
+        notifications = stream.getvalue()
+        self.assertTrue(notifications.startswith("probably stalled|Thread "))
+        self.assertIn("Thread MainThread", notifications)
+        # the notification contains the stack the block is stuck in
+        self.assertIn("in wait_for_blocker\n    blocker.wait(0.2)", notifications)
+        self.assertNotIn("in check_stuck", notifications)
+        self.assertIn("\nno longer stalled|", notifications)
+
+    def test_progress_counter_prevents_stall(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream)
+        notify.notification_template = "{reason}\n"
+
+        # the stack is the same all the time, but the counter increases
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            with notify.when_stuck(0.05, sample_interval=0.01) as progress:
+                for _ in range(15):
+                    progress.tick()
+                    time.sleep(0.01)
+
+        self.assertEqual(stream.getvalue(), "")
+
+
+class TestNotificationDigest(unittest.TestCase):
+    def notifier(self, **kwargs):
+        notify = pytb.notification.NotifyViaStream("task", io.StringIO(), **kwargs)
+        notify.notification_template = "{reason}\n"
+        return notify
+
+    def test_window_merges_notifications(self):
+        notify = self.notifier(digest_window=0.1)
+        for i in range(3):
+            notify.now(f"event {i}")
+        self.assertEqual(notify.stream.getvalue(), "")
+
+        time.sleep(0.2)
+        self.assertEqual(notify.stream.getvalue(), "digest of 3 notifications\n")
+
+    def test_failures_are_delivered_immediately(self):
+        notify = self.notifier(digest_window=10)
+        notify.now("event")
+        with self.assertRaises(RuntimeError):
+            with notify.when_done():
+                raise RuntimeError()
+
+        self.assertEqual(notify.stream.getvalue(), "event\nfailed\n")
+
+    def test_rate_limit(self):
+        notify = self.notifier(rate_limits={"iteration": (2, 60)})
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            for _ in notify.on_iteration_of(range(5)):
+                pass
+        notify.now("manual events are not limited")
+
+        self.assertEqual(
+            notify.stream.getvalue().splitlines(),
+            [
+                "Iteration 1/5 done",
+                "Iteration 2/5 done",
+                "manual events are not limited",
+            ],
+        )
+
+        notify._digest.flush()
+        self.assertEqual(
+            notify.stream.getvalue().splitlines()[-1], "digest of 3 notifications"
+        )
+
+    def test_digests_are_not_kept_alive(self):
+        notify = self.notifier(digest_window=10)
+        digest = weakref.ref(notify._digest)
+        del notify
+        gc.collect()
+        self.assertIsNone(digest())
+
+
+class TestProgressTracking(unittest.TestCase):
+    def notifier(self):
+        notify = pytb.notification.NotifyViaStream("task", io.StringIO())
+        notify.notification_template = "{reason}|{output}\n"
+        return notify
+
+    def test_on_iteration_of_captures_once(self):
+        notify = self.notifier()
+        streams = set()
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            for i in notify.on_iteration_of(range(4), after_every=2):
+                streams.add(id(sys.stdout))
+                print(i)
+
+        # the std streams are only replaced once for the whole loop
+        self.assertEqual(len(streams), 1)
+        # every notification contains the output since the previous one
+        self.assertEqual(
+            notify.stream.getvalue(),
+            "Iteration 2/4 done|0\n1\nIteration 4/4 done|2\n3\n",
+        )
+
+    def test_track_progress(self):
+        notify = self.notifier()
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            for i in notify.track_progress(range(20), interval=0.05):
+                time.sleep(0.01)
+
+        notifications = notify.stream.getvalue().splitlines()
+        progress = [line for line in notifications if "it/s, ETA" in line]
+        self.assertGreaterEqual(len(progress), 2)
+        self.assertRegex(progress[0], r"^\d+/20 \(\d+\.\d%\) iterations")
+        self.assertRegex(notifications[-1], r"^20 iterations done in 0:00:00, ")
+
+    def test_track_progress_without_length(self):
+        notify = self.notifier()
+        tracker = pytb.notification._ProgressTracker(None, 0.3)
+        tracker.count = 10
+        tracker.sample(tracker.start + 1)
+        self.assertEqual(tracker.describe(), "10 iterations, 10.00 it/s")
+
+        for _ in notify.track_progress(iter(range(3)), 10, capture_output=False):
+            pass
+        self.assertRegex(
+            notify.stream.getvalue(),
+            r"^3 iterations done in .*\|<output capturing disabled>\n$",
+        )
+
+    def test_stop_tracking_on_break(self):
+        notify = self.notifier()
+        stdout = sys.stdout
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            progress = notify.track_progress(range(10), 0.01)
+            for i in progress:
+                break
+            progress.close()
+            stdout_after_loop = sys.stdout
+
+        self.assertIs(sys.stdout, stdout)
+        self.assertIsInstance(stdout_after_loop, io.StringIO)
+        time.sleep(0.03)
+        self.assertEqual(notify.stream.getvalue(), "")
+
+
+class TestEmailRendering(unittest.TestCase):
+    recipients = ["a@example.org", "b@example.org", "c@example.org"]
+
+    def test_single_transaction_for_all_recipients(self):
+        with SMTPSink() as sink:
+            email_notifier(sink.port, email_addresses=self.recipients).now("update")
+
+        self.assertEqual(sink.commands.count("DATA"), 1)
+        self.assertEqual(sink.commands.count("RCPT"), 3)
+        self.assertIn(
+            "To: a@example.org, b@example.org, c@example.org", sink.messages[0]
+        )
+
+    def test_bcc_hides_recipients(self):
+        with SMTPSink() as sink:
+            notify = email_notifier(
+                sink.port, email_addresses=self.recipients, bcc=True
+            )
+            notify.now("update")
+
+        self.assertEqual(sink.commands.count("RCPT"), 3)
+        self.assertNotIn("example.org", sink.messages[0])
+        self.assertIn("Hello undisclosed-recipients", sink.messages[0])
+
+    def test_attach_compressed_output(self):
+        buffer = pytb.io.CaptureBuffer(head_size=100, tail_size=100, spill=True)
+        lines = [f"line {i}\n" for i in range(1000)]
+        for line in lines:
+            buffer.write(line)
+        snapshot = buffer.snapshot()
+        buffer.close()
+
+        with SMTPSink() as sink:
+            notify = email_notifier(sink.port, email_addresses=self.recipients)
+            notify.attach_output = True
+            notify.attachment_threshold = 1000
+            notify.inline_head_size = 14
+            notify.inline_tail_size = 9
+            notify._send_notification("task", "done", None, snapshot)
+
+        message = email.message_from_string(
+            sink.messages[0], policy=email.policy.default
+        )
+        body = message.get_body().get_content().replace("\r\n", "\n")
+        omitted = len("".join(lines)) - 23
+        self.assertIn(
+            f"line 0\nline 1\n\n<{omitted} characters omitted, see attachment>\nline 999",
+            body,
+        )
+
+        attachment = next(message.iter_attachments())
+        self.assertEqual(attachment.get_filename(), "task-output.txt.gz")
+        self.assertEqual(
+            gzip.decompress(attachment.get_content()).decode(), "".join(lines)
+        )
+
+    def test_attachment_is_cut_off(self):
+        output = os.urandom(100000).hex()
+        with SMTPSink() as sink:
+            notify = email_notifier(sink.port, email_addresses=self.recipients)
+            notify.attach_output = True
+            notify.attachment_threshold = 1000
+            notify.attachment_max_size = 1000
+            notify._send_notification("task", "done", None, output)
+
+        message = email.message_from_string(
+            sink.messages[0], policy=email.policy.default
+        )
+        self.assertIn(
+            "truncated after 65536 characters", message.get_body().get_content()
+        )
+        attachment = next(message.iter_attachments())
+        self.assertEqual(
+            gzip.decompress(attachment.get_content()).decode(), output[:65536]
+        )
+
+    def test_short_output_is_not_attached(self):
+        with SMTPSink() as sink:
+            notify = email_notifier(sink.port, email_addresses=self.recipients)
+            notify.attach_output = True
+            notify._send_notification("task", "done", None, "short output")
+
+        message = email.message_from_string(
+            sink.messages[0], policy=email.policy.default
+        )
+        self.assertEqual(list(message.iter_attachments()), [])
+        self.assertIn("short output", message.get_body().get_content())
+
+    def test_code_fragment_is_memoized(self):
+        pytb.notification._cached_code_fragment.cache_clear()
+        frame = (lambda: sys._getframe())()
+        with unittest.mock.patch(
+            "linecache.getlines", wraps=linecache.getlines
+        ) as getlines:
+            first = pytb.notification._get_caller_code_fragment(frame)
+            second = pytb.notification._get_caller_code_fragment(frame)
+
+        self.assertEqual(first, second)
+        self.assertIn("---> ", first)
+        self.assertEqual(getlines.call_count, 1)
+
+    def test_code_fragment_cache_notices_changes(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "fragment.py")
+            frames = []
+            for version in (1, 2):
+                with open(path, "w") as source:
+                    source.write(
+                        f"version = {version}\nframes.append(sys._getframe())\n"
+                    )
+                # make sure the modification time changes
+                os.utime(path, ns=(version * 10**9, version * 10**9))
+                with open(path) as source:
+                    exec(compile(source.read(), path, "exec"))
+
+                self.assertIn(
+                    f"version = {version}",
+                    pytb.notification._get_caller_code_fragment(frames[-1]),
+                )
+
+
+class TestNotificationOutbox(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "outbox.db")
+
+    def tearDown(self):
+        pytb.notification.NotificationOutbox.close_shared()
+        self.directory.cleanup()
+
+    def test_retry_with_backoff(self):
+        attempts = []
+
+        def flaky(message):
+            attempts.append(time.monotonic())
+            if len(attempts) < 3:
+                raise ConnectionRefusedError()
+
+        outbox = pytb.notification.NotificationOutbox(
+            self.path, "test", flaky, backoff=0.05
+        )
+        outbox.put(b"message")
+        time.sleep(0.4)
+        outbox.close(5)
+
+        self.assertEqual(len(attempts), 3)
+        # the delay is doubled with each retry
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.1)
+        self.assertEqual(outbox.delivered, 1)
+
+    def test_messages_survive_the_process(self):
+        def unreachable(message):
+            raise ConnectionRefusedError()
+
+        outbox = pytb.notification.NotificationOutbox(
+            self.path, "test", unreachable, backoff=60
+        )
+        outbox.put(b"first")
+        outbox.put(b"second")
+        self.assertTrue(outbox.flush(5))
+        self.assertEqual(outbox.pending, 2)
+        outbox.close(0)
+
+        delivered = []
+        other_channel = pytb.notification.NotificationOutbox(
+            self.path, "other", delivered.append
+        )
+        other_channel.close(5)
+        self.assertEqual(delivered, [])
+
+        # the retry is due in a minute, pretend it is already due
+        with sqlite3.connect(self.path) as database:
+            database.execute("UPDATE outbox SET next_attempt = 0")
+        database.close()
+
+        outbox = pytb.notification.NotificationOutbox(
+            self.path, "test", delivered.append
+        )
+        self.assertTrue(outbox.flush(5))
+        outbox.close()
+        self.assertEqual(delivered, [b"first", b"second"])
+
+    def test_drop_after_max_attempts(self):
+        def unreachable(message):
+            raise ConnectionRefusedError()
+
+        outbox = pytb.notification.NotificationOutbox(
+            self.path, "test", unreachable, backoff=0.01, max_attempts=2
+        )
+        with self.assertLogs("pytb.notification", "ERROR"):
+            outbox.put(b"message")
+            time.sleep(0.2)
+        self.assertEqual(outbox.pending, 0)
+        outbox.close()
+
+    def test_email_via_outbox(self):
+        # a port nobody listens on yet
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            port = unused.getsockname()[1]
+
+        with unittest.mock.patch.dict(
+            pytb.config.get_config()["notify"], {"outbox_backoff": "0.05"}
+        ):
+            notify = email_notifier(
+                port,
+                email_addresses=["a@example.org", "b@example.org"],
+                bcc=True,
+                outbox=self.path,
+            )
+        outbox = notify.outbox
+
+        # the server is not available yet, the message is kept in the outbox
+        start = time.monotonic()
+        with self.assertLogs("pytb.notification", "WARNING"):
+            notify.now("update")
+            time.sleep(0.02)
+        self.assertLess(time.monotonic() - start, 0.5)
+        self.assertEqual(outbox.pending, 1)
+
+        # the shared outbox delivers without the notifier that stored the message
+        notifier_ref = weakref.ref(notify)
+        del notify
+        gc.collect()
+        self.assertIsNone(notifier_ref())
+
+        with SMTPSink(port=port) as sink:
+            time.sleep(0.2)
+            self.assertTrue(outbox.flush(5))
+
+        self.assertEqual(outbox.pending, 0)
+        self.assertEqual(sink.commands.count("RCPT"), 2)
+        self.assertNotIn("b@example.org", sink.messages[0])
+        self.assertIn("task on notify@example.com update", sink.messages[0])
+
+
+class TestNotifyViaWebhook(unittest.TestCase):
+    def notifier(self, sink, **kwargs):
+        return pytb.notification.NotifyViaWebhook(
+            "task", url=f"{sink.url}/hook?key=1", **kwargs
+        )
+
+    def test_batches_on_persistent_connection(self):
+        with HTTPSink() as sink:
+            notify = self.notifier(sink, batch_interval=0.2)
+            for i in range(3):
+                notify.now(f"update {i}")
+            self.assertTrue(notify.flush(5))
+
+            notify.now("update 3")
+            self.assertTrue(notify.flush(5))
+
+        self.assertEqual(sink.connections, 1)
+        self.assertEqual(notify.connections_opened, 1)
+        self.assertEqual(len(sink.requests), 2)
+
+        path, headers, payload = sink.requests[0]
+        self.assertEqual(path, "/hook?key=1")
+        self.assertEqual(headers["Content-Type"], "application/json")
+        self.assertEqual(
+            [notification["reason"] for notification in payload["notifications"]],
+            ["update 0", "update 1", "update 2"],
+        )
+        self.assertEqual(payload["notifications"][0]["task"], "task")
+        self.assertIn("notify.now", payload["notifications"][0]["code_block"])
+
+    def test_idle_notifier_is_not_kept_alive(self):
+        with HTTPSink() as sink:
+            notify = self.notifier(sink, batch_interval=0)
+            notify.worker_idle_timeout = 0.05
+            notify.now("update")
+            worker = notify._worker
+            self.assertTrue(notify.flush(5))
+            worker.join(5)
+            self.assertIsNone(notify._worker)
+
+            # a new worker is started for the next notification
+            notify.now("update")
+            worker = notify._worker
+            self.assertTrue(notify.flush(5))
+            worker.join(5)
+            self.assertEqual(len(sink.requests), 2)
+
+            notifier = weakref.ref(notify)
+            del notify, worker
+            gc.collect()
+            self.assertIsNone(notifier())
+
+    def test_retry_with_backoff(self):
+        with HTTPSink(failures=2) as sink:
+            notify = self.notifier(
+                sink,
+                headers={"Authorization": "Bearer token"},
+                batch_interval=0,
+                backoff=0.01,
+            )
+            with self.assertLogs("pytb.notification.NotifyViaWebhook", "WARNING"):
+                notify.now("update")
+                self.assertTrue(notify.flush(5))
+
+        self.assertEqual(len(sink.requests), 1)
+        self.assertEqual(sink.requests[0][1]["Authorization"], "Bearer token")
+
+    def test_give_up_after_retries(self):
+        with HTTPSink(failures=10) as sink:
+            notify = self.notifier(sink, batch_interval=0, max_retries=1, backoff=0)
+            with self.assertLogs("pytb.notification.NotifyViaWebhook", "ERROR"):
+                notify.now("update")
+                self.assertTrue(notify.flush(5))
+
+        self.assertEqual(sink.failures, 8)
+        self.assertEqual(sink.requests, [])
+
+    def test_invalid_url(self):
+        with self.assertRaises(ValueError):
+            pytb.notification.NotifyViaWebhook("task", url="ftp://example.com")
+
+
+class TestNotificationDaemon(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.directory.name, "notify.sock")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @contextlib.contextmanager
+    def daemon(self, **kwargs):
+        stream = io.StringIO()
+        notifier = pytb.notification.NotifyViaStream("daemon", stream, **kwargs)
+        notifier.notification_template = "{task}|{reason}|{exinfo}|{code_block}\n"
+        daemon = pytb.notification.NotificationDaemon(
+            notifier, socket_path=self.socket_path, dedupe_window=60
+        )
+        server = threading.Thread(target=daemon.serve_forever)
+        server.start()
+        try:
+            yield daemon, stream
+        finally:
+            daemon.close()
+            server.join()
+
+    def wait_for(self, daemon, count):
+        deadline = time.monotonic() + 5
+        while daemon.received < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_forward_and_dedupe(self):
+        with self.daemon() as (daemon, stream):
+            notify = pytb.notification.NotifyViaDaemon("task", self.socket_path)
+            for _ in range(2):
+                notify.now("update")
+            with self.assertRaises(RuntimeError):
+                with notify.when_done():
+                    raise RuntimeError("broken")
+            self.wait_for(daemon, 3)
+            notify.close()
+
+        notifications = stream.getvalue().splitlines()
+        self.assertEqual(daemon.duplicates, 1)
+        self.assertTrue(notifications[0].startswith("task|update||"))
+        self.assertIn("notify.now", stream.getvalue())
+        self.assertIn("task|failed|broken|", stream.getvalue())
+        self.assertFalse(os.path.exists(self.socket_path))
+
+    def test_digest_of_multiple_tasks(self):
+        with self.daemon(digest_window=10) as (daemon, stream):
+            for task in ("first", "second"):
+                notify = pytb.notification.NotifyViaDaemon(task, self.socket_path)
+                notify.now("done")
+                notify.close()
+            self.wait_for(daemon, 2)
+
+        # the pending digest is delivered when the daemon is closed
+        self.assertTrue(
+            stream.getvalue().startswith("2 tasks|digest of 2 notifications||")
+        )
+
+    def test_code_block_of_missing_or_changed_file(self):
+        script = os.path.join(self.directory.name, "script.py")
+        with open(script, "w") as script_file:
+            script_file.write("def task():\n    pass\n")
+
+        with self.daemon() as (daemon, stream):
+            sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            for task, filename in (
+                ("missing", os.path.join(self.directory.name, "missing.py")),
+                ("shortened", script),
+            ):
+                message = {
+                    "task": task,
+                    "reason": "done",
+                    "exinfo": None,
+                    "filename": filename,
+                    "lineno": 42,
+                    "output": "",
+                }
+                sender.sendto(json.dumps(message).encode(), self.socket_path)
+            sender.close()
+            self.wait_for(daemon, 2)
+
+        notifications = stream.getvalue()
+        self.assertIn("missing|done||\n", notifications)
+        self.assertRegex(notifications, r"shortened\|done\|\|.*: def task\(\):")
+
+    def test_send_without_daemon(self):
+        notify = pytb.notification.NotifyViaDaemon("task", self.socket_path)
+        with unittest.mock.patch("socket.socket") as socket_class:
+            datagram_socket = socket_class.return_value
+            datagram_socket.sendto.side_effect = FileNotFoundError()
+            with self.assertLogs("pytb.notification.NotifyViaDaemon", "WARNING"):
+                notify.now("update")
+            notify.close()
+
+        # a single datagram with a timeout, no connection that could block
+        datagram_socket.settimeout.assert_called_once_with(notify.send_timeout)
+        datagram_socket.sendto.assert_called_once()
+        datagram_socket.connect.assert_not_called()
+
+    def test_single_daemon_per_socket(self):
+        with self.daemon():
+            with self.assertRaises(RuntimeError):
+                pytb.notification.NotificationDaemon(
+                    pytb.notification.NotifyViaStream("task", io.StringIO()),
+                    socket_path=self.socket_path,
+                )
+
+        # a socket file left over by a crashed daemon is replaced
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        stale.bind(self.socket_path)
+        stale.close()
+        daemon = pytb.notification.NotificationDaemon(
+            pytb.notification.NotifyViaStream("task", io.StringIO()),
+            socket_path=self.socket_path,
+        )
+        daemon.close()
+
+
+class TestNotifyViaMultiple(unittest.TestCase):
+    def test_slow_backend_does_not_delay_others(self):
+        slow, fast = GatedNotifier(), SlowNotifier(0)
+        notify = pytb.notification.NotifyViaMultiple("task", [slow, fast], timeout=0.1)
+
+        with self.assertLogs("pytb.notification.NotifyViaMultiple", "WARNING"):
+            with pytb.io.redirected_stdstreams(io.StringIO()):
+                with notify.when_done():
+                    print("output")
+        # the block exited while the slow backend is still waiting for its gate
+        self.assertEqual(fast.stream.getvalue(), "done\n")
+        self.assertEqual(slow.stream.getvalue(), "")
+
+        # the slow backend still delivers in the background
+        slow.gate.set()
+        self.assertTrue(slow.delivered.wait(5))
+        self.assertEqual(slow.stream.getvalue(), "done\n")
+        self.assertIsNot(slow.sent_from[0], fast.sent_from[0])
+
+    def test_busy_backend_keeps_latest_notification(self):
+        slow = GatedNotifier()
+        notify = pytb.notification.NotifyViaMultiple("task", [slow], timeout=0.01)
+
+        with self.assertLogs("pytb.notification", "WARNING") as logs:
+            for i in range(3):
+                notify.now(f"update {i}")
+        self.assertIn("dropped the notification 'task update 1'", "".join(logs.output))
+
+        slow.gate.set()
+        deadline = time.monotonic() + 5
+        while slow.stream.getvalue().count("\n") < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(slow.stream.getvalue(), "update 0\nupdate 2\n")
+
+    def test_output_captured_once(self):
+        streams = [io.StringIO(), io.StringIO()]
+        children = [
+            pytb.notification.NotifyViaStream("task", stream) for stream in streams
+        ]
+        for child in children:
+            child.notification_template = "{reason}: {output}\n"
+        notify = pytb.notification.NotifyViaMultiple("task", children)
+
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            with notify.when_done():
+                print("output")
+
+        self.assertEqual(
+            [stream.getvalue() for stream in streams], ["done: output\n"] * 2
+        )
+
+    def test_broken_backend(self):
+        broken = pytb.notification.NotifyViaStream("task", None)
+        working = SlowNotifier(0)
+        notify = pytb.notification.NotifyViaMultiple("task", [broken, working])
+
+        with self.assertLogs("pytb.notification.NotifyViaMultiple", "ERROR"):
+            notify.now("update")
+        self.assertEqual(working.stream.getvalue(), "update\n")
+
+
+@unittest.skipUnless(os.path.exists("/proc/self/stat"), "requires /proc")
+class TestResourceMonitor(unittest.TestCase):
+    def test_fixed_memory(self):
+        monitor = pytb.notification.ResourceMonitor(capacity=5)
+        sizes = {len(series.values) for series in monitor.series.values()}
+        for _ in range(20):
+            monitor.sample()
+
+        self.assertEqual(sizes, {5})
+        self.assertEqual(
+            {len(series.values) for series in monitor.series.values()}, {5}
+        )
+        self.assertEqual(len(monitor.series["rss"]), 5)
+        self.assertGreater(min(monitor.series["rss"]), 0)
+        self.assertGreaterEqual(min(monitor.series["threads"]), 1)
+        self.assertGreaterEqual(min(monitor.series["fds"]), 3)
+
+    def test_sampling_overhead(self):
+        monitor = pytb.notification.ResourceMonitor()
+        for _ in range(100):
+            monitor.sample()
+
+        self.assertEqual(len(monitor.series["rss"]), 100)
+        self.assertGreater(monitor.sampling_time, 0)
+        self.assertGreater(monitor.overhead, 0)
+        self.assertLessEqual(monitor.overhead, 1)
+
+    def test_summary(self):
+        monitor = pytb.notification.ResourceMonitor()
+        for _ in range(3):
+            monitor.sample()
+        summary = monitor.summary().splitlines()
+
+        self.assertTrue(summary[0].startswith("resource usage (3 samples"))
+        self.assertEqual(
+            [line.split()[0] for line in summary[1:]],
+            ["cpu", "rss", "io", "io", "fds", "threads"],
+        )
+
+    def test_every_with_telemetry(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream)
+        notify.notification_template = "{reason}: {output}\n"
+        notify.render_outputs = False
+
+        with pytb.io.redirected_stdstreams(io.StringIO()):
+            with notify.every(0.1, telemetry=True):
+                time.sleep(0.15)
+
+        self.assertIn("progress update: resource usage (", stream.getvalue())
+        self.assertIn("done: ", stream.getvalue())
+
+
+class TestTimerService(unittest.TestCase):
+    def test_callbacks_run_in_deadline_order(self):
+        service = pytb.notification.TimerService.instance()
+        calls = []
+        done = threading.Event()
+        service.call_later(0.06, done.set)
+        for delay in (0.04, 0.01, 0.03, 0.02):
+            service.call_later(delay, calls.append, delay)
+
+        self.assertTrue(done.wait(1))
+        self.assertEqual(calls, [0.01, 0.02, 0.03, 0.04])
+
+    def test_cancel(self):
+        service = pytb.notification.TimerService.instance()
+        calls = []
+        handle = service.call_every(0.01, calls.append, "tick")
+        time.sleep(0.055)
+        handle.cancel()
+        count = len(calls)
+        time.sleep(0.05)
+
+        self.assertGreaterEqual(count, 3)
+        self.assertEqual(len(calls), count)
+
+    def test_many_contexts_share_one_thread(self):
+        stream = io.StringIO()
+        notify = pytb.notification.NotifyViaStream("task", stream)
+        notify.notification_template = "{reason}\n"
+
+        pytb.notification.TimerService.instance()
+        threads_before = threading.active_count()
+        with contextlib.ExitStack() as contexts:
+            contexts.enter_context(pytb.io.redirected_stdstreams(io.StringIO()))
+            for _ in range(200):
+                contexts.enter_context(notify.every(0.05))
+            self.assertEqual(threading.active_count(), threads_before)
+            time.sleep(0.08)
+
+        # notifications of timer callbacks are sent by the dispatcher
+        self.assertTrue(pytb.notification.NotificationDispatcher.instance().flush(5))
+        self.assertGreaterEqual(stream.getvalue().count("progress update"), 200)
+        self.assertEqual(stream.getvalue().count("done"), 200)
+
+    def test_notifications_do_not_block_the_timer_thread(self):
+        gate = threading.Event()
+        stream = io.StringIO()
+
+        class SlowNotify(pytb.notification.NotifyViaStream):
+            def _send_notification(self, *args, **kwargs):
+                gate.wait(5)
+                super()._send_notification(*args, **kwargs)
+
+        notify = SlowNotify("task", stream)
+        notify.notification_template = "{reason}\n"
+        service = pytb.notification.TimerService.instance()
+        ran = threading.Event()
+        service.call_later(0, notify.now, "slow")
+        service.call_later(0.01, ran.set)
+
+        # the second callback runs while the notification is still being sent
+        self.assertTrue(ran.wait(2))
+        self.assertEqual(stream.getvalue(), "")
+        gate.set()
+        self.assertTrue(pytb.notification.NotificationDispatcher.instance().flush(5))
+        self.assertEqual(stream.getvalue(), "slow\n")
+
+
+class TestSMTPConnectionPool(unittest.TestCase):
+    def send_notifications(self, notify, count):
+        for i in range(count):
+            notify.now(f"update {i}")
+
+    def test_pooled_session_reuses_connection(self):
+        with SMTPSink() as sink:
+            self.send_notifications(email_notifier(sink.port), 10)
+            self.assertEqual(sink.connections, 10)
+
+        with SMTPSink() as sink:
+            notify = email_notifier(sink.port, persistent_connection=True)
+            self.send_notifications(notify, 10)
+            notify.connection_pool.close()
+
+            self.assertEqual(sink.connections, 1)
+            self.assertEqual(len(sink.messages), 10)
+
+    def test_reconnect_after_server_disconnect(self):
+        with SMTPSink(messages_per_connection=1) as sink:
+            notify = email_notifier(sink.port, persistent_connection=True)
+            self.send_notifications(notify, 3)
+            notify.connection_pool.close()
+
+            self.assertEqual(len(sink.messages), 3)
+            self.assertEqual(sink.connections, 3)
+
+    def test_keepalive_and_idle_close(self):
+        with SMTPSink() as sink:
+            pool = pytb.notification.SMTPConnectionPool(
+                smtplib.SMTP, "127.0.0.1", sink.port, keepalive=0.05, max_idle=0.3
+            )
+            notify = email_notifier(sink.port)
+            message = notify._create_message(["recipient"], "task", "done", None, "")
+            pool.send_messages([message])
+
+            time.sleep(0.15)
+            self.assertIn("NOOP", sink.commands)
+
+            time.sleep(0.3)
+            self.assertIn("QUIT", sink.commands)
+            pool.close()
+
+    def test_keepalive_does_not_wait_for_sends(self):
+        smtp_class = unittest.mock.MagicMock()
+        pool = pytb.notification.SMTPConnectionPool(
+            smtp_class, "127.0.0.1", 25, keepalive=3600
+        )
+        pool.send_messages([email.message.EmailMessage()])
+        # send a NOOP with each check, the timer itself does not fire in this test
+        pool.keepalive = 0
+
+        sending = threading.Event()
+        release = threading.Event()
+
+        def send():
+            with pool._lock:
+                sending.set()
+                release.wait(5)
+
+        sender = threading.Thread(target=send)
+        sender.start()
+        sending.wait(5)
+        pool._keep_alive()
+        release.set()
+        sender.join()
+        smtp_class.return_value.noop.assert_not_called()
+
+        pool._keep_alive()
+        smtp_class.return_value.noop.assert_called_once_with()
+        pool.close()
+
+    def test_sessions_are_opened_with_timeout(self):
+        # smtplibs default timeout is a sentinel of the socket module, pass it
+        # explicitly so a reloaded socket module can not break the pool
+        smtp_class = unittest.mock.MagicMock()
+        pool = pytb.notification.SMTPConnectionPool(
+            smtp_class, "127.0.0.1", 25, timeout=5
+        )
+        pool.send_messages([email.message.EmailMessage()])
+        pool.close()
+        smtp_class.assert_called_once_with("127.0.0.1", 25, timeout=5)
+
 
 suite = unittest.TestSuite()
 suite.addTest(doctest.DocTestSuite(pytb.notification))
@@ -0,0 +1,65 @@
+import unittest
+
+import os
+import sys
+import subprocess
+
+
+def import_times(*args):
+    """
+    Run python with ``-X importtime`` and the arguments ``args`` and return
+    a mapping of all imported modules to their cumulative import time in seconds
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        # run in the root of the repository, where pytb is importable
+        cwd=os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+class TestImportTime(unittest.TestCase):
+    # generous budgets, a regression that imports IPython or nbformat
+    # at import time takes longer than 100ms on its own
+    package_budget = 0.1
+    heavy_modules = ["IPython", "nbformat", "pytb.notification", "pytb.rdb", "pdb"]
+
+    def assertNotImported(self, times, modules):
+        self.assertEqual([module for module in modules if module in times], [])
+
+    def test_import_package(self):
+        times = import_times("-c", "import pytb, pytb.core, pytb.importlib")
+
+        self.assertNotImported(times, self.heavy_modules)
+        self.assertLess(times["pytb.core"], self.package_budget)
+        self.assertLess(times["pytb.importlib"], self.package_budget)
+
+    def test_submodules_are_loaded_on_access(self):
+        times = import_times(
+            "-c",
+            "import sys, pytb; "
+            "assert 'pytb.io' not in sys.modules; "
+            "assert pytb.io is sys.modules['pytb.io']",
+        )
+        self.assertNotImported(times, self.heavy_modules)
+
+    def test_cli_subcommands_only_import_their_subsystem(self):
+        for command in [
+            ["rdb", "client", "--help"],
+            ["schedule", "--help"],
+            ["replay", "--help"],
+        ]:
+            with self.subTest(command=command):
+                times = import_times("-m", "pytb", *command)
+                self.assertNotImported(times, self.heavy_modules)
+                self.assertLess(times["pytb.config"], self.package_budget)